@@ -1,32 +1,37 @@
 import time
 import uuid
+import csv
 import requests
 import json
 import os
 import tempfile
 import io
 import struct
+import mmap
+import hashlib
 import google_auth_oauthlib.flow
 import google.auth.exceptions
 import re
 import logging
 import traceback
 import shutil
-import sqlite3
+import threading
+import queue
 import database
 from logging.handlers import RotatingFileHandler
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-from flask import Flask, render_template, request, redirect, jsonify, url_for, flash, redirect, session, g, Response
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, redirect, jsonify, url_for, flash, redirect, session, g, Response, stream_with_context
 from flask_wtf.csrf import CSRFProtect, CSRFError
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from markupsafe import Markup, escape
 from google.auth.transport.requests import Request
+from requests.adapters import HTTPAdapter
 from math import radians, cos, sin, sqrt, atan2
 from google.oauth2.credentials import Credentials
 from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 
@@ -54,7 +59,7 @@ GITHUB_RELEASES_URL = f"https://github.com/{GITHUB_REPO}/releases"
 UPDATE_INSTRUCTIONS_URL = f"https://github.com/{GITHUB_REPO}/wiki/Updating"
 
 # Cache for the latest-release lookup so we don't hit the GitHub API (60 req/hr
-# unauthenticated) on every home page load. Same pattern as _filenames_cache.
+# unauthenticated) on every home page load.
 _release_cache = None          # dict result of check_for_update(), or None
 _release_cache_time = 0        # epoch seconds of last successful fetch
 _RELEASE_CACHE_TTL = 6 * 60 * 60   # 6 hours
@@ -157,7 +162,10 @@ def get_default_config():
         "uploads": {
             "directory": "userdata/uploads",
             "allowed_extensions": ["jpg", "jpeg"],
-            "max_file_size": 67108864
+            "max_file_size": 67108864,
+            "queue_workers": 4,
+            "api_requests_per_minute": 60,
+            "max_job_files": 1000
         },
         "api": {
             "places": {
@@ -168,7 +176,20 @@ def get_default_config():
                 "default_page_size": 10,
                 "table_page_size": 100,
                 "max_nearby_photos": 50
+            },
+            "http": {
+                "pool_maxsize": 4,
+                "connect_timeout": 10,
+                "read_timeout": 30,
+                "transfer_timeout": 120,
+                "upload_chunk_size": 8388608,
+                "upload_max_retries": 5
             }
+        },
+        "database": {
+            "cache_size_kb": 16384,
+            "mmap_size": 268435456,
+            "busy_timeout_ms": 5000
         }
     }
 
@@ -260,6 +281,11 @@ class APIError(StreetViewError):
         self.response = response
         super().__init__(message)
 
+class TransientUploadError(APIError):
+    """Raised when an upload chunk fails for a reason worth resuming after
+    (Google 5xx or 429); the upload continues from the acknowledged offset."""
+    pass
+
 class AuthenticationError(StreetViewError):
     """Handles authentication and authorization errors"""
     pass
@@ -344,8 +370,166 @@ def log_error(error_type, error):
         app.logger.error(f'Response: {error.response}')
     app.logger.error(f'Stack trace: {traceback.format_exc()}')
 
+# Shared HTTP client
+class APIClient:
+    """Shared keep-alive HTTP client for the Street View Publish and Places APIs.
+
+    A single requests.Session is shared by every request thread. Its urllib3
+    connection pools are thread-safe, so TCP+TLS connections are reused across
+    calls instead of paying a fresh handshake each time. Each host gets its own
+    pool, sized to the gunicorn thread count so concurrent requests never have
+    to open throwaway connections.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=4, connect_timeout=10,
+                 read_timeout=30, transfer_timeout=120, upload_chunk_size=8 * 1024 * 1024,
+                 upload_max_retries=5):
+        self._lock = threading.Lock()
+        self._session = None
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.transfer_timeout = transfer_timeout
+        self.upload_chunk_size = upload_chunk_size
+        self.upload_max_retries = upload_max_retries
+
+    def configure(self, settings):
+        """Apply settings from config['api']['http']; rebuilds the pools on next use."""
+        with self._lock:
+            for key in ('pool_connections', 'pool_maxsize', 'connect_timeout',
+                        'read_timeout', 'transfer_timeout', 'upload_chunk_size',
+                        'upload_max_retries'):
+                if settings.get(key) is not None:
+                    setattr(self, key, settings[key])
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    @property
+    def session(self):
+        session = self._session
+        if session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+                session = self._session
+        return session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Send a request through the shared pools.
+
+        timeout may be None (configured connect/read timeouts), a number (read
+        timeout, keeping the configured connect timeout) or a requests-style
+        (connect, read) tuple.
+        """
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif isinstance(timeout, (int, float)):
+            timeout = (self.connect_timeout, timeout)
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
 
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
 
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+api_client = APIClient()
+
+class ApiRateLimiter:
+    """Token bucket allowing per_minute API calls, in bursts of up to burst.
+
+    acquire() reserves the next call slot and sleeps until it comes round, so
+    callers on any number of threads are spread out evenly.
+    """
+
+    def __init__(self, per_minute, burst=1):
+        self._lock = threading.Lock()
+        self.interval = 60.0 / per_minute
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """Wait for a call slot; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens * self.interval if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+class UploadQueue:
+    """Bounded worker pool for server-side batch uploads.
+
+    Files handed over to an upload job run start_upload -> upload_photo ->
+    create_photo on queue_workers threads, so a batch is limited by upload
+    bandwidth rather than per-photo round trips, and carries on after the
+    browser tab closes. The Street View Publish calls of each account, including
+    every resumable-upload chunk request, share one ApiRateLimiter of
+    api_requests_per_minute.
+    """
+
+    def __init__(self, queue_workers=4, api_requests_per_minute=60):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._limiters = {}
+        self.queue_workers = queue_workers
+        self.api_requests_per_minute = api_requests_per_minute
+
+    def configure(self, settings):
+        """Apply settings from config['uploads']; a running pool finishes its queue first."""
+        with self._lock:
+            for key in ('queue_workers', 'api_requests_per_minute'):
+                if settings.get(key) is not None:
+                    setattr(self, key, settings[key])
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self._limiters = {}
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.queue_workers,
+                                                    thread_name_prefix='upload-worker')
+            return self._executor.submit(fn, *args)
+
+    def rate_limiter(self, credentials):
+        """The limiter for the account behind credentials (keyed by its OAuth grant)."""
+        key = credentials.refresh_token or credentials.token
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = ApiRateLimiter(self.api_requests_per_minute,
+                                                               burst=self.queue_workers)
+            return limiter
+
+upload_queue = UploadQueue()
 
 
 
@@ -465,6 +649,9 @@ def format_capture_time(capture_time):
         return "N/A"
 
 CREDS_FILE = 'userdata/creds.data'
+# Serialises token refreshes: upload queue workers call get_credentials()
+# concurrently, and only one of them should hit Google and rewrite creds.data.
+_credentials_lock = threading.Lock()
 
 def _delete_credentials_file(reason=""):
     """Remove the stored credentials file, tolerating a concurrent removal."""
@@ -478,10 +665,20 @@ def _delete_credentials_file(reason=""):
 
 
 def save_credentials(credentials):
+    """Write creds.data atomically so a concurrent reader never sees a partial file."""
     app.logger.debug(f"=== FUNCTION APP: save_credentials ===")
-    with open(CREDS_FILE, 'w') as f:
-        f.write(credentials.to_json())
-    os.chmod(CREDS_FILE, 0o600)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(CREDS_FILE) or '.', prefix='.creds-', suffix='.tmp')
+    try:
+        os.chmod(tmp_path, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(credentials.to_json())
+        os.replace(tmp_path, CREDS_FILE)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 def refresh_credentials(credentials):
@@ -540,12 +737,24 @@ def get_credentials(raise_transient=False):
         return credentials
 
     if credentials and credentials.expired and credentials.refresh_token:
-        try:
-            return refresh_credentials(credentials)
-        except TransientAuthError:
-            if raise_transient:
-                raise
-            return None
+        with _credentials_lock:
+            # Another thread may have refreshed while we waited for the lock.
+            try:
+                current = Credentials.from_authorized_user_file(CREDS_FILE, [STREETVIEW_SCOPE])
+            except (OSError, ValueError, json.JSONDecodeError):
+                current = None
+            if current is None:
+                app.logger.debug("get_credentials: credentials removed while waiting to refresh")
+                return None
+            if current.valid:
+                app.logger.debug("get_credentials: token already refreshed by another thread")
+                return current
+            try:
+                return refresh_credentials(current)
+            except TransientAuthError:
+                if raise_transient:
+                    raise
+                return None
 
     # No usable refresh token — permanent, clean up so the UI prompts a fresh login.
     app.logger.warning("get_credentials: stored credentials invalid and not refreshable, deleting")
@@ -602,28 +811,36 @@ def preview_photo_serve(token):
     resp.headers['Cache-Control'] = 'no-store'
     return resp
 
-def _extract_xmp_segments(jpeg_bytes):
-    """Return raw XMP APP1 segment bytes found in the JPEG."""
-    xmp_segments = []
-    if len(jpeg_bytes) < 4 or jpeg_bytes[:2] != b'\xff\xd8':
-        return xmp_segments
+XMP_NAMESPACE = b'http://ns.adobe.com/xap/1.0/\x00'
+
+def _iter_jpeg_segments(data):
+    """Yield (start, marker, end) of each JPEG header segment before the scan data.
+
+    data may be bytes or an mmap; only the marker and length bytes are read.
+    """
+    if len(data) < 4 or data[:2] != b'\xff\xd8':
+        return
     i = 2
-    while i + 3 < len(jpeg_bytes):
-        if jpeg_bytes[i] != 0xFF:
+    while i + 3 < len(data):
+        if data[i] != 0xFF:
             break
-        marker = jpeg_bytes[i + 1]
+        marker = data[i + 1]
         if marker == 0xDA:  # SOS — scan data starts, stop here
             break
         if marker in (0xD8, 0xD9):
             i += 2
             continue
-        length = struct.unpack('>H', jpeg_bytes[i + 2:i + 4])[0]
-        if marker == 0xE1:
-            seg_data = jpeg_bytes[i + 4:i + 2 + length]
-            if seg_data.startswith(b'http://ns.adobe.com/xap/1.0/\x00'):
-                xmp_segments.append(jpeg_bytes[i:i + 2 + length])
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        yield i, marker, i + 2 + length
         i += 2 + length
-    return xmp_segments
+
+def _is_xmp_segment(data, start, marker):
+    return marker == 0xE1 and data[start + 4:start + 4 + len(XMP_NAMESPACE)] == XMP_NAMESPACE
+
+def _extract_xmp_segments(jpeg_bytes):
+    """Return raw XMP APP1 segment bytes found in the JPEG."""
+    return [jpeg_bytes[start:end] for start, marker, end in _iter_jpeg_segments(jpeg_bytes)
+            if _is_xmp_segment(jpeg_bytes, start, marker)]
 
 
 def _inject_after_soi(jpeg_bytes, segments):
@@ -792,10 +1009,10 @@ def photo_highres(photo_id):
         if not download_url:
             return jsonify({'error': 'No high-resolution image available for this photo'}), 404
 
-        img_resp = requests.get(
+        img_resp = api_client.get(
             download_url,
             headers={"Authorization": f"Bearer {credentials.token}"},
-            timeout=120,
+            timeout=api_client.transfer_timeout,
         )
         if img_resp.status_code != 200:
             app.logger.error(f"High-res download failed ({img_resp.status_code}) for {photo_id}")
@@ -872,6 +1089,16 @@ def index():
         stats['total_views_display'] = str(total_views)
     return render_template('index.html', stats=stats)
 
+@app.route('/api/db_stats')
+def api_db_stats():
+    """JSON statistics block, polled by the UI while the database changes."""
+    if not database.photo_database_created():
+        return jsonify({'stats': None})
+    stats = database.get_db_stats()
+    if 'error' in stats:
+        return jsonify({'error': stats['error']}), 500
+    return jsonify({'stats': stats})
+
 @app.route('/favicon.ico')
 def favicon():
     return app.send_static_file('icons8-menu-96-favicon.png')
@@ -1017,7 +1244,7 @@ def list_photos_page():
     response = list_photos(credentials.token, page_size=int(page_size), page_token=page_token)
     photos_list = response.get("photos", [])
 
-    photoId_to_filename = get_filenames(config['uploads']['directory'])
+    photoId_to_filename = get_upload_filenames([photo['photoId']['id'] for photo in photos_list])
 
     for photo in photos_list:
         photo['captureTime'] = format_capture_time(photo['captureTime'])
@@ -1052,13 +1279,32 @@ def photos_page():
 @token_required
 def get_photos_for_map():
     app.logger.debug(f"=== FUNCTION APP: get_photos_for_map ===")
-    """Return all photos with GPS coordinates for map display"""
+    """
+    Return photos with GPS coordinates for map display.
+
+    With zoom (and optionally bbox=min_lng,min_lat,max_lng,max_lat for the
+    viewport) the response holds grid clusters, or individual photos above
+    database.MAP_CLUSTER_MAX_ZOOM; without zoom every photo is returned.
+    """
     try:
         
-        # Check if database exists
-        if not os.path.exists(database.DATABASE_PATH):
+        # Check if the photo database has been created by a sync
+        if not database.photo_database_created():
             return jsonify({"error": "Database not found"}), 404
         
+        if request.args.get('zoom') is not None:
+            try:
+                zoom = min(int(request.args['zoom']), 30)
+                bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+            except ValueError as e:
+                return jsonify({"error": f"Invalid map query: {e}"}), 400
+            result = database.get_map_clusters(zoom, bbox)
+            if result is None:
+                return jsonify({"error": "Failed to fetch photos"}), 500
+            result['zoom'] = zoom
+            result['max_cluster_zoom'] = database.MAP_CLUSTER_MAX_ZOOM
+            return jsonify(result)
+        
         # Get all photos with GPS coordinates using the database function
         photos_data = database.get_all_photos_with_gps()
         
@@ -1071,6 +1317,170 @@ def get_photos_for_map():
         app.logger.error(f"Error fetching photos for map: {str(e)}")
         return jsonify({"error": "Failed to fetch photos"}), 500
 
+# Tile format -> response content type
+TILE_CONTENT_TYPES = {
+    'geojson': 'application/geo+json',
+    'mvt': 'application/vnd.mapbox-vector-tile',
+}
+
+@app.route('/api/photos/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+@app.route('/api/photos/tiles/<int:z>/<int:x>/<int:y>.<fmt>', methods=['GET'])
+@token_required
+@limiter.limit("600 per minute")
+def get_photo_tile(z, x, y, fmt='geojson'):
+    """
+    Serve the photos in one web-mercator tile as GeoJSON or a Mapbox Vector
+    Tile: clusters up to database.MAP_CLUSTER_MAX_ZOOM, photos above it
+    """
+    app.logger.debug(f"=== FUNCTION APP: get_photo_tile === {z}/{x}/{y}.{fmt}")
+    if fmt not in TILE_CONTENT_TYPES:
+        return jsonify({"error": f"Unknown tile format '{fmt}'"}), 404
+    if z > database.TILE_MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+        return jsonify({"error": "Tile out of range"}), 404
+    if not database.photo_database_created():
+        return jsonify({"error": "Database not found"}), 404
+
+    data = database.get_tile(z, x, y, fmt)
+    if data is None:
+        return jsonify({"error": "Failed to build tile"}), 500
+    response = Response(data, mimetype=TILE_CONTENT_TYPES[fmt])
+    # Tiles change with edits and syncs, so browsers revalidate via the ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+# Export format -> response content type
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'geojson': 'application/geo+json',
+    'kml': 'application/vnd.google-earth.kml+xml',
+}
+
+def _export_timestamp(value, end_of_day):
+    """Normalise a YYYY-MM-DD date or ISO timestamp to the stored UTC format"""
+    if len(value) == 10:
+        datetime.strptime(value, '%Y-%m-%d')
+        return f"{value}T23:59:59Z" if end_of_day else f"{value}T00:00:00Z"
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def parse_bbox(value):
+    """
+    Parse bbox=min_lng,min_lat,max_lng,max_lat (GeoJSON order; min_lng >
+    max_lng crosses the antimeridian) into the database's
+    (min_lat, max_lat, min_lng, max_lng) box.
+
+    Raises:
+        ValueError: If the box is malformed
+    """
+    min_lng, min_lat, max_lng, max_lat = (float(v) for v in value.split(','))
+    if not -90 <= min_lat <= max_lat <= 90 or not -180 <= min_lng <= 180 or not -180 <= max_lng <= 180:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat in degrees")
+    if min_lng > max_lng:
+        max_lng += 360
+    return min_lat, max_lat, min_lng, max_lng
+
+def parse_export_filters(args):
+    """
+    Build database filters from export query parameters.
+
+    Supports bbox=min_lng,min_lat,max_lng,max_lat (GeoJSON order; min_lng >
+    max_lng crosses the antimeridian), repeated status=, and
+    capture_from/capture_to/upload_from/upload_to as dates or ISO timestamps.
+
+    Raises:
+        ValueError: If a parameter is malformed
+    """
+    filters = {}
+    statuses = args.getlist('status')
+    if statuses:
+        filters['statuses'] = statuses
+    if args.get('bbox'):
+        filters['bbox'] = parse_bbox(args['bbox'])
+    for key in ('capture_from', 'capture_to', 'upload_from', 'upload_to'):
+        if args.get(key):
+            filters[key] = _export_timestamp(args[key], end_of_day=key.endswith('_to'))
+    return filters
+
+def _export_ndjson(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(photo, separators=(',', ':')) + '\n' for photo in batch)
+
+def _export_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(database.EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows([photo[column] for column in database.EXPORT_COLUMNS] for photo in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # header only: nothing matched
+
+def _export_geojson(batches):
+    yield '{"type":"FeatureCollection","features":['
+    separator = ''
+    for batch in batches:
+        features = []
+        for photo in batch:
+            properties = {k: v for k, v in photo.items() if k not in ('latitude', 'longitude')}
+            features.append(json.dumps({
+                'type': 'Feature',
+                'id': photo['photo_id'],
+                'geometry': {'type': 'Point', 'coordinates': [photo['longitude'], photo['latitude']]},
+                'properties': properties,
+            }, separators=(',', ':')))
+        yield separator + ','.join(features)
+        separator = ','
+    yield ']}\n'
+
+def _kml_placemark(photo):
+    data = ''.join(f'<Data name="{column}"><value>{escape(photo[column])}</value></Data>'
+                   for column in database.EXPORT_COLUMNS if photo[column] is not None)
+    return (f'<Placemark id="{escape(photo["photo_id"])}">'
+            f'<name>{escape(photo["place_names"] or photo["photo_id"])}</name>'
+            f'<ExtendedData>{data}</ExtendedData>'
+            f'<Point><coordinates>{photo["longitude"]},{photo["latitude"]}</coordinates></Point>'
+            f'</Placemark>\n')
+
+def _export_kml(batches):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>Street View photos</name>\n')
+    for batch in batches:
+        yield ''.join(_kml_placemark(photo) for photo in batch)
+    yield '</Document></kml>\n'
+
+EXPORT_WRITERS = {'ndjson': _export_ndjson, 'csv': _export_csv, 'geojson': _export_geojson, 'kml': _export_kml}
+
+@app.route('/export/photos.<fmt>', methods=['GET'])
+@token_required
+def export_photos(fmt):
+    """
+    Stream the photo database as NDJSON (API format, re-importable), CSV,
+    GeoJSON or KML. Rows go from a database cursor straight into the
+    response, so memory use does not grow with the export size.
+    """
+    app.logger.debug(f"=== FUNCTION APP: export_photos === format={fmt}")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format '{fmt}'"}), 404
+    if not database.photo_database_created():
+        return jsonify({"error": "Database not found"}), 404
+    try:
+        filters = parse_export_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid export filter: {e}"}), 400
+
+    batches = database.iter_export_photos(filters, api_format=fmt == 'ndjson',
+                                          require_gps=fmt in ('geojson', 'kml'))
+    filename = f"streetview_photos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(stream_with_context(EXPORT_WRITERS[fmt](batches)),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 # Keep the original route for backward compatibility
 @app.route('/list_photos_table', methods=['GET'])
 @token_required
@@ -1079,8 +1489,8 @@ def list_photos_table_page():
     """Display all photos from the database in a table format with pagination"""
     try:
         
-        # Check if database exists
-        if not os.path.exists(database.DATABASE_PATH):
+        # Check if the photo database has been created by a sync
+        if not database.photo_database_created():
             flash("Database not yet created. Please use the 'Create Database' button on the Photo Database page first.", "error")
             # Instead of redirecting, still render the photos template but with empty data
             return render_template(
@@ -1136,193 +1546,54 @@ def list_photos_table_page():
         except (ValueError, TypeError):
             per_page_int = 25
             
-        # Get database connection
-        conn = sqlite3.connect(database.DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Whitelist mapping for safe ORDER BY (prevents SQL injection even if validation is bypassed)
-        VALID_SORT_COLUMNS = {
-            'photo_id': 'p.photo_id',
-            'latitude': 'p.latitude',
-            'longitude': 'p.longitude',
-            'capture_time': 'p.capture_time',
-            'upload_time': 'p.upload_time',
-            'view_count': 'p.view_count',
-            'maps_publish_status': 'p.maps_publish_status',
-            'updated_at': 'p.updated_at',
-            'place_names': 'place_names',
-        }
-        VALID_SORT_ORDERS = {'asc': 'ASC', 'desc': 'DESC'}
+        # Whitelisted sort names (unknown values fall back to upload date)
+        sort_by_url = sort_by if sort_by in database.TABLE_SORT_COLUMNS else 'upload_time'
+        sort_order_url = sort_order if sort_order in ('asc', 'desc') else 'desc'
 
-        # Preserve URL-facing values for the template before converting to SQL names
-        sort_by_url = sort_by if sort_by in VALID_SORT_COLUMNS else 'upload_time'
-        sort_order_url = sort_order if sort_order in VALID_SORT_ORDERS else 'desc'
-
-        sort_by = VALID_SORT_COLUMNS.get(sort_by, 'p.upload_time')
-        sort_order = VALID_SORT_ORDERS.get(sort_order, 'DESC')
-        
-        # Fetch all unique maps_publish_status values for filtering
-        cursor.execute("SELECT DISTINCT maps_publish_status FROM photos WHERE maps_publish_status IS NOT NULL")
-        status_values = [row[0] for row in cursor.fetchall()]
-        
-        # Build base query
-        base_query = """
-        SELECT p.*, 
-               GROUP_CONCAT(DISTINCT COALESCE(pl.name, pl.place_id)) as place_names,
-               COUNT(DISTINCT c.target_photo_id) as connection_count
-        FROM photos p
-        LEFT JOIN places pl ON p.photo_id = pl.photo_id
-        LEFT JOIN connections c ON p.photo_id = c.source_photo_id
-        """
-        
-        # Add filter conditions
-        where_clauses = []
-        query_params = []
-        
-        # Status filter
+        # Build filters
+        filters = {}
         if status_filter and 'all' not in status_filter:
-            placeholders = ','.join(['?' for _ in status_filter])
-            where_clauses.append(f"p.maps_publish_status IN ({placeholders})")
-            query_params.extend(status_filter)
-        
-        # Places filter
+            filters['statuses'] = status_filter
         if places_filter:
             app.logger.info(f"Places filter applied with value: '{places_filter}'")
-            
-            # Execute a completely separate query when places filter is used
-            place_query = """
-            SELECT p.*,
-                   GROUP_CONCAT(DISTINCT COALESCE(places.name, places.place_id)) as place_names,
-                   COUNT(DISTINCT c.target_photo_id) as connection_count
-            FROM photos p
-            JOIN places ON p.photo_id = places.photo_id
-            LEFT JOIN connections c ON p.photo_id = c.source_photo_id
-            WHERE COALESCE(places.name, places.place_id) LIKE ? COLLATE NOCASE
-            GROUP BY p.photo_id
-            ORDER BY {} {}
-            """.format(sort_by, sort_order)
-            
-            search_param = f"%{places_filter}%"
-            app.logger.info(f"Place search query: {place_query}")
-            app.logger.info(f"Place search parameter: {search_param}")
-            
-            # Count total filtered records
-            count_query = """
-            SELECT COUNT(DISTINCT p.photo_id)
-            FROM photos p
-            JOIN places ON p.photo_id = places.photo_id
-            WHERE places.name LIKE ? COLLATE NOCASE
-            """
-            app.logger.info(f"Count query: {count_query}")
-            
-            cursor.execute(count_query, [search_param])
-            filtered_total_records = cursor.fetchone()[0]
-            # Store this value for the entire function
-            total_records = filtered_total_records
-            app.logger.info(f"DEBUG: Found {total_records} total records matching places filter '{places_filter}'")
-            
-            # Execute the query to get filtered photos - only after we've counted total records
-            cursor.execute(place_query, [search_param])
-            all_photos = [dict(row) for row in cursor.fetchall()]
-            app.logger.info(f"DEBUG: Retrieved {len(all_photos)} photos before pagination")
-            
-            # Calculate pagination
-            if per_page != 'all' and total_records > 0:
-                total_pages = (total_records + per_page_int - 1) // per_page_int
-                if page > total_pages:
-                    page = total_pages
-                
-                # Apply pagination to the results if needed
-                start_idx = (page - 1) * per_page_int
-                end_idx = start_idx + per_page_int
-                
-                photos_on_page = all_photos[start_idx:end_idx]
-                
-                # Explicitly set start and end indices for display
-                start_idx_display = start_idx + 1 if total_records > 0 else 0
-                end_idx_display = min(start_idx + len(photos_on_page), total_records)
-                
-                # Store these values in their own variables for the template
-                pagination_start = start_idx_display
-                pagination_end = end_idx_display
-                
-                app.logger.info(f"DEBUG: Pagination - page {page} of {total_pages}, showing records {pagination_start} to {pagination_end} of {total_records}")
-                app.logger.info(f"DEBUG: per_page={per_page}, per_page_int={per_page_int}, start_idx={start_idx}, end_idx={end_idx}")
-                app.logger.info(f"DEBUG: Sliced photos list from index {start_idx} to {end_idx}, got {len(photos_on_page)} results")
-                
-                photos = photos_on_page
-            else:
-                total_pages = 1 if total_records > 0 else 0
-                pagination_start = 1 if total_records > 0 else 0
-                pagination_end = total_records
-                photos = all_photos
-                
-                app.logger.info(f"DEBUG: No pagination - showing all {len(photos)} records")
-                
-            # Skip the rest of the query processing since we've handled everything here
-            query_executed = True
-            # IMPORTANT: Skip recounting and calculating total_records further down
-            skip_count = True
-            
-            # Print the variables that will be passed to the template
-            app.logger.info(f"DEBUG: Final values for template: pagination_start={pagination_start}, pagination_end={pagination_end}, total_records={total_records}")
-        else:
-            # Initialize for normal query flow
-            query_executed = False
-            pagination_start = None
-            pagination_end = None
-            skip_count = False
+            filters['places'] = places_filter
         
         # Capture date filter
         if capture_date_from:
-            where_clauses.append("p.capture_time >= ?")
-            query_params.append(f"{capture_date_from}-01T00:00:00Z")
+            filters['capture_from'] = f"{capture_date_from}-01T00:00:00Z"
             
         if capture_date_to:
             # Get the last day of the month for the end date
             year, month = map(int, capture_date_to.split('-'))
             last_day = (datetime(year, month % 12 + 1, 1) - timedelta(days=1)).day
-            where_clauses.append("p.capture_time <= ?")
-            query_params.append(f"{capture_date_to}-{last_day}T23:59:59Z")
+            filters['capture_to'] = f"{capture_date_to}-{last_day}T23:59:59Z"
         
         # Upload date filter
         if upload_date_from:
-            where_clauses.append("p.upload_time >= ?")
-            query_params.append(f"{upload_date_from}-01T00:00:00Z")
+            filters['upload_from'] = f"{upload_date_from}-01T00:00:00Z"
             
         if upload_date_to:
             # Get the last day of the month for the end date
             year, month = map(int, upload_date_to.split('-'))
             last_day = (datetime(year, month % 12 + 1, 1) - timedelta(days=1)).day
-            where_clauses.append("p.upload_time <= ?")
-            query_params.append(f"{upload_date_to}-{last_day}T23:59:59Z")
-        
-        # Complete the query
-        if where_clauses:
-            base_query += " WHERE " + " AND ".join(where_clauses)
-        
-        # Add grouping
-        base_query += " GROUP BY p.photo_id"
-        
-        # Count total filtered records
-        if not skip_count:
-            count_query = f"SELECT COUNT(*) FROM ({base_query})"
-            cursor.execute(count_query, query_params)
-            total_records = cursor.fetchone()[0]
-        
-        # Add sorting
-        base_query += f" ORDER BY {sort_by} {sort_order}"
-        
-        # Add pagination
-        if per_page != 'all':
-            offset = (page - 1) * per_page_int
-            base_query += f" LIMIT {per_page_int} OFFSET {offset}"
-        
-        # Execute final query
-        if not query_executed:
-            cursor.execute(base_query, query_params)
-            photos = [dict(row) for row in cursor.fetchall()]
+            filters['upload_to'] = f"{upload_date_to}-{last_day}T23:59:59Z"
+
+        # Remember the view so edit pages step through photos in this order
+        session['photos_view'] = {'sort_by': sort_by_url, 'sort_order': sort_order_url, 'filters': filters}
+
+        # Keyset pagination: Next/Prev links carry an opaque cursor for the
+        # neighbouring row, so deep pages cost the same as the first. A bare
+        # page number (bookmark or sort link) falls back to an offset.
+        limit = None if per_page == 'all' else per_page_int
+        result = database.get_photos_table_page(
+            sort_by_url, sort_order_url, filters, limit,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            last=request.args.get('last') == '1',
+            offset=(page - 1) * per_page_int if limit else 0
+        )
+        total_records = result['total_records']
+        status_values = result['status_values']
         
         # Calculate pagination
         total_pages = 1
@@ -1330,23 +1601,21 @@ def list_photos_table_page():
             total_pages = (total_records + per_page_int - 1) // per_page_int
             if page > total_pages:
                 page = total_pages
-        
-        # Get total counts for statistics (unfiltered)
-        cursor.execute("SELECT COUNT(*) FROM photos")
-        total_photos = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM places")
-        total_places = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM connections")
-        total_connections = cursor.fetchone()[0]
-        
-        # Get the last update time from the database
-        cursor.execute("SELECT MAX(updated_at) FROM photos")
-        last_updated_row = cursor.fetchone()
-        last_updated = last_updated_row[0] if last_updated_row[0] else "N/A"
-        
-        # Format the last_updated timestamp if it exists
+                result = database.get_photos_table_page(sort_by_url, sort_order_url, filters, limit, last=True)
+        if not result['photos'] and total_records > 0:
+            # Stale cursor (rows changed since the link was made): restart
+            page = 1
+            result = database.get_photos_table_page(sort_by_url, sort_order_url, filters, limit)
+        photos = result['photos']
+        if request.args.get('last') == '1':
+            page = total_pages
+
+        pagination_start = (page - 1) * per_page_int + 1 if photos and limit else (1 if photos else 0)
+        pagination_end = pagination_start + len(photos) - 1 if photos else 0
+
+        # Unfiltered totals (cached until the database changes)
+        stats = database.get_db_stats()
+        last_updated = stats.get('last_updated_at') or "N/A"
         if last_updated != "N/A":
             try:
                 # Convert ISO format string to datetime object
@@ -1356,20 +1625,20 @@ def list_photos_table_page():
             except (ValueError, AttributeError):
                 # If there's any error in parsing, just use the raw value
                 pass
-        
-        conn.close()
 
         return render_template(
             'photos.html', 
             photos=photos, 
-            total_photos=total_photos,
-            total_places=total_places,
-            total_connections=total_connections,
+            total_photos=stats.get('photo_count', 0),
+            total_places=stats.get('place_count', 0),
+            total_connections=stats.get('connection_count', 0),
             last_updated=last_updated,
             sort_by=sort_by_url,
             sort_order=sort_order_url,
             db_exists=True,
             page=page,
+            next_cursor=result['last_cursor'],
+            prev_cursor=result['first_cursor'],
             per_page=per_page,
             total_pages=total_pages,
             total_records=total_records,
@@ -1380,8 +1649,8 @@ def list_photos_table_page():
             capture_date_to=capture_date_to,
             upload_date_from=upload_date_from,
             upload_date_to=upload_date_to,
-            pagination_start=pagination_start if 'pagination_start' in locals() else None,
-            pagination_end=pagination_end if 'pagination_end' in locals() else None,
+            pagination_start=pagination_start,
+            pagination_end=pagination_end,
             api_key=client_config['api_key']
         )
         
@@ -1407,6 +1676,22 @@ def list_photos_table_page():
             status_values=[]
         )
 
+def photo_navigation(photo_id):
+    """
+    Previous and next photo IDs around photo_id, following the sort and
+    filters last used on the photos table (upload date, newest first, if none).
+    """
+    view = session.get('photos_view') or {}
+    navigation = database.get_photo_navigation(
+        photo_id,
+        view.get('sort_by', 'upload_time'),
+        view.get('sort_order', 'desc'),
+        view.get('filters'),
+    )
+    if not navigation:
+        return None, None
+    return navigation['previous'], navigation['next']
+
 @app.route('/edit_photo/<photo_id>', methods=['GET'])
 @token_required
 def edit_photo(photo_id):
@@ -1420,7 +1705,7 @@ def edit_photo(photo_id):
     try:
         if os.path.exists(database.DATABASE_PATH):
             # Try to get the photo from database first
-            photo_from_db = database.get_photo_from_db(photo_id)
+            photo_from_db = database.get_photo_from_db(photo_id, api_format=True)
             
             if photo_from_db is not None:
                 app.logger.debug("Found photo in database")
@@ -1442,16 +1727,8 @@ def edit_photo(photo_id):
             else:
                 response['thumbnailUrl'] += f"?key={client_config['api_key']}"
     else:
-        # Convert database format to API format
-        response = {
-            'photoId': {'id': photo_from_db['photo_id']},
-            'captureTime': photo_from_db['capture_time'],
-            'uploadTime': photo_from_db['upload_time'],
-            'viewCount': photo_from_db['view_count'],
-            'mapsPublishStatus': photo_from_db['maps_publish_status'],
-            'shareLink': photo_from_db['share_link'],
-            'thumbnailUrl': photo_from_db['thumbnail_url']
-        }
+        # Database rows come back already shaped like the API response
+        response = photo_from_db
         
         # Ensure thumbnailUrl has API key if needed
         if response['thumbnailUrl'] and '?key=' not in response['thumbnailUrl'] and client_config['api_key']:
@@ -1459,29 +1736,6 @@ def edit_photo(photo_id):
                 response['thumbnailUrl'] += f"&key={client_config['api_key']}"
             else:
                 response['thumbnailUrl'] += f"?key={client_config['api_key']}"
-        
-        if photo_from_db['latitude'] is not None and photo_from_db['longitude'] is not None:
-            response['pose'] = {
-                'latLngPair': {
-                    'latitude': photo_from_db['latitude'], 
-                    'longitude': photo_from_db['longitude']
-                }
-            }
-            
-            if photo_from_db['heading'] is not None:
-                response['pose']['heading'] = photo_from_db['heading']
-        
-        if 'connections' in photo_from_db and photo_from_db['connections']:
-            response['connections'] = photo_from_db['connections']
-            
-        if 'places' in photo_from_db and photo_from_db['places']:
-            response['places'] = []
-            for place in photo_from_db['places']:
-                response['places'].append({
-                    'placeId': place['place_id'],
-                    'name': place['name'],
-                    'languageCode': place['language_code']
-                })
 
     page_token = session.get('page_token', None)
     page_size = session.get('page_size', None)
@@ -1516,10 +1770,9 @@ def edit_photo(photo_id):
     app.logger.debug(f"Original captureTime: {response.get('originalCaptureTime', 'N/A')}")
     app.logger.debug(f"Original uploadTime: {response.get('originalUploadTime', 'N/A')}")
 
-    # Get filename from JSON files mapping
+    # Get filename from the upload ledger
     try:
-        photoId_to_filename = get_filenames(config['uploads']['directory'])
-        response['filename'] = photoId_to_filename.get(photo_id)
+        response['filename'] = get_upload_filenames([photo_id]).get(photo_id)
         app.logger.debug(f"Found filename for photo {photo_id}: {response.get('filename', 'Not found')}")
     except Exception as e:
         app.logger.error(f"Error getting filename for photo {photo_id}: {str(e)}")
@@ -1529,17 +1782,11 @@ def edit_photo(photo_id):
     next_photo_id = None
     previous_photo_id = None
     
-    try:
-        if using_db:
-            # Use database functions to get next/previous photos
-            next_photo_id = database.get_next_photo_by_capture_time(photo_id)
-            previous_photo_id = database.get_previous_photo_by_capture_time(photo_id)
-        else:
-            # If not using database, we can't provide navigation
-            app.logger.debug("Not using database, navigation not available")
-            
-    except Exception as e:
-        app.logger.error(f"Error getting navigation photos: {str(e)}")
+    if using_db:
+        previous_photo_id, next_photo_id = photo_navigation(photo_id)
+    else:
+        # If not using database, we can't provide navigation
+        app.logger.debug("Not using database, navigation not available")
     
     # passing the entire response dictionary to the render_template function
     # Render the 'edit_photo.html' template with the photo details.
@@ -1565,7 +1812,7 @@ def edit_connections(photo_id):
     try:
         if os.path.exists(database.DATABASE_PATH):
             # Try to get the photo from database first
-            photo_from_db = database.get_photo_from_db(photo_id)
+            photo_from_db = database.get_photo_from_db(photo_id, api_format=True)
             
             if photo_from_db is not None:
                 app.logger.debug("Found photo in database")
@@ -1580,39 +1827,8 @@ def edit_connections(photo_id):
         credentials = get_credentials()
         response = get_photo(credentials.token, photo_id)
     else:
-        # Convert database format to API format
-        response = {
-            'photoId': {'id': photo_from_db['photo_id']},
-            'captureTime': photo_from_db['capture_time'],
-            'uploadTime': photo_from_db['upload_time'],
-            'viewCount': photo_from_db['view_count'],
-            'mapsPublishStatus': photo_from_db['maps_publish_status'],
-            'shareLink': photo_from_db['share_link'],
-            'thumbnailUrl': photo_from_db['thumbnail_url']
-        }
-        
-        if photo_from_db['latitude'] is not None and photo_from_db['longitude'] is not None:
-            response['pose'] = {
-                'latLngPair': {
-                    'latitude': photo_from_db['latitude'], 
-                    'longitude': photo_from_db['longitude']
-                }
-            }
-            
-            if photo_from_db['heading'] is not None:
-                response['pose']['heading'] = photo_from_db['heading']
-        
-        if 'connections' in photo_from_db and photo_from_db['connections']:
-            response['connections'] = photo_from_db['connections']
-            
-        if 'places' in photo_from_db and photo_from_db['places']:
-            response['places'] = []
-            for place in photo_from_db['places']:
-                response['places'].append({
-                    'placeId': place['place_id'],
-                    'name': place['name'],
-                    'languageCode': place['language_code']
-                })
+        # Database rows come back already shaped like the API response
+        response = photo_from_db
 
     page_session_token = session.get('page_token', None)
     page_session_size = session.get('page_size', None)
@@ -1659,13 +1875,13 @@ def edit_connections(photo_id):
         # Try to get nearby photos from database first if already using database
         if using_db:
             try:
-                app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Calling get_nearby_photos ===")
+                app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Calling get_photos_within_radius ===")
                 app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: photo_id (center): {photo_id} ===")
                 app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: latitude: {latitude}, longitude: {longitude} ===")
                 app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: bounding box: ({min_lat}, {min_lng}) to ({max_lat}, {max_lng}) ===")
                 
-                db_nearby_photos = database.get_nearby_photos(
-                    latitude, longitude, min_lat, max_lat, min_lng, max_lng, photo_id
+                db_nearby_photos = database.get_photos_within_radius(
+                    latitude, longitude, search_radius, exclude_photo_id=photo_id
                 )
                 
                 app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Retrieved {len(db_nearby_photos)} nearby photos from database ===")
@@ -1722,35 +1938,16 @@ def edit_connections(photo_id):
             except requests.exceptions.RequestException as e:
                 app.logger.error(f"Error fetching nearby photos from API: {e}")
         else:
-            # Process nearby photos from database
+            # Photos from the database are already limited to the search radius,
+            # exclude the center photo and carry their distance
             app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Processing {len(db_nearby_photos)} nearby photos from database ===")
             
             for nearby_photo in db_nearby_photos:
-                nearby_photo_id = nearby_photo.get('photoId', {}).get('id', 'Unknown')
-                app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Processing nearby photo {nearby_photo_id} ===")
-                
-                if 'pose' in nearby_photo and 'latLngPair' in nearby_photo['pose']:
-                    nearby_lat = nearby_photo['pose']['latLngPair']['latitude']
-                    nearby_lng = nearby_photo['pose']['latLngPair']['longitude']
-                    distance_to_photo = calculate_distance(latitude, longitude, nearby_lat, nearby_lng)
-                    
-                    app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Photo {nearby_photo_id} at ({nearby_lat}, {nearby_lng}), distance: {distance_to_photo}m ===")
-                    
-                    # Exclude the center photo by ID comparison instead of distance
-                    if nearby_photo_id != photo_id:
-                        # Only include photos within the search radius
-                        if distance_to_photo <= search_radius:
-                            nearby_photo['distance'] = round(distance_to_photo, 4)  # Keep high precision for sorting
-                            nearby_photo['display_distance'] = round(distance_to_photo, 2)  # 2 decimal places for display
-                            nearby_photo['formattedCaptureTime'] = format_capture_time(nearby_photo['captureTime'])
-                            nearby_photos.append(nearby_photo)
-                            app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Added photo {nearby_photo_id} to nearby_photos list (distance: {distance_to_photo}m <= {search_radius}m) ===")
-                        else:
-                            app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Excluded photo {nearby_photo_id} - distance {distance_to_photo}m exceeds search radius {search_radius}m ===")
-                    else:
-                        app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Skipped photo {nearby_photo_id} - this is the center photo ===")
-                else:
-                    app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Skipped photo {nearby_photo_id} - no pose/coordinates ===")
+                distance_to_photo = nearby_photo['distance']
+                nearby_photo['distance'] = round(distance_to_photo, 4)  # Keep high precision for sorting
+                nearby_photo['display_distance'] = round(distance_to_photo, 2)  # 2 decimal places for display
+                nearby_photo['formattedCaptureTime'] = format_capture_time(nearby_photo['captureTime'])
+                nearby_photos.append(nearby_photo)
         
         # Sort the nearby photos by distance
         app.logger.debug(f"=== EDIT CONNECTIONS DEBUG: Before sorting, found {len(nearby_photos)} nearby photos ===")
@@ -1774,17 +1971,11 @@ def edit_connections(photo_id):
     next_photo_id = None
     previous_photo_id = None
     
-    try:
-        if using_db:
-            # Use database functions to get next/previous photos
-            next_photo_id = database.get_next_photo_by_capture_time(photo_id)
-            previous_photo_id = database.get_previous_photo_by_capture_time(photo_id)
-        else:
-            # If not using database, we can't provide navigation
-            app.logger.debug("Not using database, navigation not available")
-            
-    except Exception as e:
-        app.logger.error(f"Error getting navigation photos: {str(e)}")
+    if using_db:
+        previous_photo_id, next_photo_id = photo_navigation(photo_id)
+    else:
+        # If not using database, we can't provide navigation
+        app.logger.debug("Not using database, navigation not available")
 
     app.logger.debug(f"=== DISTANCE DEBUG: Final search_radius for template: {search_radius} ===")
     
@@ -1805,9 +1996,10 @@ def get_connections():
         all_connections = database.get_connections_by_photo_ids(photo_ids)
         app.logger.debug(f"Retrieved {len(all_connections)} connections from database")
         
-        # If no connections were found in the database, fall back to API
-        if not all_connections:
-            app.logger.warning("No connections found in database, falling back to API")
+        # If none of the photos are in the database, fall back to API. Photos
+        # that are stored locally with no connections simply have none.
+        if not all_connections and not database.get_existing_photo_ids(photo_ids):
+            app.logger.warning("Photos not found in database, falling back to API")
             credentials = get_credentials()
             if not credentials:
                 app.logger.error("No valid credentials available for API fallback")
@@ -1867,14 +2059,13 @@ def create_connections():
 
     try:
         # Make API call to create source → destination connections
-        response = requests.post(
+        response = api_client.post(
             'https://streetviewpublish.googleapis.com/v1/photos:batchUpdate',
             headers={
                 'Authorization': f'Bearer {credentials.token}',
                 'Content-Type': 'application/json'
             },
-            json=request_data,
-            timeout=30
+            json=request_data
         )
         response.raise_for_status()
 
@@ -1948,14 +2139,13 @@ def create_connections():
                 batch = reciprocal_requests[i:i + 20]
                 try:
                     app.logger.debug(f"Reciprocal: sending batch of {len(batch)} updates")
-                    rec_resp = requests.post(
+                    rec_resp = api_client.post(
                         'https://streetviewpublish.googleapis.com/v1/photos:batchUpdate',
                         headers={
                             'Authorization': f'Bearer {credentials.token}',
                             'Content-Type': 'application/json'
                         },
-                        json={'updatePhotoRequests': batch},
-                        timeout=30
+                        json={'updatePhotoRequests': batch}
                     )
                     rec_resp.raise_for_status()
                     rec_data = rec_resp.json()
@@ -2074,6 +2264,25 @@ def nearby_places():
     places_info = get_nearby_places(latitude, longitude, radius, client_config['api_key'])
     return jsonify(places_info)
 
+def init_upload_ledger():
+    """Bring the database (and so the upload ledger) up to date, and import
+    the JSON upload records of older versions into the ledger once."""
+    database.init_db()
+    database.migrate_upload_records(config['uploads']['directory'])
+
+def save_upload_record(filename, create_photo_response, content_hash=None):
+    """Record an upload in the upload ledger.
+
+    The ledger is the only upload record: per-photo JSON files are no longer
+    written, and those of older versions are imported by init_upload_ledger.
+    """
+    try:
+        if not os.path.exists(database.DATABASE_PATH):
+            init_upload_ledger()
+        database.record_upload(filename, create_photo_response, content_hash)
+    except Exception as e:
+        app.logger.error(f"Error recording upload in the ledger: {str(e)}")
+
 @app.route('/upload', methods=['GET', 'POST'])
 @limiter.limit("30 per minute")
 @token_required
@@ -2118,10 +2327,16 @@ def upload_photosphere():
             flash("Failed to create upload URL", "error")
             return redirect(url_for('upload_photosphere'))
 
-        # Save the uploaded file to a temporary location on the server
+        # Save the uploaded file to a temporary location on the server, under
+        # a unique name so concurrent uploads of same-named files never collide,
+        # hashing the original bytes for the upload ledger on the way through
+        content_hash = hashlib.sha256()
         try:
-            file_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
-            file.save(file_path)
+            fd, file_path = tempfile.mkstemp(suffix='.jpg')
+            with os.fdopen(fd, 'wb') as spool:
+                for block in iter(lambda: file.stream.read(_STREAM_READ_SIZE), b''):
+                    content_hash.update(block)
+                    spool.write(block)
             app.logger.debug(f"Saved file to {file_path}")
         except Exception as e:
             app.logger.error(f"Error saving uploaded file: {str(e)}")
@@ -2137,9 +2352,14 @@ def upload_photosphere():
         capture_time = request.form.get('captureTime', '')
         app.logger.debug(f"Received capture time from form: {capture_time}")
 
+        # Optional client-chosen ID under which chunk progress is reported
+        upload_id = request.form.get('uploadId', '')
+        if not _UPLOAD_ID_RE.match(upload_id):
+            upload_id = None
+
         # Upload the photo bytes to the Upload URL
         try:
-            upload_status = upload_photo(credentials.token, upload_ref, file_path, heading)
+            upload_status = upload_photo(credentials.token, upload_ref, file_path, heading, upload_id)
             upload_status_message = f"Upload status: {upload_status}"
             app.logger.debug(upload_status_message)
         except Exception as e:
@@ -2177,30 +2397,8 @@ def upload_photosphere():
             flash("Failed to create photo with metadata", "error")
             return redirect(url_for('upload_photosphere'))
 
-        # Save the create_photo_response JSON data to a file named after the photo filename
-        try:
-            uploads_directory = config['uploads']['directory']
-            os.makedirs(uploads_directory, exist_ok=True)
-
-            # Prepare initial filename
-            base_filename = os.path.splitext(file.filename)[0]
-            counter = 0
-            json_filename = f"{base_filename}.json"
-
-            # Iterate through possible filenames
-            while os.path.exists(os.path.join(uploads_directory, json_filename)):
-                counter += 1
-                json_filename = f"{base_filename}_{counter}.json"
-
-            # Write to the new file
-            json_filepath = os.path.join(uploads_directory, json_filename)
-            with open(json_filepath, 'w') as f:
-                json.dump(create_photo_response, f, indent=2)
-                
-            app.logger.debug(f"Saved photo metadata to {json_filepath}")
-        except Exception as e:
-            app.logger.error(f"Error saving photo metadata to file: {str(e)}")
-            # Not a critical error, don't return error response
+        # Record the upload in the ledger (and as a JSON file named after the photo)
+        save_upload_record(file.filename, create_photo_response, content_hash.hexdigest())
 
         # Check request type and return appropriate response
         app.logger.debug(f"Preparing response, is AJAX: {request.headers.get('X-Requested-With') == 'XMLHttpRequest'}")
@@ -2221,6 +2419,234 @@ def upload_photosphere():
 
     return redirect(url_for('upload_multiple_photospheres'))
 
+@app.route('/upload/stream', methods=['POST'])
+@limiter.limit("30 per minute")
+@token_required
+def upload_photosphere_stream():
+    """
+    Pass-through upload: the request body is the raw JPEG, and filename,
+    latitude, longitude, heading, placeId, captureTime and uploadId come in
+    the query string. The body is patched and forwarded to Google while it
+    is still arriving, so the upload takes about one transfer time and no
+    temporary file is written.
+    """
+    app.logger.debug(f"=== FUNCTION APP: upload_photosphere_stream ===")
+    args = request.args
+    filename = args.get('filename', '')
+    allowed = app.config.get('ALLOWED_EXTENSIONS', {'jpg', 'jpeg'})
+    file_ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if file_ext not in allowed:
+        return jsonify({"error": f"File type '.{file_ext}' not allowed. Accepted: {', '.join(allowed)}"}), 400
+    if not request.content_length:
+        return jsonify({"error": "Upload body with a Content-Length is required"}), 411
+    try:
+        latitude = float(args['latitude'])
+        longitude = float(args['longitude'])
+        validate_coordinates(latitude, longitude)
+        heading = args.get('heading')
+        validate_heading(heading)
+    except (KeyError, ValueError, ValidationError) as e:
+        return jsonify({"error": "Invalid photo metadata", "details": str(e)}), 400
+    upload_id = args.get('uploadId', '')
+    if not _UPLOAD_ID_RE.match(upload_id):
+        upload_id = None
+
+    credentials = get_credentials()
+    # Hashes the original bytes for the upload ledger as they stream through
+    content_hash = hashlib.sha256()
+    try:
+        upload_ref = start_upload(credentials.token)
+        upload_photo_stream(credentials.token, upload_ref, request.stream, request.content_length,
+                            heading, upload_id, hasher=content_hash)
+    except FileOperationError as e:
+        return jsonify({"error": "Failed to read uploaded photo", "details": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error streaming photo upload: {str(e)}")
+        return jsonify({"error": "Failed to upload photo data", "details": str(e)}), 500
+
+    try:
+        create_photo_response = create_photo(credentials.token, upload_ref, latitude, longitude,
+                                              args.get('placeId', ''), args.get('captureTime', ''), heading)
+    except Exception as e:
+        app.logger.error(f"Error creating photo with metadata: {str(e)}")
+        return jsonify({"error": "Failed to create photo with metadata", "details": str(e)}), 500
+
+    save_upload_record(filename, create_photo_response, content_hash.hexdigest())
+    return jsonify(create_photo_response), 200
+
+@app.route('/upload/progress/<upload_id>', methods=['GET'])
+@token_required
+def upload_progress(upload_id):
+    """Chunk progress of an upload started with the given uploadId form field"""
+    progress = get_upload_progress(upload_id)
+    if progress is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    return jsonify(progress)
+
+def _run_upload_job_file(job_id, job_file, spool_path, content_hash):
+    """Worker body for one upload job file: upload the spooled bytes, create the photo, record the result.
+
+    content_hash is the SHA-256 hex digest taken while the file was spooled.
+    """
+    file_index = job_file['file_index']
+    app.logger.debug(f"=== FUNCTION APP: _run_upload_job_file === job_id={job_id} file_index={file_index}")
+    database.update_upload_job_file(job_id, file_index, status='uploading', attempts=job_file['attempts'] + 1,
+                                    started_at=datetime.now().isoformat())
+    try:
+        try:
+            credentials = get_credentials()
+            if credentials is None:
+                raise AuthenticationError("Not signed in; sign in again and retry the file")
+            api_rate = upload_queue.rate_limiter(credentials)
+            api_rate.acquire()
+            upload_ref = start_upload(credentials.token)
+            upload_photo(credentials.token, upload_ref, spool_path, job_file['heading'],
+                         f"{job_id}-{file_index}", api_rate)
+
+            database.update_upload_job_file(job_id, file_index, status='creating')
+            # A long queue can outlast the access token
+            credentials = get_credentials() or credentials
+            api_rate.acquire()
+            create_photo_response = create_photo(credentials.token, upload_ref, job_file['latitude'],
+                                                 job_file['longitude'], job_file['place_id'],
+                                                 job_file['capture_time'], job_file['heading'])
+        finally:
+            # Gone before the final status, so a retried handover never finds it
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
+        save_upload_record(job_file['filename'], create_photo_response, content_hash)
+        database.update_upload_job_file(job_id, file_index, status='done',
+                                        photo_id=(create_photo_response.get('photoId') or {}).get('id'),
+                                        share_link=create_photo_response.get('shareLink'),
+                                        finished_at=datetime.now().isoformat())
+        app.logger.info(f"Upload job {job_id}: uploaded {job_file['filename']}")
+    except Exception as e:
+        app.logger.error(f"Upload job {job_id}: {job_file['filename']} failed: {str(e)}")
+        database.update_upload_job_file(job_id, file_index, status='failed', error=str(e),
+                                        finished_at=datetime.now().isoformat())
+
+def upload_job_status(job):
+    """Shape an upload job for the status API: per-status counts, and chunk progress of files uploading."""
+    status = dict(job)
+    counts = {}
+    for job_file in job['files']:
+        counts[job_file['status']] = counts.get(job_file['status'], 0) + 1
+        if job_file['status'] == 'uploading':
+            progress = get_upload_progress(f"{job['job_id']}-{job_file['file_index']}") or {}
+            job_file['bytes_sent'] = progress.get('bytes_sent', 0)
+            job_file['total_bytes'] = progress.get('total_bytes') or job_file['size']
+            job_file['chunks_sent'] = progress.get('chunks_sent', 0)
+            job_file['chunks_total'] = progress.get('chunks_total')
+            job_file['retrying'] = progress.get('status') == 'retrying'
+    status['counts'] = counts
+    status['active'] = any(job_file['status'] in database.UPLOAD_FILE_ACTIVE_STATUSES for job_file in job['files'])
+    return status
+
+@app.route('/upload_jobs', methods=['POST'])
+@token_required
+def create_upload_job():
+    app.logger.debug(f"=== FUNCTION APP: create_upload_job ===")
+    """
+    Register a server-side batch upload. The JSON body lists the files'
+    metadata ({"files": [{filename, latitude, longitude, heading, placeId,
+    captureTime}, ...]}); each file's bytes are then PUT to its upload URL and
+    queued for the upload workers.
+    """
+    entries = (request.get_json(silent=True) or {}).get('files')
+    max_files = config['uploads'].get('max_job_files', 1000)
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "A non-empty 'files' list is required"}), 400
+    if len(entries) > max_files:
+        return jsonify({"error": f"At most {max_files} files per upload job"}), 400
+
+    allowed = app.config.get('ALLOWED_EXTENSIONS', {'jpg', 'jpeg'})
+    files = []
+    for position, entry in enumerate(entries):
+        try:
+            filename = str(entry.get('filename') or '')
+            file_ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+            if file_ext not in allowed:
+                raise ValidationError(f"File type '.{file_ext}' not allowed. Accepted: {', '.join(allowed)}")
+            latitude, longitude = validate_coordinates(entry['latitude'], entry['longitude'])
+            heading = validate_heading(entry.get('heading'))
+        except (AttributeError, KeyError, TypeError, ValidationError) as e:
+            return jsonify({"error": f"Invalid metadata for file {position}", "details": str(e)}), 400
+        files.append({'filename': filename, 'latitude': latitude, 'longitude': longitude,
+                      'heading': heading, 'place_id': entry.get('placeId') or None,
+                      'capture_time': entry.get('captureTime') or None})
+
+    database.init_db()
+    job_id = uuid.uuid4().hex
+    if not database.create_upload_job(job_id, files):
+        return jsonify({"error": "Failed to create upload job"}), 500
+    return jsonify({"job_id": job_id,
+                    "status_url": url_for('get_upload_job', job_id=job_id),
+                    "upload_urls": [url_for('upload_job_file', job_id=job_id, file_index=index)
+                                    for index in range(len(files))]}), 202
+
+@app.route('/upload_jobs/<job_id>/files/<int:file_index>', methods=['PUT'])
+@limiter.limit("1200 per minute")
+@token_required
+def upload_job_file(job_id, file_index):
+    app.logger.debug(f"=== FUNCTION APP: upload_job_file === job_id={job_id} file_index={file_index}")
+    """
+    Hand over one file of an upload job as the raw request body. The bytes
+    are spooled to a private temp file and the file is queued for the
+    workers. Failed or interrupted files can be handed over again to retry.
+    """
+    length = request.content_length
+    if not length:
+        return jsonify({"error": "Upload body with a Content-Length is required"}), 411
+    job_file = database.claim_upload_job_file(job_id, file_index)
+    if job_file is None:
+        job = database.get_upload_job(job_id)
+        if job is None or not 0 <= file_index < job['file_count']:
+            return jsonify({"error": "Upload job file not found"}), 404
+        return jsonify({"error": f"File is already {job['files'][file_index]['status']}"}), 409
+
+    fd, spool_path = tempfile.mkstemp(suffix='.jpg')
+    # Hashes the original bytes for the upload ledger as they are spooled
+    content_hash = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            remaining = length
+            while remaining:
+                block = request.stream.read(min(remaining, _STREAM_READ_SIZE))
+                if not block:
+                    raise FileOperationError("Upload body ended before its declared length")
+                content_hash.update(block)
+                spool.write(block)
+                remaining -= len(block)
+    except Exception as e:
+        app.logger.error(f"Error receiving upload job file {job_id}/{file_index}: {str(e)}")
+        os.remove(spool_path)
+        database.update_upload_job_file(job_id, file_index, status='waiting', error=str(e))
+        return jsonify({"error": "Failed to receive photo", "details": str(e)}), 400
+
+    database.update_upload_job_file(job_id, file_index, status='queued', size=length)
+    upload_queue.submit(_run_upload_job_file, job_id, job_file, spool_path, content_hash.hexdigest())
+    return jsonify({"job_id": job_id, "file_index": file_index, "status": "queued"}), 202
+
+@app.route('/upload_jobs/latest', methods=['GET'])
+@token_required
+def get_latest_upload_job():
+    """Return the most recent upload job (polled by upload_multiple.html on load to resume reporting)"""
+    if not os.path.exists(database.DATABASE_PATH):
+        return jsonify({"job": None})
+    job = database.get_upload_job()
+    return jsonify({"job": upload_job_status(job) if job else None})
+
+@app.route('/upload_jobs/<job_id>', methods=['GET'])
+@token_required
+def get_upload_job(job_id):
+    """Report per-file status for an upload job"""
+    job = database.get_upload_job(job_id)
+    if job is None:
+        return jsonify({"error": "Upload job not found"}), 404
+    return jsonify({"job": upload_job_status(job)})
+
 @app.route('/upload_multiple', methods=['GET'])
 @token_required
 def upload_multiple_photospheres():
@@ -2228,6 +2654,18 @@ def upload_multiple_photospheres():
     """Display the multiple upload page"""
     return render_template('upload_multiple.html', api_key=client_config['api_key'])
 
+def remove_upload_records(photo_ids):
+    """Remove deleted photos from the upload ledger, with any JSON record files imported from older versions"""
+    if not photo_ids or not os.path.exists(database.DATABASE_PATH):
+        return
+    uploads_dir = config['uploads']['directory']
+    for json_filename in database.delete_uploads(photo_ids):
+        try:
+            os.remove(os.path.join(uploads_dir, json_filename))
+            app.logger.info(f"Deleted upload JSON {json_filename}")
+        except OSError as e:
+            app.logger.warning(f"Could not delete upload JSON {json_filename}: {e}")
+
 @app.route('/delete_photo', methods=['POST'])
 @limiter.limit("10 per minute")
 @token_required
@@ -2239,7 +2677,7 @@ def delete_photo():
     # Call the Street View Publish API to delete the photo
     url = f'https://streetviewpublish.googleapis.com/v1/photo/{photo_id}?photoId={photo_id}'
     headers = {'Authorization': f'Bearer {credentials.token}'}
-    response = requests.delete(url, headers=headers, timeout=30)
+    response = api_client.delete(url, headers=headers)
     
     app.logger.debug("Delete photo response:")
     app.logger.debug(response)
@@ -2248,18 +2686,9 @@ def delete_photo():
         flash(f'Failed to delete photo. Error: {response.status_code}', 'error')
     else:
         database.delete_photo(photo_id)
-        # Remove the upload JSON so the file can be re-uploaded without
-        # showing as "Already Uploaded"
-        uploads_dir = config['uploads']['directory']
-        json_filename = get_filenames(uploads_dir).get(photo_id)
-        if json_filename:
-            try:
-                os.remove(os.path.join(uploads_dir, json_filename))
-                global _filenames_cache_time
-                _filenames_cache_time = 0  # invalidate cache
-                app.logger.info(f"Deleted upload JSON {json_filename} for photo {photo_id}")
-            except OSError as e:
-                app.logger.warning(f"Could not delete upload JSON {json_filename}: {e}")
+        # Drop the upload from the ledger so the file can be re-uploaded
+        # without showing as "Already Uploaded"
+        remove_upload_records([photo_id])
         flash('Photo deleted successfully.', 'success')
 
     return redirect(url_for('photos_page'))
@@ -2275,13 +2704,12 @@ def delete_photos_bulk():
 
     photo_ids = [str(pid).strip() for pid in data['photo_ids'] if pid]
     credentials = get_credentials()
-    uploads_dir = config['uploads']['directory']
     deleted, failed = [], []
 
     try:
         url = 'https://streetviewpublish.googleapis.com/v1/photos:batchDelete'
         headers = {'Authorization': f'Bearer {credentials.token}'}
-        resp = requests.post(url, json={'photoIds': photo_ids}, headers=headers, timeout=30)
+        resp = api_client.post(url, json={'photoIds': photo_ids}, headers=headers)
         if resp.status_code != 200:
             return jsonify({'success': False, 'error': f'API error {resp.status_code}'}), 502
 
@@ -2290,12 +2718,6 @@ def delete_photos_bulk():
             status = statuses[i] if i < len(statuses) else {}
             if status.get('code', 0) == 0:
                 database.delete_photo(photo_id)
-                json_filename = get_filenames(uploads_dir).get(photo_id)
-                if json_filename:
-                    try:
-                        os.remove(os.path.join(uploads_dir, json_filename))
-                    except OSError:
-                        pass
                 deleted.append(photo_id)
                 app.logger.info(f"Bulk delete: removed photo {photo_id}")
             else:
@@ -2303,9 +2725,8 @@ def delete_photos_bulk():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-    # Invalidate filename cache once after all deletions
-    global _filenames_cache_time
-    _filenames_cache_time = 0
+    # Drop the deleted photos from the upload ledger in one go
+    remove_upload_records(deleted)
 
     return jsonify({'success': True, 'deleted': deleted, 'failed': failed})
 
@@ -2333,7 +2754,7 @@ def update_database():
     app.logger.debug(f"Complete data object: {data}")
     
     try:
-        if os.path.exists(database.DATABASE_PATH):
+        if database.photo_database_created():
             # Update the photo in the database
             success = database.insert_or_update_photo(data)
             if success:
@@ -2349,33 +2770,12 @@ def update_database():
         app.logger.error(f"Error updating database: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
-_filenames_cache = {}
-_filenames_cache_time = 0
-_FILENAMES_CACHE_TTL = 60  # seconds
-
-def get_filenames(directory):
-    app.logger.debug(f"=== FUNCTION APP: get_filenames ===")
-    global _filenames_cache, _filenames_cache_time
-    now = time.time()
-    if _filenames_cache and (now - _filenames_cache_time) < _FILENAMES_CACHE_TTL:
-        app.logger.debug("Using cached filenames mapping")
-        return _filenames_cache
-
-    mapping = {}
-    for filename in os.listdir(directory):
-        if filename.endswith(".json"):
-            with open(os.path.join(directory, filename), 'r') as f:
-                try:
-                    content = json.load(f)
-                    if isinstance(content, dict):
-                        photoId = content.get('photoId', {}).get('id')
-                        if photoId:
-                            mapping[photoId] = filename
-                except json.JSONDecodeError:
-                    app.logger.warning(f"Skipping file due to JSONDecodeError: {filename}")
-    _filenames_cache = mapping
-    _filenames_cache_time = now
-    return mapping
+def get_upload_filenames(photo_ids):
+    """Filenames the given photos were uploaded from, by photo ID, from the upload ledger"""
+    app.logger.debug(f"=== FUNCTION APP: get_upload_filenames ===")
+    if not os.path.exists(database.DATABASE_PATH):
+        return {}
+    return database.get_upload_filenames(photo_ids)
 
 def list_photos(token, page_size=10, page_token=None, filters=None):
     app.logger.debug(f"=== FUNCTION APP: list_photos ===")
@@ -2395,7 +2795,7 @@ def list_photos(token, page_size=10, page_token=None, filters=None):
             params["filter"] = filters
         
         app.logger.info(f"Fetching photos with params: {params}")
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = api_client.get(url, headers=headers, params=params)
         return handle_api_response(response, "Failed to list photos")
     except Exception as e:
         app.logger.error(f"Error in list_photos: {str(e)}")
@@ -2416,7 +2816,7 @@ def get_photo(token, photo_id, view=None):
         }
         params = {"view": view} if view else None
         app.logger.info(f"Fetching photo with ID: {photo_id}")
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = api_client.get(url, headers=headers, params=params)
         return handle_api_response(response, f"Failed to get photo {photo_id}")
     except Exception as e:
         app.logger.error(f"Error in get_photo: {str(e)}")
@@ -2462,7 +2862,7 @@ def update_photo_api(token, photo_id, photo):
             "Content-Type": "application/json",
         }
         
-        response = requests.put(url, headers=headers, json=photo, timeout=30)
+        response = api_client.put(url, headers=headers, json=photo)
         return handle_api_response(response, f"Failed to update photo {photo_id}")
     except ValidationError:
         raise
@@ -2482,36 +2882,14 @@ def start_upload(token):
             "Content-Type": "application/json",
         }
         app.logger.info("Starting new photo upload")
-        response = requests.post(url, headers=headers, timeout=30)
+        response = api_client.post(url, headers=headers)
         return handle_api_response(response, "Failed to start upload")
     except Exception as e:
         app.logger.error(f"Error in start_upload: {str(e)}")
         raise APIError("Failed to start upload", response=getattr(e, 'response', None))
 
-def add_or_update_xmp_metadata(file_path, heading):
-    app.logger.debug(f"=== FUNCTION APP: add_or_update_xmp_metadata ===")
-    """Add or update XMP metadata with error handling"""
-    try:
-        # Validate heading
-        validated_heading = validate_heading(heading)
-        
-        # Read the image
-        try:
-            with open(file_path, "rb") as f:
-                img_data = f.read()
-        except IOError as e:
-            raise FileOperationError(f"Failed to read image file: {str(e)}")
-
-        # Search for existing XMP metadata
-        start_marker = b"<?xpacket begin="
-        end_marker = b"<?xpacket end="
-        xmp_start = img_data.find(start_marker)
-        xmp_end = img_data.find(end_marker)
-
-        if (xmp_start != -1) and (xmp_end != -1):
-            xmp_data = img_data[xmp_start:xmp_end + len(end_marker)].decode("utf-8")
-        else:
-            xmp_data = """
+# XMP written into photos that have none
+_DEFAULT_XMP_PACKET = """
             <x:xmpmeta xmlns:x="adobe:ns:meta/">
                 <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
                     <rdf:Description rdf:about=""
@@ -2521,74 +2899,356 @@ def add_or_update_xmp_metadata(file_path, heading):
             </x:xmpmeta>
             """
 
-        # Update XMP data
+def xmp_heading_segment(packet, heading):
+    """Build the XMP APP1 segment for packet (bytes, or None for a new packet)
+    with GPano:PoseHeadingDegrees set to heading (None leaves it unchanged)."""
+    xmp_data = packet.decode("utf-8") if packet else _DEFAULT_XMP_PACKET
+    if heading is not None:
         if '<GPano:PoseHeadingDegrees>' not in xmp_data:
             xmp_data = re.sub(
                 r'(<rdf:Description[^>]*>)',
-                r'\1<GPano:PoseHeadingDegrees>{}</GPano:PoseHeadingDegrees>'.format(validated_heading),
-                xmp_data
+                r'\1<GPano:PoseHeadingDegrees>{}</GPano:PoseHeadingDegrees>'.format(heading),
+                xmp_data, count=1
             )
         else:
             xmp_data = re.sub(
                 r'<GPano:PoseHeadingDegrees>.*?</GPano:PoseHeadingDegrees>',
-                f'<GPano:PoseHeadingDegrees>{validated_heading}</GPano:PoseHeadingDegrees>',
+                f'<GPano:PoseHeadingDegrees>{heading}</GPano:PoseHeadingDegrees>',
                 xmp_data
             )
+    payload = XMP_NAMESPACE + xmp_data.encode("utf-8")
+    if len(payload) + 2 > 0xFFFF:
+        raise FileOperationError("XMP metadata too large for a single APP1 segment")
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+def xmp_patch_span(data):
+    """(start, end) of the XMP APP1 segment to replace in a JPEG header, or
+    (2, 2) to insert a new one right after SOI."""
+    for start, marker, end in _iter_jpeg_segments(data):
+        if _is_xmp_segment(data, start, marker):
+            return start, end
+    return 2, 2
+
+class PatchedJpeg:
+    """A JPEG with its XMP heading rewritten, without copying the file.
+
+    The patched photo is the original's bytes before the XMP APP1 segment, a
+    freshly built segment, then the original's remaining bytes. Only the new
+    segment lives in memory; the rest is read on demand from a read-only
+    memory map of the original, so no temporary copy is written.
+    """
 
-        # Save the updated image
-        temp_file_path = file_path + "_temp.jpg"
+    def __init__(self, file_path, heading):
+        validated_heading = validate_heading(heading)
+        self._file = self._map = None
         try:
-            with open(temp_file_path, "wb") as out_file:
-                out_file.write(img_data[:xmp_start])
-                out_file.write(xmp_data.encode('utf-8'))
-                out_file.write(img_data[xmp_end:])
-        except IOError as e:
-            raise FileOperationError(f"Failed to write temporary file: {str(e)}")
-
-        return temp_file_path
-    except Exception as e:
-        app.logger.error(f"Error in add_or_update_xmp_metadata: {str(e)}")
-        if isinstance(e, (ValidationError, FileOperationError)):
-            raise
-        raise FileOperationError(f"Failed to process image metadata: {str(e)}")
+            self._file = open(file_path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            self.close()
+            raise FileOperationError(f"Failed to read image file: {str(e)}")
+        if self._map[:2] != b'\xff\xd8':
+            self.close()
+            raise FileOperationError("Failed to read image file: not a JPEG")
+
+        start, end = xmp_patch_span(self._map)
+        packet = self._map[start + 4 + len(XMP_NAMESPACE):end] if end > start else None
+        self.segment = xmp_heading_segment(packet, validated_heading)
+        self._parts = [(self._map, 0, start), (self.segment, 0, len(self.segment)),
+                       (self._map, end, len(self._map))]
+        self.size = start + len(self.segment) + len(self._map) - end
+
+    def __len__(self):
+        return self.size
+
+    def read_range(self, offset, size):
+        """Bytes [offset, offset + size) of the patched photo"""
+        out = []
+        for buffer, start, end in self._parts:
+            length = end - start
+            if offset < length and size > 0:
+                piece = buffer[start + offset:start + min(length, offset + size)]
+                out.append(piece)
+                size -= len(piece)
+            offset = max(0, offset - length)
+        return b''.join(out)
+
+    def open(self, offset=0, length=None):
+        """File-like reader over [offset, offset + length), for streaming request bodies"""
+        end = self.size if length is None else min(self.size, offset + length)
+        return _PatchedJpegReader(self, offset, end)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _PatchedJpegReader:
+    """Sized file-like view used as a requests body; http.client reads it in small blocks"""
+
+    def __init__(self, photo, offset, end):
+        self._photo = photo
+        self._pos = offset
+        self._end = end
+
+    def __len__(self):
+        return self._end - self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._end - self._pos
+        data = self._photo.read_range(self._pos, min(size, self._end - self._pos))
+        self._pos += len(data)
+        return data
+
+# Largest JPEG header (segments before the scan data) buffered while looking
+# for the XMP segment of a streamed upload
+_STREAM_HEADER_LIMIT = 1024 * 1024
+_STREAM_READ_SIZE = 64 * 1024
+
+def _scan_jpeg_header(data):
+    """Find the XMP span in a possibly partial JPEG header.
+
+    Returns (start, end) like xmp_patch_span(), or None while data ends
+    before the XMP segment or the start of the scan data.
+    """
+    last_end = 2
+    for start, marker, end in _iter_jpeg_segments(data):
+        if end > len(data):
+            return None
+        if _is_xmp_segment(data, start, marker):
+            return start, end
+        last_end = end
+    # The walker also stops when it runs out of bytes for the next marker
+    return (2, 2) if last_end + 4 <= len(data) else None
+
+class StreamingJpeg:
+    """A JPEG arriving on a stream, with its XMP heading rewritten on the fly.
+
+    Only the header is buffered (up to the XMP segment, or the scan data if
+    there is none); the rest passes straight through. open() serves the same
+    interface as PatchedJpeg for the resumable upload: bytes from the last
+    chunk start are retained so a failed chunk can be resent from any
+    acknowledged offset, and are dropped once a later chunk starts.
+
+    hasher (e.g. hashlib.sha256()) is updated with the original bytes as
+    they are read from the stream.
+    """
 
-def upload_photo(token, upload_ref, file_path, heading):
-    app.logger.debug(f"=== FUNCTION APP: upload_photo ===")
-    """Upload photo with validation and error handling"""
-    try:
-        # Add XMP metadata to the photo
-        temp_file_path = add_or_update_xmp_metadata(file_path, heading)
-        app.logger.info(f"Created temporary file with metadata: {temp_file_path}")
+    def __init__(self, stream, content_length, heading, hasher=None):
+        validated_heading = validate_heading(heading)
+        self._stream = stream
+        self._hasher = hasher
+        header = bytearray()
+        span = None
+        while span is None:
+            block = stream.read(min(_STREAM_READ_SIZE, content_length - len(header)))
+            if not block:
+                raise FileOperationError("Failed to read image file: upload ended in the JPEG header")
+            if hasher is not None:
+                hasher.update(block)
+            header += block
+            if header[:2] != b'\xff\xd8':
+                raise FileOperationError("Failed to read image file: not a JPEG")
+            if len(header) > _STREAM_HEADER_LIMIT:
+                raise FileOperationError("Failed to read image file: JPEG header too large")
+            span = _scan_jpeg_header(header)
+        start, end = span
+        packet = bytes(header[start + 4 + len(XMP_NAMESPACE):end]) if end > start else None
+        self.segment = xmp_heading_segment(packet, validated_heading)
+        self.size = start + len(self.segment) + content_length - end
+        self._unread = content_length - len(header)
+        # Patched bytes from _buffer_start on that have been produced so far
+        self._buffer = bytearray(header[:start]) + self.segment + header[end:]
+        self._buffer_start = 0
+
+    def __len__(self):
+        return self.size
+
+    def open(self, offset=0, length=None):
+        if offset < self._buffer_start:
+            raise FileOperationError(f"Cannot resend streamed bytes before offset {self._buffer_start}")
+        del self._buffer[:offset - self._buffer_start]
+        self._buffer_start = offset
+        end = self.size if length is None else min(self.size, offset + length)
+        return _StreamingJpegReader(self, offset, end)
+
+    def _read(self, pos, size):
+        """Bytes from pos, served from the retained buffer or pulled from the stream"""
+        index = pos - self._buffer_start
+        if index >= len(self._buffer):
+            block = self._stream.read(min(size, self._unread, _STREAM_READ_SIZE)) if self._unread else b''
+            if not block:
+                raise FileOperationError("Upload body ended before its declared length")
+            if self._hasher is not None:
+                self._hasher.update(block)
+            self._unread -= len(block)
+            self._buffer += block
+        return bytes(self._buffer[index:index + size])
+
+class _StreamingJpegReader(_PatchedJpegReader):
+    def read(self, size=-1):
+        remaining = self._end - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b''
+        data = self._photo._read(self._pos, size)
+        self._pos += len(data)
+        return data
+
+# Upload progress by client-chosen upload ID, polled via /upload/progress
+_upload_progress = {}
+_upload_progress_lock = threading.Lock()
+_UPLOAD_PROGRESS_KEEP = 100
+_UPLOAD_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def record_upload_progress(upload_id, **fields):
+    """Merge fields into the progress entry of upload_id (no-op without an ID)"""
+    if not upload_id:
+        return
+    with _upload_progress_lock:
+        entry = _upload_progress.pop(upload_id, None) or {
+            'status': 'pending', 'bytes_sent': 0, 'total_bytes': None,
+            'chunks_sent': 0, 'chunks_total': None, 'retries': 0,
+        }
+        entry.update(fields)
+        entry['updated_at'] = time.time()
+        _upload_progress[upload_id] = entry
+        while len(_upload_progress) > _UPLOAD_PROGRESS_KEEP:
+            _upload_progress.pop(next(iter(_upload_progress)))
+
+def get_upload_progress(upload_id):
+    with _upload_progress_lock:
+        entry = _upload_progress.get(upload_id)
+        return dict(entry) if entry is not None else None
+
+def _resumable_post(url, token, command, data=None, headers=None, timeout=None, rate_limiter=None):
+    """POST one resumable-protocol command; 5xx and 429 raise TransientUploadError.
+
+    With rate_limiter, the request first waits for one of its call slots.
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    all_headers = {
+        "Authorization": f"Bearer {token}",
+        "X-Goog-Upload-Protocol": "resumable",
+        "X-Goog-Upload-Command": command,
+    }
+    all_headers.update(headers or {})
+    response = api_client.post(url, data=data, headers=all_headers, timeout=timeout)
+    if response.status_code >= 500 or response.status_code == 429:
+        raise TransientUploadError(f"Upload {command} returned {response.status_code}",
+                                   status_code=response.status_code, response=response)
+    return response
 
+def _resumable_upload(token, upload_url, photo, upload_id=None, rate_limiter=None):
+    """Send a PatchedJpeg or StreamingJpeg with the resumable upload protocol.
+
+    The photo goes out in api_client.upload_chunk_size chunks, each streamed
+    in small blocks from photo.open(). If a chunk fails with a dropped
+    connection, timeout, 5xx or 429, the session is queried for the bytes
+    Google acknowledged (X-Goog-Upload-Size-Received) and the upload resumes
+    from that offset, up to upload_max_retries consecutive failures with
+    exponential backoff. Progress is recorded under upload_id. Every request
+    (start, each chunk, each query) takes a slot from rate_limiter if given.
+    """
+    total = len(photo)
+    response = _resumable_post(upload_url, token, "start", headers={
+        "X-Goog-Upload-Header-Content-Length": str(total),
+        "X-Goog-Upload-Header-Content-Type": "image/jpeg",
+    }, rate_limiter=rate_limiter)
+    handle_api_response(response, "Failed to start resumable upload")
+    session_url = response.headers.get("X-Goog-Upload-URL", upload_url)
+    # Every chunk but the last must be a multiple of the granularity
+    granularity = int(response.headers.get("X-Goog-Upload-Chunk-Granularity", 1))
+    chunk_size = max(granularity, api_client.upload_chunk_size // granularity * granularity)
+    record_upload_progress(upload_id, status='uploading', total_bytes=total,
+                           chunks_total=max(1, -(-total // chunk_size)))
+
+    app.logger.info(f"Uploading photo data: {total} bytes in chunks of {chunk_size}")
+    offset = 0
+    failures = 0
+    retries = 0
+    resume = False
+    while True:
         try:
-            with open(temp_file_path, "rb") as f:
-                raw_data = f.read()
-        except IOError as e:
-            raise FileOperationError(f"Failed to read temporary file: {str(e)}")
+            if resume:
+                response = _resumable_post(session_url, token, "query", rate_limiter=rate_limiter)
+                handle_api_response(response, "Failed to query upload")
+                offset = int(response.headers.get("X-Goog-Upload-Size-Received", offset))
+                resume = False
+                if response.headers.get("X-Goog-Upload-Status") == "final":
+                    record_upload_progress(upload_id, status='uploaded', bytes_sent=total)
+                    return None
+                app.logger.info(f"Resuming upload at offset {offset}/{total}")
+
+            length = min(chunk_size, total - offset)
+            last = offset + length >= total
+            response = _resumable_post(
+                session_url, token, "upload, finalize" if last else "upload",
+                data=photo.open(offset, length),
+                headers={"X-Goog-Upload-Offset": str(offset)}, timeout=api_client.transfer_timeout,
+                rate_limiter=rate_limiter)
+            result = handle_api_response(response, "Failed to upload photo")
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                TransientUploadError) as e:
+            failures += 1
+            if failures > api_client.upload_max_retries:
+                raise APIError(f"Failed to upload photo after {failures} attempts: {str(e)}",
+                               response=getattr(e, 'response', None))
+            wait_time = 2 ** (failures - 1)
+            app.logger.warning(f"Upload chunk at offset {offset} failed, resuming in {wait_time}s: {str(e)}")
+            retries += 1
+            record_upload_progress(upload_id, status='retrying', retries=retries)
+            time.sleep(wait_time)
+            resume = True
+            continue
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "image/jpeg",
-            "X-Goog-Upload-Protocol": "raw",
-            "X-Goog-Upload-Content-Length": str(len(raw_data)),
-        }
+        failures = 0
+        offset += length
+        record_upload_progress(upload_id, status='uploaded' if last else 'uploading',
+                               bytes_sent=offset, chunks_sent=-(-offset // chunk_size))
+        if last:
+            return result
 
-        app.logger.info("Uploading photo data")
-        response = requests.post(upload_ref["uploadUrl"], data=raw_data, headers=headers, timeout=120)
-        return handle_api_response(response, "Failed to upload photo")
+def upload_photo(token, upload_ref, file_path, heading, upload_id=None, rate_limiter=None):
+    app.logger.debug(f"=== FUNCTION APP: upload_photo ===")
+    """Upload a photo file with its XMP heading patched via PatchedJpeg, so the
+    file is read from a memory map and never copied (see _resumable_upload)."""
+    try:
+        with PatchedJpeg(file_path, heading) as photo:
+            return _resumable_upload(token, upload_ref["uploadUrl"], photo, upload_id, rate_limiter)
     except Exception as e:
         app.logger.error(f"Error in upload_photo: {str(e)}")
+        record_upload_progress(upload_id, status='failed', error=str(e))
+        if isinstance(e, (ValidationError, FileOperationError, APIError)):
+            raise
+        raise APIError("Failed to upload photo", response=getattr(e, 'response', None))
+
+def upload_photo_stream(token, upload_ref, stream, content_length, heading, upload_id=None, hasher=None):
+    app.logger.debug(f"=== FUNCTION APP: upload_photo_stream ===")
+    """Upload a photo straight from an incoming request stream via StreamingJpeg.
+
+    Bytes go to Google while they are still arriving, and nothing is written
+    to disk; memory holds the JPEG header and at most one chunk for resends.
+    """
+    try:
+        photo = StreamingJpeg(stream, content_length, heading, hasher)
+        return _resumable_upload(token, upload_ref["uploadUrl"], photo, upload_id)
+    except Exception as e:
+        app.logger.error(f"Error in upload_photo_stream: {str(e)}")
+        record_upload_progress(upload_id, status='failed', error=str(e))
         if isinstance(e, (ValidationError, FileOperationError, APIError)):
             raise
         raise APIError("Failed to upload photo", response=getattr(e, 'response', None))
-    finally:
-        # Clean up temporary file
-        if 'temp_file_path' in locals():
-            try:
-                os.remove(temp_file_path)
-                app.logger.info(f"Cleaned up temporary file: {temp_file_path}")
-            except OSError as e:
-                app.logger.warning(f"Failed to clean up temporary file: {str(e)}")
 
 def create_photo(token, upload_ref, latitude, longitude, placeId, capture_time=None, heading=None):
     app.logger.debug(f"=== FUNCTION APP: create_photo ===")
@@ -2632,7 +3292,7 @@ def create_photo(token, upload_ref, latitude, longitude, placeId, capture_time=N
             app.logger.debug(f"Including captureTime in API request: {capture_time}")
 
         app.logger.info(f"Creating photo with coordinates: {validated_lat}, {validated_lng}")
-        response = requests.post(url, headers=headers, json=body, timeout=30)
+        response = api_client.post(url, headers=headers, json=body)
         return handle_api_response(response, "Failed to create photo")
     except Exception as e:
         app.logger.error(f"Error in create_photo: {str(e)}")
@@ -2679,7 +3339,7 @@ def get_nearby_places(latitude, longitude, radius, api_key):
         if next_page_token:
             params['pagetoken'] = next_page_token
 
-        response = requests.get(url, params=params, timeout=30)
+        response = api_client.get(url, params=params)
         data = response.json()
 
         # debug - print the number of results
@@ -2714,17 +3374,9 @@ def get_nearby_places(latitude, longitude, radius, api_key):
 
 def calculate_bounding_box(lat, lng, radius):
     app.logger.debug(f"=== FUNCTION APP: calculate_bounding_box ===")
-    # Latitude: 1 degree = 111.32 km
-    lat_diff = radius / 111320
-    # Longitude: 1 degree = 111.32 * cos(latitude) km
-    lng_diff = radius / (111320 * cos(radians(lat)))
-
-    min_lat = lat - lat_diff
-    max_lat = lat + lat_diff
-    min_lng = lng - lng_diff
-    max_lng = lng + lng_diff
-
-    return min_lat, max_lat, min_lng, max_lng
+    # Latitude: 1 degree = 111.32 km; longitude: 111.32 * cos(latitude) km.
+    # Longitudes may extend past +/-180 near the antimeridian.
+    return database.bounding_box(lat, lng, radius)
 
 # Second calculate_distance function removed as it duplicates functionality
 
@@ -2772,69 +3424,134 @@ def handle_api_response(response, error_message="API request failed"):
             response=response
         )
 
-def fetch_all_photos(credentials, page_size=100):
+# Pages allowed in flight between the API fetcher and the database writer.
+# Bounds sync memory to a few pages regardless of account size.
+_SYNC_QUEUE_PAGES = 3
+
+def fetch_all_photos(credentials, page_size=100, progress=None, cancel_event=None):
     app.logger.debug(f"=== FUNCTION APP: fetch_all_photos ===")
-    """Fetch all photos from the Street View Publish API with retry logic"""
-    photos_list = []
-    page_token = None
-    max_retries = 3
+    """Sync all photos from the Street View Publish API into the database.
 
-    while True:
-        last_error = None
-        for attempt in range(max_retries):
-            try:
-                response = list_photos(credentials.token, page_size=page_size, page_token=page_token)
-                photos = response.get('photos', [])
-                photos_list.extend(photos)
+    Runs as a producer/consumer pipeline: this thread pages through list_photos
+    (with retry logic) while a dedicated writer thread bulk-upserts the previous page,
+    so network and database time overlap. Only photo IDs are kept for the whole
+    run; photo payloads are dropped once written.
+
+    Connections are staged while paging and resolved in one pass once every
+    photo row is loaded, so links to photos on later pages are not dropped.
+
+    progress, if given, is called with the summary dict after every page and
+    once more at the end. Setting cancel_event stops paging before the next page.
+
+    Returns a summary dict: fetched, stored (inserted + changed + unchanged),
+    deleted, connections, pages, cancelled and complete (False if paging
+    stopped early, in which case deleted photos are not cleaned up).
+
+    If the writer fails to store a page, paging stops and its exception is
+    re-raised once the writer has finished, so the sync is reported as failed.
+    """
+    # Initialize database if needed
+    database.init_db()
+    database.clear_pending_connections()
+
+    pages = queue.Queue(maxsize=_SYNC_QUEUE_PAGES)
+    summary = {'fetched': 0, 'stored': 0, 'inserted': 0, 'changed': 0, 'unchanged': 0,
+               'deleted': 0, 'connections': 0, 'pages': 0, 'complete': False, 'cancelled': False}
+
+    write_errors = []
 
-                page_token = response.get('nextPageToken')
-                last_error = None
+    def writer():
+        while True:
+            photos = pages.get()
+            if photos is None:
                 break
+            if write_errors:
+                # Keep draining so the producer never blocks on a full queue
+                continue
+            try:
+                summary['stored'] += database.upsert_photos(photos, defer_connections=True, counts=summary)
             except Exception as e:
-                last_error = e
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    app.logger.warning(f"Retry {attempt + 1}/{max_retries} fetching photos after {wait_time}s: {str(e)}")
-                    time.sleep(wait_time)
-                else:
-                    app.logger.error(f"Failed to fetch photos after {max_retries} attempts: {str(e)}")
+                app.logger.error(f"Error storing photos in database: {str(e)}")
+                write_errors.append(e)
+
+    writer_thread = threading.Thread(target=writer, name='photo-sync-writer', daemon=True)
+    writer_thread.start()
+
+    api_photo_ids = set()
+    page_token = None
+    max_retries = 3
 
-        if last_error is not None:
-            break
-        if not page_token:
-            break
-    
-    app.logger.info(f"Fetched {len(photos_list)} photos total")
-    
-    # Store in SQLite database
     try:
-        # Initialize database if needed
-        database.init_db()
-        
-        # Extract all photo IDs from the API response
-        api_photo_ids = [photo['photoId']['id'] for photo in photos_list if 'photoId' in photo and 'id' in photo['photoId']]
-        app.logger.info(f"Found {len(api_photo_ids)} valid photo IDs in API response")
-        
-        # Clean up deleted photos (those in DB but not in API)
-        deleted_count = database.clean_deleted_photos(api_photo_ids)
-        
-        # Store each photo in the database
-        success_count = 0
-        for photo in photos_list:
-            if database.insert_or_update_photo(photo):
-                success_count += 1
-        
-        app.logger.info(f"Stored {success_count}/{len(photos_list)} photos in SQLite database")
-        if deleted_count > 0:
-            app.logger.info(f"Removed {deleted_count} deleted photos from database")
-        
-        # Get database statistics
-        stats = database.get_db_stats()
-        app.logger.info(f"Database stats: {stats}")
-    except Exception as e:
-        app.logger.error(f"Error storing photos in database: {str(e)}")
-    
-    return photos_list
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                app.logger.info("Photo sync cancelled")
+                summary['cancelled'] = True
+                break
+            if write_errors:
+                break
+
+            last_error = None
+            for attempt in range(max_retries):
+                try:
+                    response = list_photos(credentials.token, page_size=page_size, page_token=page_token)
+                    last_error = None
+                    break
+                except Exception as e:
+                    last_error = e
+                    if attempt < max_retries - 1:
+                        wait_time = 2 ** attempt
+                        app.logger.warning(f"Retry {attempt + 1}/{max_retries} fetching photos after {wait_time}s: {str(e)}")
+                        time.sleep(wait_time)
+                    else:
+                        app.logger.error(f"Failed to fetch photos after {max_retries} attempts: {str(e)}")
+
+            if last_error is not None:
+                break
+
+            photos = response.get('photos', [])
+            summary['pages'] += 1
+            summary['fetched'] += len(photos)
+            api_photo_ids.update(photo['photoId']['id'] for photo in photos
+                                 if 'photoId' in photo and 'id' in photo['photoId'])
+            pages.put(photos)
+            if progress:
+                progress(summary)
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                summary['complete'] = True
+                break
+    finally:
+        pages.put(None)
+        writer_thread.join()
+
+    if write_errors:
+        raise write_errors[0]
+
+    app.logger.info(f"Fetched {summary['fetched']} photos total in {summary['pages']} pages")
+    app.logger.info(f"Stored {summary['stored']}/{summary['fetched']} photos in SQLite database "
+                    f"({summary['inserted']} new, {summary['changed']} changed, {summary['unchanged']} unchanged)")
+
+    # Second phase: link staged connections now that all photo rows exist
+    summary['connections'] = database.resolve_pending_connections() or 0
+
+    # Clean up deleted photos (those in DB but not in API). Skipped after a
+    # partial fetch, where missing IDs only mean we never got to their page.
+    if summary['complete']:
+        summary['deleted'] = database.clean_deleted_photos(api_photo_ids)
+        if summary['deleted'] > 0:
+            app.logger.info(f"Removed {summary['deleted']} deleted photos from database")
+    else:
+        app.logger.warning("Photo listing incomplete - skipping cleanup of deleted photos")
+    database.apply_tile_changes()
+    if progress:
+        progress(summary)
+
+    # Get database statistics
+    stats = database.get_db_stats()
+    app.logger.info(f"Database stats: {stats}")
+
+    return summary
 
 @app.route('/photo_database')
 @token_required
@@ -2844,9 +3561,9 @@ def photo_database():
     stats = {}
     json_files = []
     
-    # Get database statistics if database exists
+    # Get database statistics once a sync has created the photo database
     try:
-        if os.path.exists(database.DATABASE_PATH):
+        if database.photo_database_created():
             stats = database.get_db_stats()
     except Exception as e:
         app.logger.error(f"Error getting database stats: {str(e)}")
@@ -2882,21 +3599,144 @@ def photo_database():
     
     return render_template('photo_database.html', stats=stats, json_files=json_files)
 
+# Cancellation flags for sync jobs running in this process (job_id -> Event).
+# Job state itself lives in the sync_jobs table so it survives a restart.
+_sync_job_events = {}
+_sync_job_lock = threading.Lock()
+
+def start_sync_job(credentials, page_size=100):
+    """Start a background database sync unless one is already running.
+
+    Returns (job_id, None) on success or (None, active_job) if a sync is
+    already queued/running.
+    """
+    app.logger.debug(f"=== FUNCTION APP: start_sync_job ===")
+    with _sync_job_lock:
+        database.init_db()
+        active = database.get_active_sync_job()
+        if active:
+            return None, active
+
+        # The previous sync's photo count is the best ETA estimate we have;
+        # the API does not report a total up front.
+        expected_total = database.get_db_stats().get('photo_count') or None
+        job_id = uuid.uuid4().hex
+        if not database.create_sync_job(job_id, expected_total):
+            return None, database.get_active_sync_job()
+
+        cancel_event = threading.Event()
+        _sync_job_events[job_id] = cancel_event
+        thread = threading.Thread(target=_run_sync_job, args=(job_id, credentials, page_size, cancel_event),
+                                  name=f'sync-job-{job_id[:8]}', daemon=True)
+        thread.start()
+    app.logger.info(f"Started sync job {job_id}")
+    return job_id, None
+
+def _run_sync_job(job_id, credentials, page_size, cancel_event):
+    """Thread body for a sync job: runs fetch_all_photos and persists progress."""
+    app.logger.debug(f"=== FUNCTION APP: _run_sync_job === job_id={job_id}")
+    database.update_sync_job(job_id, status='running', started_at=datetime.now().isoformat())
+
+    def progress(summary):
+        database.update_sync_job(job_id,
+                                 pages_fetched=summary['pages'],
+                                 photos_fetched=summary['fetched'],
+                                 rows_upserted=summary['stored'],
+                                 rows_inserted=summary['inserted'],
+                                 rows_changed=summary['changed'],
+                                 rows_unchanged=summary['unchanged'],
+                                 rows_deleted=summary['deleted'])
+
+    try:
+        summary = fetch_all_photos(credentials, page_size=page_size, progress=progress, cancel_event=cancel_event)
+        if summary['cancelled']:
+            status, error = 'cancelled', None
+        elif summary['complete']:
+            status, error = 'completed', None
+        else:
+            status, error = 'failed', 'Photo listing stopped early; deleted photos were not cleaned up'
+        database.update_sync_job(job_id, status=status, error=error, finished_at=datetime.now().isoformat())
+        app.logger.info(f"Sync job {job_id} finished with status {status}")
+    except Exception as e:
+        app.logger.error(f"Sync job {job_id} failed: {str(e)}")
+        database.update_sync_job(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+    finally:
+        _sync_job_events.pop(job_id, None)
+
+def sync_job_status(job):
+    """Shape a sync_jobs row for the status API, adding an ETA estimate."""
+    status = dict(job)
+    status['active'] = job['status'] in database.SYNC_JOB_ACTIVE_STATUSES
+    status['cancel_requested'] = bool(job['cancel_requested'])
+    status['eta_seconds'] = None
+    if job['status'] == 'running' and job['started_at'] and job['photos_fetched'] and job['expected_total']:
+        try:
+            elapsed = (datetime.now() - datetime.fromisoformat(job['started_at'])).total_seconds()
+            remaining = max(job['expected_total'] - job['photos_fetched'], 0)
+            status['eta_seconds'] = round(elapsed / job['photos_fetched'] * remaining)
+        except ValueError:
+            pass
+    return status
+
+@app.route('/sync_jobs', methods=['POST'])
+@token_required
+def create_sync_job():
+    app.logger.debug(f"=== FUNCTION APP: create_sync_job ===")
+    """Start a background sync of all photos from the API into the database"""
+    credentials = get_credentials()
+    job_id, active = start_sync_job(credentials)
+    if job_id is None:
+        return jsonify({"error": "A database sync is already running",
+                        "job": sync_job_status(active) if active else None}), 409
+    return jsonify({"job_id": job_id,
+                    "status_url": url_for('get_sync_job', job_id=job_id)}), 202
+
+@app.route('/sync_jobs/latest', methods=['GET'])
+@token_required
+def get_latest_sync_job():
+    """Return the most recent sync job (used by the page to resume polling)"""
+    if not os.path.exists(database.DATABASE_PATH):
+        return jsonify({"job": None})
+    job = database.get_sync_job()
+    return jsonify({"job": sync_job_status(job) if job else None})
+
+@app.route('/sync_jobs/<job_id>', methods=['GET'])
+@token_required
+def get_sync_job(job_id):
+    """Report progress for a sync job"""
+    job = database.get_sync_job(job_id)
+    if job is None:
+        return jsonify({"error": "Sync job not found"}), 404
+    return jsonify({"job": sync_job_status(job)})
+
+@app.route('/sync_jobs/<job_id>/cancel', methods=['POST'])
+@token_required
+def cancel_sync_job(job_id):
+    app.logger.debug(f"=== FUNCTION APP: cancel_sync_job === job_id={job_id}")
+    """Ask a running sync job to stop after the current page"""
+    job = database.get_sync_job(job_id)
+    if job is None:
+        return jsonify({"error": "Sync job not found"}), 404
+    if job['status'] not in database.SYNC_JOB_ACTIVE_STATUSES:
+        return jsonify({"error": f"Sync job is already {job['status']}"}), 409
+    database.update_sync_job(job_id, cancel_requested=1)
+    event = _sync_job_events.get(job_id)
+    if event is not None:
+        event.set()
+    return jsonify({"job": sync_job_status(database.get_sync_job(job_id))}), 202
+
 @app.route('/create_database', methods=['POST'])
 @token_required
 def create_database():
     app.logger.debug(f"=== FUNCTION APP: create_database ===")
-    """Create/update the database with all photos from the API"""
+    """Start a background create/update of the database (non-JS form fallback)"""
     try:
         credentials = get_credentials()
-        
-        # Fetch all photos from the API
-        photos_list = fetch_all_photos(credentials, page_size=100)
-        
-        # Get database statistics
-        stats = database.get_db_stats()
-        
-        flash(f"Successfully created database with {stats['photo_count']} photos", "success")
+        job_id, active = start_sync_job(credentials)
+        if job_id is None:
+            flash("A database sync is already running.", "warning")
+        else:
+            flash("Database sync started. Progress is shown below.", "success")
     except Exception as e:
         app.logger.error(f"Error creating database: {str(e)}")
         flash(f"Error creating database: {str(e)}", "error")
@@ -2958,6 +3798,17 @@ def init_app():
         # Initialize logging and configure application
         setup_logging(app, config)
 
+        # Size the shared HTTP pools/timeouts (older config.json files have no 'http' block).
+        # Upload queue workers share the pools with the request threads.
+        upload_queue.configure(config['uploads'])
+        http_settings = dict(config['api'].get('http', {}))
+        http_settings['pool_maxsize'] = (http_settings.get('pool_maxsize') or api_client.pool_maxsize) \
+            + upload_queue.queue_workers
+        api_client.configure(http_settings)
+
+        # SQLite connection tuning (also absent from older config.json files)
+        database.configure(config.get('database', {}))
+
         # Configure Flask application
         flask_secret = os.getenv('FLASK_SECRET_KEY')
         if not flask_secret:
@@ -3003,6 +3854,18 @@ def init_app():
         if not os.path.exists(config['uploads']['directory']):
             os.makedirs(config['uploads']['directory'])
 
+        # Bring an existing database schema up to date, release any sync job
+        # or upload a previous process left marked as running, and import the
+        # JSON upload records of older versions into the upload ledger once.
+        has_upload_records = any(name.endswith('.json') for name in os.listdir(config['uploads']['directory']))
+        if os.path.exists(database.DATABASE_PATH) or has_upload_records:
+            try:
+                init_upload_ledger()
+                database.mark_interrupted_sync_jobs()
+                database.mark_interrupted_upload_jobs()
+            except Exception as e:
+                app.logger.error(f"Error preparing database at startup: {str(e)}")
+
         # Log application configuration
         app.logger.info("StreetView application configured")
         app.logger.info(f"Environment: debug={app.config['DEBUG']}")
@@ -3012,7 +3875,7 @@ def init_app():
 @app.route('/check_upload_status', methods=['POST'])
 @token_required
 def check_upload_status():
-    """Check if files have already been uploaded by checking JSON files in uploads folder"""
+    """Check if files have already been uploaded, by filename stem, in the upload ledger"""
     app.logger.debug(f"=== FUNCTION APP: check_upload_status ===")
     
     try:
@@ -3022,59 +3885,25 @@ def check_upload_status():
         if not filenames:
             return jsonify({"error": "No filenames provided"}), 400
         
+        stems = {filename: os.path.splitext(os.path.basename(str(filename)))[0] for filename in filenames}
+        # One indexed query for the whole batch
+        uploads = database.get_uploads_by_stems(set(stems.values())) \
+            if os.path.exists(database.DATABASE_PATH) else {}
+
         upload_statuses = {}
-        uploads_directory = config['uploads']['directory']
-        
-        if not os.path.exists(uploads_directory):
-            # If uploads directory doesn't exist, all files are new
-            for filename in filenames:
+        for filename, stem in stems.items():
+            upload = uploads.get(stem)
+            if upload is None:
                 upload_statuses[filename] = {"uploaded": False}
-            return jsonify(upload_statuses)
-        
-        # Check each filename against existing JSON files
-        for filename in filenames:
-            base_filename = os.path.splitext(filename)[0]
-            upload_statuses[filename] = {"uploaded": False}
-            
-            # Look for JSON files that match this filename
-            for json_file in os.listdir(uploads_directory):
-                if json_file.endswith('.json'):
-                    json_base = os.path.splitext(json_file)[0]
-                    
-                    # Check if this JSON file corresponds to the uploaded image
-                    # Handle both exact matches and numbered versions (filename_1.json, etc.)
-                    if json_base == base_filename or json_base.startswith(f"{base_filename}_"):
-                        try:
-                            json_path = os.path.join(uploads_directory, json_file)
-                            with open(json_path, 'r') as f:
-                                json_data = json.load(f)
-                                
-                            # Check if this file was successfully uploaded
-                            maps_status = json_data.get('mapsPublishStatus', '')
-                            if maps_status == 'PUBLISHED':
-                                upload_statuses[filename] = {
-                                    "uploaded": True,
-                                    "status": "PUBLISHED",
-                                    "photoId": json_data.get('photoId', {}).get('id', ''),
-                                    "shareLink": json_data.get('shareLink', ''),
-                                    "uploadTime": json_data.get('uploadTime', ''),
-                                    "jsonFile": json_file
-                                }
-                                break  # Found a successful upload, no need to check other JSON files
-                            else:
-                                # File was uploaded but not successfully published
-                                upload_statuses[filename] = {
-                                    "uploaded": True,
-                                    "status": maps_status or "UNKNOWN",
-                                    "photoId": json_data.get('photoId', {}).get('id', ''),
-                                    "shareLink": json_data.get('shareLink', ''),
-                                    "uploadTime": json_data.get('uploadTime', ''),
-                                    "jsonFile": json_file
-                                }
-                                
-                        except (json.JSONDecodeError, IOError) as e:
-                            app.logger.warning(f"Error reading JSON file {json_file}: {str(e)}")
-                            continue
+                continue
+            upload_statuses[filename] = {
+                "uploaded": True,
+                "status": upload['maps_publish_status'] or "UNKNOWN",
+                "photoId": upload['photo_id'] or '',
+                "shareLink": upload['share_link'] or '',
+                "uploadTime": upload['upload_time'] or '',
+                "jsonFile": upload['json_file'] or ''
+            }
         
         app.logger.info(f"Checked upload status for {len(filenames)} files")
         return jsonify(upload_statuses)
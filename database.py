@@ -1,7 +1,16 @@
 import os
+import re
 import sqlite3
 import json
 import logging
+import itertools
+import hashlib
+import threading
+import urllib.parse
+import math
+import base64
+import shutil
+import struct
 from datetime import datetime
 
 # Set up database-specific logger
@@ -14,6 +23,102 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_PATH = os.path.join(BASE_DIR, 'userdata', 'data', 'streetview_photos.db')
 logger.info(f"Database - Database path set to: {DATABASE_PATH}")
 
+# Connection settings, overridable from the 'database' block of config.json
+# via configure(). cache_size is in KiB, mmap_size in bytes.
+DB_SETTINGS = {
+    'cache_size_kb': 16384,
+    'mmap_size': 268435456,
+    'busy_timeout_ms': 5000,
+}
+
+_local = threading.local()
+_settings_generation = 0
+
+def configure(settings):
+    """Apply connection settings; existing pooled connections are reopened on next use."""
+    for key in DB_SETTINGS:
+        if key in settings:
+            DB_SETTINGS[key] = int(settings[key])
+    global _settings_generation
+    _settings_generation += 1
+    logger.info(f"Database - Connection settings: {DB_SETTINGS}")
+
+def _open_connection(path, readonly):
+    """Open and tune a new SQLite connection."""
+    if readonly:
+        uri = 'file:' + urllib.parse.quote(os.path.abspath(path)) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, timeout=DB_SETTINGS['busy_timeout_ms'] / 1000)
+    else:
+        conn = sqlite3.connect(path, timeout=DB_SETTINGS['busy_timeout_ms'] / 1000)
+        # WAL lets page reads proceed while a sync is writing; NORMAL is
+        # durable across application crashes, which is all we need here
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+    conn.row_factory = sqlite3.Row
+    conn.create_function('haversine', 4, haversine_distance, deterministic=True)
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute(f"PRAGMA cache_size = -{DB_SETTINGS['cache_size_kb']}")
+    conn.execute(f"PRAGMA mmap_size = {DB_SETTINGS['mmap_size']}")
+    conn.execute(f"PRAGMA busy_timeout = {DB_SETTINGS['busy_timeout_ms']}")
+    return conn
+
+def get_connection(readonly=False):
+    """
+    Return this thread's pooled connection to DATABASE_PATH.
+
+    Connections are reused for the life of the thread, so callers must not
+    close them and must commit or roll back before returning. Rows come back
+    as sqlite3.Row and foreign keys are enforced.
+
+    Args:
+        readonly: Open the database with mode=ro (for page queries)
+    """
+    key = (DATABASE_PATH, readonly)
+    pool = getattr(_local, 'connections', None)
+    if pool is None or getattr(_local, 'settings_generation', None) != _settings_generation:
+        close_connections()
+        pool = _local.connections = {}
+        _local.settings_generation = _settings_generation
+    elif pool and next(iter(pool))[0] != DATABASE_PATH:
+        # DATABASE_PATH changed (e.g. in tests); drop connections to the old file
+        close_connections()
+        pool = _local.connections = {}
+
+    conn = pool.get(key)
+    if conn is None:
+        conn = pool[key] = _open_connection(DATABASE_PATH, readonly)
+    elif conn.in_transaction:
+        logger.warning("Database - Rolling back transaction left open on pooled connection")
+        conn.rollback()
+    return conn
+
+def close_connections():
+    """Close this thread's pooled connections."""
+    pool = getattr(_local, 'connections', None) or {}
+    for conn in pool.values():
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.connections = {}
+    _local.caches = None
+
+def _thread_cache(name):
+    """
+    Return (read-only connection, cache dict) for this thread, where the dict
+    is emptied whenever the database changes.
+
+    Change detection uses PRAGMA data_version on the read-only connection: it
+    moves when any other connection commits, and every write goes through a
+    read-write connection, so one pragma per call is enough.
+    """
+    conn = get_connection(readonly=True)
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    state = getattr(_local, 'caches', None)
+    if state is None or state[0] is not conn or state[1] != version:
+        state = _local.caches = (conn, version, {})
+    return conn, state[2].setdefault(name, {})
+
 def ensure_db_directory():
     """Ensure the database directory exists"""
     db_dir = os.path.dirname(DATABASE_PATH)
@@ -21,16 +126,238 @@ def ensure_db_directory():
         os.makedirs(db_dir, exist_ok=True)
         logger.info(f"Database - Created database directory: {db_dir}")
 
+def _ensure_column(cursor, table, column, definition):
+    """
+    Add a column to an existing table if it is missing (lightweight migration).
+
+    Returns:
+        True if the column was added
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column in {row[1] for row in cursor.fetchall()}:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info(f"Database - Added column {table}.{column}")
+    return True
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def _init_spatial_index(cursor):
+    """
+    Create the photos_rtree R*Tree over photo coordinates and the triggers
+    that keep it in step with photos. Entries are keyed on photos.rowid.
+
+    The index is filled from photos only when it is first created, which
+    covers databases created before it existed; after that the triggers keep
+    it in step, so init_db does not rescan photos.
+    """
+    created = not _table_exists(cursor, 'photos_rtree')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS photos_rtree USING rtree (
+        id, min_lat, max_lat, min_lng, max_lng
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS photos_rtree_insert AFTER INSERT ON photos
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO photos_rtree VALUES (new.rowid, new.latitude, new.latitude, new.longitude, new.longitude);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS photos_rtree_update AFTER UPDATE OF latitude, longitude ON photos
+    BEGIN
+        DELETE FROM photos_rtree WHERE id = old.rowid;
+        INSERT INTO photos_rtree
+        SELECT new.rowid, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS photos_rtree_delete AFTER DELETE ON photos
+    BEGIN
+        DELETE FROM photos_rtree WHERE id = old.rowid;
+    END
+    ''')
+
+    if created:
+        cursor.execute('''
+        INSERT INTO photos_rtree
+        SELECT rowid, latitude, latitude, longitude, longitude FROM photos
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+        logger.info(f"Database - Built spatial index for {cursor.rowcount} photos")
+
+# Distinct place labels of one photo in first-seen order; bind or correlate :photo_id
+_PLACE_NAMES_OF_PHOTO_SQL = '''
+    SELECT GROUP_CONCAT(label) FROM (
+        SELECT COALESCE(name, place_id) AS label FROM places
+        WHERE photo_id = {photo_id} AND COALESCE(name, place_id) IS NOT NULL
+        GROUP BY label ORDER BY MIN(id)
+    )'''
+
+def _init_photo_aggregates(cursor, backfill=False):
+    """
+    Create the triggers that keep photos.place_names and
+    photos.connection_count in step with the places and connections tables,
+    so the photos table can sort and page on them through plain indexes.
+
+    place_names is the comma-separated list of distinct place labels (name,
+    else place ID) and connection_count the number of outgoing connections.
+
+    Args:
+        backfill: Recompute both columns for every photo (used once, when the
+            columns are first added to an existing database)
+    """
+    def place_names_of(ref):
+        return _PLACE_NAMES_OF_PHOTO_SQL.format(photo_id=ref)
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS places_names_insert AFTER INSERT ON places
+    BEGIN
+        UPDATE photos SET place_names = ({place_names_of('new.photo_id')}) WHERE photo_id = new.photo_id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS places_names_delete AFTER DELETE ON places
+    BEGIN
+        UPDATE photos SET place_names = ({place_names_of('old.photo_id')}) WHERE photo_id = old.photo_id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS places_names_update AFTER UPDATE OF photo_id, place_id, name ON places
+    BEGIN
+        UPDATE photos SET place_names = ({place_names_of('old.photo_id')}) WHERE photo_id = old.photo_id;
+        UPDATE photos SET place_names = ({place_names_of('new.photo_id')}) WHERE photo_id = new.photo_id;
+    END
+    ''')
+    # connections is UNIQUE (source, target), so one row is one distinct target
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS connections_count_insert AFTER INSERT ON connections
+    BEGIN
+        UPDATE photos SET connection_count = connection_count + 1 WHERE photo_id = new.source_photo_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS connections_count_delete AFTER DELETE ON connections
+    BEGIN
+        UPDATE photos SET connection_count = connection_count - 1 WHERE photo_id = old.source_photo_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS connections_count_update AFTER UPDATE OF source_photo_id ON connections
+    BEGIN
+        UPDATE photos SET connection_count = connection_count - 1 WHERE photo_id = old.source_photo_id;
+        UPDATE photos SET connection_count = connection_count + 1 WHERE photo_id = new.source_photo_id;
+    END
+    ''')
+
+    if backfill:
+        cursor.execute(f'''
+        UPDATE photos SET
+            place_names = ({place_names_of('photos.photo_id')}),
+            connection_count = (SELECT COUNT(*) FROM connections c WHERE c.source_photo_id = photos.photo_id)
+        ''')
+        logger.info(f"Database - Backfilled place names and connection counts for {cursor.rowcount} photos")
+
+# Shortest search term the trigram index can answer; shorter ones use LIKE
+PLACE_SEARCH_MIN_CHARS = 3
+
+def _init_place_search(cursor):
+    """
+    Create the places_fts trigram index over place labels (name, else place
+    ID, as shown in the photos table) and the triggers that keep it in step
+    with places. It is contentless and keyed on places.id.
+
+    The index is filled from places only when it is first created, which
+    covers databases created before it existed.
+    """
+    label = "COALESCE({row}.name, {row}.place_id)"
+    created = not _table_exists(cursor, 'places_fts')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS places_fts USING fts5 (
+        label, content='', tokenize='trigram'
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS places_fts_insert AFTER INSERT ON places
+    BEGIN
+        INSERT INTO places_fts (rowid, label) VALUES (new.id, {label.format(row='new')});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS places_fts_update AFTER UPDATE OF place_id, name ON places
+    BEGIN
+        INSERT INTO places_fts (places_fts, rowid, label) VALUES ('delete', old.id, {label.format(row='old')});
+        INSERT INTO places_fts (rowid, label) VALUES (new.id, {label.format(row='new')});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS places_fts_delete AFTER DELETE ON places
+    BEGIN
+        INSERT INTO places_fts (places_fts, rowid, label) VALUES ('delete', old.id, {label.format(row='old')});
+    END
+    ''')
+
+    if created:
+        cursor.execute(f"INSERT INTO places_fts (rowid, label) SELECT id, {label.format(row='places')} FROM places")
+        logger.info(f"Database - Built place search index for {cursor.rowcount} places")
+
+# Photo columns shown in map tiles; updating any of them invalidates the tile
+TILE_COLUMNS = ('latitude', 'longitude', 'place_names', 'maps_publish_status', 'capture_time',
+                'share_link', 'thumbnail_url')
+
+def _init_tile_changes(cursor):
+    """
+    Create the tile_changes log and the triggers that append the old and new
+    position of every photo write that can alter a map tile. The tile cache
+    drains it to delete only the cached tiles covering those positions.
+
+    A database without the log (new, or created before tiles were cached) may
+    not match tiles left on disk, so the tile cache is dropped in that case.
+    """
+    if not _table_exists(cursor, 'tile_changes'):
+        clear_tile_cache()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tile_changes (
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS photos_tiles_insert AFTER INSERT ON photos
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+    BEGIN
+        INSERT INTO tile_changes VALUES (new.latitude, new.longitude);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS photos_tiles_update AFTER UPDATE OF {', '.join(TILE_COLUMNS)} ON photos
+    BEGIN
+        INSERT INTO tile_changes
+        SELECT old.latitude, old.longitude WHERE old.latitude IS NOT NULL AND old.longitude IS NOT NULL;
+        INSERT INTO tile_changes
+        SELECT new.latitude, new.longitude WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+        AND (new.latitude IS NOT old.latitude OR new.longitude IS NOT old.longitude);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS photos_tiles_delete AFTER DELETE ON photos
+    WHEN old.latitude IS NOT NULL AND old.longitude IS NOT NULL
+    BEGIN
+        INSERT INTO tile_changes VALUES (old.latitude, old.longitude);
+    END
+    ''')
+
 def init_db():
     """Initialize the SQLite database with necessary tables"""
     ensure_db_directory()
     
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
-    # Enable foreign key constraints
-    cursor.execute('PRAGMA foreign_keys = ON')
-    
     # Create photos table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS photos (
@@ -47,10 +374,19 @@ def init_db():
         maps_publish_status TEXT,
         share_link TEXT,
         thumbnail_url TEXT,
-        updated_at TEXT
+        updated_at TEXT,
+        content_hash TEXT,
+        place_names TEXT,
+        connection_count INTEGER NOT NULL DEFAULT 0
     )
     ''')
     
+    # Columns added after the original schema; older databases get them here
+    _ensure_column(cursor, 'photos', 'content_hash', 'TEXT')
+    # Denormalized from places/connections by the triggers in _init_photo_aggregates
+    added_place_names = _ensure_column(cursor, 'photos', 'place_names', 'TEXT')
+    added_connection_count = _ensure_column(cursor, 'photos', 'connection_count', 'INTEGER NOT NULL DEFAULT 0')
+
     # Create places table (one photo can have multiple places)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS places (
@@ -78,74 +414,179 @@ def init_db():
 
     # Create indexes for common query patterns
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_lat_lng ON photos (latitude, longitude)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_upload_time ON photos (upload_time)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_maps_publish_status ON photos (maps_publish_status)')
+    # Composite (sort column, photo_id) indexes back keyset pagination of the
+    # photos table; they supersede the old single-column indexes
+    cursor.execute('DROP INDEX IF EXISTS idx_photos_upload_time')
+    cursor.execute('DROP INDEX IF EXISTS idx_photos_maps_publish_status')
+    for column in TABLE_SORT_INDEXED_COLUMNS:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_photos_{column}_id ON photos ({column}, photo_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_places_photo_id ON places (photo_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_connections_source ON connections (source_photo_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_connections_target ON connections (target_photo_id)')
 
+    _init_spatial_index(cursor)
+    _init_photo_aggregates(cursor, backfill=added_place_names or added_connection_count)
+    _init_place_search(cursor)
+    _init_tile_changes(cursor)
+
+    # Staging area for connections seen during a sync; resolved against photos
+    # once every page is loaded so links never depend on API page order
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_pending_connections (
+        source_photo_id TEXT NOT NULL,
+        target_photo_id TEXT NOT NULL,
+        PRIMARY KEY (source_photo_id, target_photo_id)
+    ) WITHOUT ROWID
+    ''')
+
+    # Background sync jobs (persisted so progress survives a worker restart)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        pages_fetched INTEGER DEFAULT 0,
+        photos_fetched INTEGER DEFAULT 0,
+        rows_upserted INTEGER DEFAULT 0,
+        rows_inserted INTEGER DEFAULT 0,
+        rows_changed INTEGER DEFAULT 0,
+        rows_unchanged INTEGER DEFAULT 0,
+        rows_deleted INTEGER DEFAULT 0,
+        expected_total INTEGER,
+        cancel_requested INTEGER DEFAULT 0,
+        error TEXT,
+        created_at TEXT,
+        started_at TEXT,
+        updated_at TEXT,
+        finished_at TEXT
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_jobs_status ON sync_jobs (status)')
+
+    # Server-side batch uploads: one row per job, one per file in the job
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS upload_jobs (
+        job_id TEXT PRIMARY KEY,
+        file_count INTEGER NOT NULL,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS upload_job_files (
+        job_id TEXT NOT NULL,
+        file_index INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        heading REAL,
+        place_id TEXT,
+        capture_time TEXT,
+        status TEXT NOT NULL,
+        size INTEGER,
+        attempts INTEGER DEFAULT 0,
+        photo_id TEXT,
+        share_link TEXT,
+        error TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        PRIMARY KEY (job_id, file_index)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_job_files_status ON upload_job_files (status)')
+
+    # Ledger of uploaded photos, looked up by original filename stem (upload
+    # status of a batch) and photo ID (filenames, deletes). content_hash
+    # records the original bytes of each upload
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS uploads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename_stem TEXT NOT NULL,
+        filename TEXT,
+        content_hash TEXT,
+        photo_id TEXT UNIQUE,
+        maps_publish_status TEXT,
+        share_link TEXT,
+        upload_time TEXT,
+        json_file TEXT,
+        created_at TEXT
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_uploads_filename_stem ON uploads (filename_stem)')
+
+    # One-time data migrations that have been applied to this database
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS migrations (
+        name TEXT PRIMARY KEY,
+        applied_at TEXT
+    )
+    ''')
+
     conn.commit()
-    conn.close()
     
     logger.info("Database - Database initialized successfully")
     return True
 
-def insert_or_update_photo(photo_data):
-    """Insert or update a photo record in the database"""
-    logger.debug(f"=== FUNCTION DB: insert_or_update_photo ===")
+# Rows per bulk-upsert transaction and bound parameters per IN (...) lookup
+UPSERT_CHUNK_SIZE = 500
+SQL_VARIABLE_CHUNK = 900
+
+PHOTO_COLUMNS = ('photo_id', 'latitude', 'longitude', 'heading', 'altitude', 'pitch', 'roll',
+                 'capture_time', 'upload_time', 'view_count', 'maps_publish_status',
+                 'share_link', 'thumbnail_url', 'updated_at', 'content_hash')
+
+# Per-chunk outcome counters reported by upsert_photos()
+UPSERT_COUNT_KEYS = ('inserted', 'changed', 'unchanged')
+
+_UPSERT_PHOTO_SQL = '''
+INSERT INTO photos ({columns}) VALUES ({placeholders})
+ON CONFLICT (photo_id) DO UPDATE SET {assignments}
+'''.format(
+    columns=', '.join(PHOTO_COLUMNS),
+    placeholders=', '.join('?' for _ in PHOTO_COLUMNS),
+    assignments=', '.join(f"{c} = excluded.{c}" for c in PHOTO_COLUMNS[1:]),
+)
+
+def _pose_float(value):
+    """Convert an API pose value to float, mapping 'NaN' and junk to None"""
+    if isinstance(value, str) and value.lower() == 'nan':
+        return None
+    try:
+        return float(value) if value is not None else None
+    except (ValueError, TypeError):
+        return None
+
+def photo_content_hash(photo_data):
+    """
+    Digest of an API photo payload, used to skip rewriting unchanged photos.
+
+    viewCount is left out because it changes on almost every sync; it is
+    applied separately with a narrow UPDATE.
+    """
+    payload = {k: v for k, v in photo_data.items() if k != 'viewCount'}
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+def _photo_row(photo_data, updated_at):
+    """
+    Flatten an API photo dict into a photos table row (in PHOTO_COLUMNS order).
+
+    Returns:
+        The row tuple, or None if the photo has no photoId
+    """
     if not photo_data or 'photoId' not in photo_data or 'id' not in photo_data['photoId']:
-        logger.warning("Database - Invalid photo data: missing photoId")
-        return False
-    
-    photo_id = photo_data['photoId']['id']
-    
-    logger.debug(f"=== DATABASE DEBUG: Processing photo {photo_id} ===")
-    logger.debug(f"Input captureTime: {photo_data.get('captureTime', 'N/A')}")
-    logger.debug(f"Input uploadTime: {photo_data.get('uploadTime', 'N/A')}")
-    logger.debug(f"Input viewCount: {photo_data.get('viewCount', 'N/A')}")
-    
-    # Extract pose data
-    latitude = None
-    longitude = None
-    heading = None
-    altitude = None
-    pitch = None
-    roll = None
-    
-    if 'pose' in photo_data:
-        pose = photo_data['pose']
+        return None
+
+    latitude = longitude = heading = altitude = pitch = roll = None
+    pose = photo_data.get('pose')
+    if pose:
         if 'latLngPair' in pose:
             latitude = pose['latLngPair'].get('latitude')
             longitude = pose['latLngPair'].get('longitude')
-        
-        # Convert NaN string values to None
-        heading_val = pose.get('heading')
-        if isinstance(heading_val, str) and heading_val.lower() == 'nan':
-            heading = None
-        else:
-            try:
-                heading = float(heading_val) if heading_val is not None else None
-            except (ValueError, TypeError):
-                heading = None
-        
-        # Handle other pose attributes similarly
-        for attr in ['altitude', 'pitch', 'roll']:
-            val = pose.get(attr)
-            if isinstance(val, str) and val.lower() == 'nan':
-                pose[attr] = None
-            else:
-                try:
-                    pose[attr] = float(val) if val is not None else None
-                except (ValueError, TypeError):
-                    pose[attr] = None
-        
-        altitude = pose.get('altitude')
-        pitch = pose.get('pitch')
-        roll = pose.get('roll')
-    
-    # Extract other data
-    capture_time = photo_data.get('captureTime')
-    upload_time = photo_data.get('uploadTime')
+        heading = _pose_float(pose.get('heading'))
+        altitude = _pose_float(pose.get('altitude'))
+        pitch = _pose_float(pose.get('pitch'))
+        roll = _pose_float(pose.get('roll'))
+
     view_count = photo_data.get('viewCount')
     if view_count and isinstance(view_count, str):
         view_count = view_count.replace(',', '')  # Remove commas from view count
@@ -153,355 +594,652 @@ def insert_or_update_photo(photo_data):
             view_count = int(view_count)
         except ValueError:
             view_count = 0
-    
-    maps_publish_status = photo_data.get('mapsPublishStatus')
-    share_link = photo_data.get('shareLink')
-    thumbnail_url = photo_data.get('thumbnailUrl')
+
+    return (
+        photo_data['photoId']['id'], latitude, longitude, heading, altitude, pitch, roll,
+        photo_data.get('captureTime'), photo_data.get('uploadTime'), view_count,
+        photo_data.get('mapsPublishStatus'), photo_data.get('shareLink'),
+        photo_data.get('thumbnailUrl'), updated_at, photo_content_hash(photo_data)
+    )
+
+def _existing_photo_ids(cursor, photo_ids):
+    """Return the subset of photo_ids present in the photos table (set-based lookup)"""
+    photo_ids = list(photo_ids)
+    existing = set()
+    for i in range(0, len(photo_ids), SQL_VARIABLE_CHUNK):
+        batch = photo_ids[i:i + SQL_VARIABLE_CHUNK]
+        placeholders = ','.join('?' for _ in batch)
+        cursor.execute(f"SELECT photo_id FROM photos WHERE photo_id IN ({placeholders})", batch)
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+def _upsert_chunk(cursor, photos, defer_connections=False):
+    """
+    Write one chunk of API photos with executemany calls. The caller owns the
+    transaction.
+
+    Photos whose content_hash matches the stored one are not rewritten; only
+    a changed view count is updated. For new and changed photos, places and
+    connections are replaced when the payload includes them, and connections
+    are only stored when the target photo exists. With defer_connections,
+    connections are written to sync_pending_connections instead, for
+    resolve_pending_connections() to apply later.
+
+    Returns:
+        Dict of inserted / changed / unchanged counts
+    """
     updated_at = datetime.now().isoformat()
-    
-    conn = sqlite3.connect(DATABASE_PATH)
+
+    # Last occurrence wins if the same photo appears twice in a chunk
+    by_id = {}
+    for photo_data in photos:
+        row = _photo_row(photo_data, updated_at)
+        if row is None:
+            logger.warning("Database - Invalid photo data: missing photoId")
+            continue
+        by_id[row[0]] = (row, photo_data)
+    counts = dict.fromkeys(UPSERT_COUNT_KEYS, 0)
+    if not by_id:
+        return counts
+
+    stored = {}
+    photo_ids = list(by_id)
+    for i in range(0, len(photo_ids), SQL_VARIABLE_CHUNK):
+        batch = photo_ids[i:i + SQL_VARIABLE_CHUNK]
+        placeholders = ','.join('?' for _ in batch)
+        cursor.execute(f"SELECT photo_id, content_hash, view_count FROM photos WHERE photo_id IN ({placeholders})", batch)
+        stored.update((row[0], (row[1], row[2])) for row in cursor.fetchall())
+
+    view_col = PHOTO_COLUMNS.index('view_count')
+    hash_col = PHOTO_COLUMNS.index('content_hash')
+    view_updates = []
+    for pid in photo_ids:
+        row, _ = by_id[pid]
+        if pid not in stored:
+            counts['inserted'] += 1
+        elif stored[pid][0] != row[hash_col]:
+            counts['changed'] += 1
+        else:
+            counts['unchanged'] += 1
+            if stored[pid][1] != row[view_col]:
+                view_updates.append((row[view_col], pid))
+            del by_id[pid]
+
+    if view_updates:
+        cursor.executemany("UPDATE photos SET view_count = ? WHERE photo_id = ?", view_updates)
+    if not by_id:
+        return counts
+
+    cursor.executemany(_UPSERT_PHOTO_SQL, [row for row, _ in by_id.values()])
+
+    with_places = [(pid, data['places']) for pid, (_, data) in by_id.items() if data.get('places')]
+    if with_places:
+        cursor.executemany("DELETE FROM places WHERE photo_id = ?", [(pid,) for pid, _ in with_places])
+        cursor.executemany('''
+        INSERT OR IGNORE INTO places (photo_id, place_id, name, language_code)
+        VALUES (?, ?, ?, ?)
+        ''', [
+            (pid, place.get('placeId'), place.get('name'), place.get('languageCode'))
+            for pid, places in with_places for place in places
+        ])
+
+    with_connections = [(pid, data['connections']) for pid, (_, data) in by_id.items() if data.get('connections')]
+    if with_connections:
+        pairs = [
+            (pid, connection['target']['id'])
+            for pid, connections in with_connections for connection in connections
+            if 'target' in connection and 'id' in connection['target']
+        ]
+        if defer_connections:
+            cursor.executemany("DELETE FROM sync_pending_connections WHERE source_photo_id = ?",
+                               [(pid,) for pid, _ in with_connections])
+            cursor.executemany('''
+            INSERT OR IGNORE INTO sync_pending_connections (source_photo_id, target_photo_id)
+            VALUES (?, ?)
+            ''', pairs)
+            return counts
+
+        cursor.executemany("DELETE FROM connections WHERE source_photo_id = ?",
+                           [(pid,) for pid, _ in with_connections])
+        existing = _existing_photo_ids(cursor, {target for _, target in pairs})
+        valid = [pair for pair in pairs if pair[1] in existing]
+        if len(valid) < len(pairs):
+            logger.debug(f"=== DATABASE DEBUG CONNECTIONS: Skipped {len(pairs) - len(valid)} connections with targets not in database ===")
+        cursor.executemany('''
+        INSERT OR IGNORE INTO connections (source_photo_id, target_photo_id)
+        VALUES (?, ?)
+        ''', valid)
+
+    return counts
+
+def upsert_photos(photos, chunk_size=UPSERT_CHUNK_SIZE, defer_connections=False, counts=None):
+    """
+    Bulk insert or update API photo dicts, one transaction per chunk.
+
+    Args:
+        photos: Iterable of photo dicts as returned by the Street View Publish API
+        chunk_size: Number of photos written per transaction
+        defer_connections: Stage connections for resolve_pending_connections()
+            instead of linking them now (used when later photos may be targets)
+        counts: Optional dict; inserted / changed / unchanged totals are added to it
+
+    Returns:
+        Number of photos stored, unchanged ones included. If a chunk fails, its photos are retried one
+        at a time so a single bad record does not drop the whole chunk.
+    """
+    logger.debug(f"=== FUNCTION DB: upsert_photos ===")
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    stored = 0
+    totals = dict.fromkeys(UPSERT_COUNT_KEYS, 0)
+
+    def add(chunk_counts):
+        for key, value in chunk_counts.items():
+            totals[key] += value
+        return sum(chunk_counts.values())
+
+    iterator = iter(photos)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        try:
+            chunk_counts = _upsert_chunk(cursor, chunk, defer_connections)
+            conn.commit()
+            stored += add(chunk_counts)
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"Database - Bulk upsert of {len(chunk)} photos failed, retrying individually: {str(e)}")
+            for photo_data in chunk:
+                try:
+                    chunk_counts = _upsert_chunk(cursor, [photo_data], defer_connections)
+                    conn.commit()
+                    stored += add(chunk_counts)
+                except Exception as e:
+                    photo_id = (photo_data.get('photoId') or {}).get('id') if isinstance(photo_data, dict) else None
+                    logger.error(f"Database - Error inserting/updating photo {photo_id}: {str(e)}")
+                    conn.rollback()
+    if counts is not None:
+        for key, value in totals.items():
+            counts[key] = counts.get(key, 0) + value
+    return stored
+
+def clear_pending_connections():
+    """Discard staged connections left over from an interrupted sync or import"""
+    logger.debug(f"=== FUNCTION DB: clear_pending_connections ===")
+    conn = get_connection()
+    conn.execute("DELETE FROM sync_pending_connections")
+    conn.commit()
+
+def resolve_pending_connections():
+    """
+    Apply staged connections in one set-based pass.
+
+    Every source photo with staged connections has its connections replaced by
+    the staged pairs whose source and target both exist in photos. Staging is
+    emptied in the same transaction.
+
+    Returns:
+        Number of connections stored, or None on error
+    """
+    logger.debug(f"=== FUNCTION DB: resolve_pending_connections ===")
+    conn = get_connection()
     cursor = conn.cursor()
-    
-    # Enable foreign key constraints
-    cursor.execute('PRAGMA foreign_keys = ON')
-    
     try:
-        # DEBUG: Log final values being written to database
-        logger.debug("=========================================================")
-        logger.debug(f"=== DATABASE DEBUG: Final values for photo {photo_id} ===")
-        logger.debug(f"=Final capture_time: {capture_time}")
-        logger.debug(f"=Final upload_time: {upload_time}")
-        logger.debug(f"=Final view_count: {view_count}")
-        logger.debug(f"=Final maps_publish_status: {maps_publish_status}")
-        logger.debug(f"=Final share_link: {share_link}")
-        logger.debug(f"=Final thumbnail_url: {thumbnail_url}")
-        logger.debug(f"=Final updated_at: {updated_at}")
-        logger.debug(f"=Final coordinates: lat={latitude}, lng={longitude}, heading={heading}")
-        
-        # Insert or update the photo record
         cursor.execute('''
-        INSERT OR REPLACE INTO photos (
-            photo_id, latitude, longitude, heading, altitude, pitch, roll,
-            capture_time, upload_time, view_count, maps_publish_status,
-            share_link, thumbnail_url, updated_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            photo_id, latitude, longitude, heading, altitude, pitch, roll,
-            capture_time, upload_time, view_count, maps_publish_status,
-            share_link, thumbnail_url, updated_at
-        ))
-        
-        # Handle places
-        if 'places' in photo_data and photo_data['places']:
-            # Delete existing places for this photo
-            cursor.execute("DELETE FROM places WHERE photo_id = ?", (photo_id,))
-            
-            # Insert new places
-            for place in photo_data['places']:
-                cursor.execute('''
-                INSERT INTO places (photo_id, place_id, name, language_code)
-                VALUES (?, ?, ?, ?)
-                ''', (
-                    photo_id,
-                    place.get('placeId'),
-                    place.get('name'),
-                    place.get('languageCode')
-                ))
-        
-        # Handle connections
-        if 'connections' in photo_data and photo_data['connections']:
-            logger.debug(f"=== DATABASE DEBUG CONNECTIONS: Processing {len(photo_data['connections'])} connections for photo {photo_id} ===")
-            # Delete existing connections for this photo
-            cursor.execute("DELETE FROM connections WHERE source_photo_id = ?", (photo_id,))
-            
-            # Insert new connections with validation
-            connections_added = 0
-            connections_skipped = 0
-            for connection in photo_data['connections']:
-                if 'target' in connection and 'id' in connection['target']:
-                    target_id = connection['target']['id']
-                    logger.debug(f"=== DATABASE DEBUG CONNECTIONS: Adding connection {photo_id} -> {target_id} ===")
-                    
-                    # First check if target photo exists
-                    cursor.execute("SELECT 1 FROM photos WHERE photo_id = ?", (target_id,))
-                    target_exists = cursor.fetchone()
-                    
-                    if target_exists:
-                        try:
-                            cursor.execute('''
-                            INSERT OR IGNORE INTO connections (source_photo_id, target_photo_id)
-                            VALUES (?, ?)
-                            ''', (photo_id, target_id))
-                            connections_added += 1
-                            logger.debug(f"=== DATABASE DEBUG CONNECTIONS: Successfully added connection {photo_id} -> {target_id} ===")
-                        except sqlite3.IntegrityError as e:
-                            logger.warning(f"=== DATABASE DEBUG CONNECTIONS: Failed to add connection {photo_id} -> {target_id}: {e} ===")
-                            connections_skipped += 1
-                    else:
-                        logger.warning(f"=== DATABASE DEBUG CONNECTIONS: Skipping connection {photo_id} -> {target_id} - target photo not found in database ===")
-                        connections_skipped += 1
-            
-            logger.debug(f"=== DATABASE DEBUG CONNECTIONS: Added {connections_added} connections, skipped {connections_skipped} for photo {photo_id} ===")
-        else:
-            logger.debug(f"=== DATABASE DEBUG CONNECTIONS: No connections to process for photo {photo_id} ===")
-        
+        DELETE FROM connections
+        WHERE source_photo_id IN (SELECT DISTINCT source_photo_id FROM sync_pending_connections)
+        ''')
+        cursor.execute('''
+        INSERT OR IGNORE INTO connections (source_photo_id, target_photo_id)
+        SELECT pc.source_photo_id, pc.target_photo_id
+        FROM sync_pending_connections pc
+        JOIN photos s ON s.photo_id = pc.source_photo_id
+        JOIN photos t ON t.photo_id = pc.target_photo_id
+        ''')
+        stored = cursor.rowcount
+        cursor.execute("SELECT COUNT(*) FROM sync_pending_connections")
+        skipped = cursor.fetchone()[0] - stored
+        cursor.execute("DELETE FROM sync_pending_connections")
         conn.commit()
-        return True
-    
+        logger.info(f"Database - Resolved {stored} connections ({skipped} with targets not in database)")
+        return stored
     except Exception as e:
-        logger.error(f"Database - Error inserting/updating photo {photo_id}: {str(e)}")
+        logger.error(f"Database - Error resolving staged connections: {str(e)}")
         conn.rollback()
+        return None
+
+def get_existing_photo_ids(photo_ids):
+    """Return the subset of photo_ids that are stored in the local database"""
+    logger.debug(f"=== FUNCTION DB: get_existing_photo_ids ===")
+    return _existing_photo_ids(get_connection().cursor(), set(photo_ids))
+
+def insert_or_update_photo(photo_data):
+    """Insert or update a single photo record in the database"""
+    logger.debug(f"=== FUNCTION DB: insert_or_update_photo ===")
+    if not photo_data or 'photoId' not in photo_data or 'id' not in photo_data['photoId']:
+        logger.warning("Database - Invalid photo data: missing photoId")
         return False
-    
-    finally:
-        conn.close()
+    return upsert_photos([photo_data]) == 1
+
+def _select_for_ids(cursor, sql, photo_ids):
+    """
+    Run sql (containing one IN ({placeholders}) clause) for photo_ids in batches
+    that stay under SQLite's bound-parameter limit. photo_ids=None runs it once
+    over the whole table instead.
+    """
+    if photo_ids is None:
+        cursor.execute(sql.replace("IN ({placeholders})", "IS NOT NULL"))
+        return cursor.fetchall()
+    rows = []
+    for i in range(0, len(photo_ids), SQL_VARIABLE_CHUNK):
+        batch = photo_ids[i:i + SQL_VARIABLE_CHUNK]
+        cursor.execute(sql.format(placeholders=','.join('?' for _ in batch)), batch)
+        rows.extend(cursor.fetchall())
+    return rows
+
+def _api_photo(photo_data):
+    """Shape a photos row dict like a Street View Publish API photo"""
+    photo = {
+        'photoId': {'id': photo_data['photo_id']},
+        'captureTime': photo_data['capture_time'],
+        'uploadTime': photo_data['upload_time'],
+        'viewCount': photo_data['view_count'],
+        'mapsPublishStatus': photo_data['maps_publish_status'],
+        'shareLink': photo_data['share_link'],
+        'thumbnailUrl': photo_data['thumbnail_url']
+    }
+    if photo_data['latitude'] is not None and photo_data['longitude'] is not None:
+        photo['pose'] = {
+            'latLngPair': {
+                'latitude': photo_data['latitude'],
+                'longitude': photo_data['longitude']
+            }
+        }
+        if photo_data['heading'] is not None:
+            photo['pose']['heading'] = photo_data['heading']
+    return photo
+
+def _hydrate(cursor, photo_rows, api_format=False, all_photos=False):
+    """
+    Attach places and connections to photo rows with one batched query each.
+
+    Args:
+        cursor: Cursor on the pooled connection
+        photo_rows: photos rows (sqlite3.Row or dict), in the order to return them
+        api_format: Return API-shaped dicts (photoId, pose, placeId, ...) instead
+            of database-shaped ones (photo_id, place_id, ...)
+        all_photos: photo_rows is the whole table, so skip the IN (...) filter
+
+    Returns:
+        List of photo dicts in the same order as photo_rows. 'places' and
+        'connections' are only present when the photo has any.
+    """
+    photos = [dict(row) for row in photo_rows]
+    if not photos:
+        return []
+    photo_ids = None if all_photos else [photo['photo_id'] for photo in photos]
+
+    places = {}
+    for row in _select_for_ids(cursor, """
+        SELECT photo_id, place_id, name, language_code FROM places
+        WHERE photo_id IN ({placeholders}) ORDER BY id
+    """, photo_ids):
+        if api_format:
+            place = {'placeId': row['place_id'], 'name': row['name'], 'languageCode': row['language_code']}
+        else:
+            place = {'place_id': row['place_id'], 'name': row['name'], 'language_code': row['language_code']}
+        places.setdefault(row['photo_id'], []).append(place)
+
+    connections = {}
+    for row in _select_for_ids(cursor, """
+        SELECT source_photo_id, target_photo_id FROM connections
+        WHERE source_photo_id IN ({placeholders}) ORDER BY id
+    """, photo_ids):
+        connections.setdefault(row['source_photo_id'], []).append({'target': {'id': row['target_photo_id']}})
+
+    hydrated = []
+    for photo_data in photos:
+        photo_id = photo_data['photo_id']
+        photo = _api_photo(photo_data) if api_format else photo_data
+        if photo_id in places:
+            photo['places'] = places[photo_id]
+        if photo_id in connections:
+            photo['connections'] = connections[photo_id]
+        hydrated.append(photo)
+    return hydrated
 
-def get_photo_from_db(photo_id):
-    """Retrieve a photo from the database by its ID"""
+def get_photos_by_ids(photo_ids, api_format=False):
+    """
+    Retrieve several photos with their places and connections in batched queries.
+
+    Returns:
+        List of photo dicts in the order of photo_ids; unknown IDs are skipped
+    """
+    logger.debug(f"=== FUNCTION DB: get_photos_by_ids === count={len(photo_ids)}")
+    try:
+        cursor = get_connection().cursor()
+        unique_ids = list(dict.fromkeys(photo_ids))
+        rows = {row['photo_id']: row for row in _select_for_ids(
+            cursor, "SELECT * FROM photos WHERE photo_id IN ({placeholders})", unique_ids)}
+        return _hydrate(cursor, [rows[pid] for pid in unique_ids if pid in rows], api_format)
+    except Exception as e:
+        logger.error(f"Database - Error retrieving photos by ID: {str(e)}")
+        return []
+
+def get_photo_from_db(photo_id, api_format=False):
+    """
+    Retrieve a photo from the database by its ID
+
+    Args:
+        photo_id: The photo to fetch
+        api_format: Return the photo shaped like an API response (see _hydrate)
+    """
     logger.debug(f"=== FUNCTION DB: get_photo_from_db ===")
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-    cursor = conn.cursor()
-    
-    # Enable foreign key constraints
-    cursor.execute('PRAGMA foreign_keys = ON')
-    
     try:
-        # Get photo data
+        cursor = get_connection().cursor()
         cursor.execute("SELECT * FROM photos WHERE photo_id = ?", (photo_id,))
         photo_row = cursor.fetchone()
-        
         if not photo_row:
             logger.debug(f"=== DATABASE DEBUG: Photo {photo_id} not found in database ===")
             return None
-        
-        photo_data = dict(photo_row)
-        
-        # Get places data
-        cursor.execute("SELECT place_id, name, language_code FROM places WHERE photo_id = ?", (photo_id,))
-        places_rows = cursor.fetchall()
-        
-        if places_rows:
-            photo_data['places'] = [dict(row) for row in places_rows]
-        
-        # Get connections data
-        cursor.execute("SELECT target_photo_id FROM connections WHERE source_photo_id = ?", (photo_id,))
-        conn_rows = cursor.fetchall()
-        
-        if conn_rows:
-            photo_data['connections'] = [{'target': {'id': row['target_photo_id']}} for row in conn_rows]
-        
+        photo_data = _hydrate(cursor, [photo_row], api_format)[0]
         logger.debug(f"Retrieved photo {photo_id}: places={len(photo_data.get('places', []))}, connections={len(photo_data.get('connections', []))}")
-        
         return photo_data
-    
+
     except Exception as e:
         logger.error(f"Database - Error retrieving photo {photo_id}: {str(e)}")
         return None
-    
-    finally:
-        conn.close()
 
 def get_all_photos_from_db():
     """Retrieve all photos from the database using bulk queries"""
     logger.debug(f"=== FUNCTION DB: get_all_photos_from_db ===")
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # Enable foreign key constraints
-    cursor.execute('PRAGMA foreign_keys = ON')
-
     try:
-        # Bulk query 1: Get all photos
+        cursor = get_connection().cursor()
         cursor.execute("SELECT * FROM photos")
-        photo_rows = cursor.fetchall()
-        logger.debug(f"=== DATABASE DEBUG: Retrieving all photos from database ===")
-        logger.debug(f"Found {len(photo_rows)} photos in database")
-
-        # Build photo dict keyed by photo_id
-        photos_by_id = {}
-        for row in photo_rows:
-            photo_data = dict(row)
-            photos_by_id[photo_data['photo_id']] = photo_data
-
-        # Bulk query 2: Get all places
-        cursor.execute("SELECT photo_id, place_id, name, language_code FROM places")
-        for row in cursor.fetchall():
-            photo_id = row['photo_id']
-            if photo_id in photos_by_id:
-                photos_by_id[photo_id].setdefault('places', []).append({
-                    'place_id': row['place_id'],
-                    'name': row['name'],
-                    'language_code': row['language_code']
-                })
-
-        # Bulk query 3: Get all connections
-        cursor.execute("SELECT source_photo_id, target_photo_id FROM connections")
-        for row in cursor.fetchall():
-            source_id = row['source_photo_id']
-            if source_id in photos_by_id:
-                photos_by_id[source_id].setdefault('connections', []).append({
-                    'target': {'id': row['target_photo_id']}
-                })
-
-        photos = list(photos_by_id.values())
-
-        # DEBUG: Log summary of retrieved photos
+        photos = _hydrate(cursor, cursor.fetchall(), all_photos=True)
         logger.debug(f"=== DATABASE DEBUG: Retrieved {len(photos)} complete photo records ===")
-        for i, photo in enumerate(photos):
-            logger.debug(f"Photo {i+1}: ID={photo.get('photo_id', 'N/A')}, capture_time={photo.get('capture_time', 'N/A')}, upload_time={photo.get('upload_time', 'N/A')}")
-
         return photos
 
     except Exception as e:
         logger.error(f"Database - Error retrieving all photos: {str(e)}")
         return []
 
-    finally:
-        conn.close()
+# Characters read from an import file at a time
+IMPORT_READ_SIZE = 1 << 16
+
+_json_decoder = json.JSONDecoder()
+
+def _iter_json_records(f, read_size=IMPORT_READ_SIZE, line_key=None):
+    """
+    Yield the records of a JSON export one at a time without loading the file.
+
+    Accepts a top-level array of objects (the all_photos_*.json format) or
+    newline-delimited JSON (one object per line). Only the current record
+    and one read buffer are held in memory. Any other top-level value, such
+    as a single (possibly pretty-printed) object, is rejected: an NDJSON
+    record must be an object on a line of its own, holding line_key if given.
+
+    Raises:
+        ValueError: If the file is not a JSON array or NDJSON
+    """
+    buffer = ''
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        # Skip whitespace, plus the array's brackets and separators
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n' + (',' if in_array else ''):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer):
+            if in_array:
+                raise ValueError("unterminated JSON array")
+            return
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            if in_array:
+                pos += 1
+            continue
+        if in_array and buffer[pos] == ']':
+            return
+
+        try:
+            record, end = _json_decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buffer) and not eof and not isinstance(record, (dict, list)):
+            # A bare scalar may continue in the next chunk
+            fill()
+            continue
+        if not in_array:
+            # The rest of the line must be blank, and may not have arrived yet
+            line_end = buffer.find('\n', end)
+            if line_end < 0 and not eof:
+                fill()
+                continue
+            if (not isinstance(record, dict) or '\n' in buffer[pos:end]
+                    or buffer[end:line_end if line_end >= 0 else len(buffer)].strip()
+                    or (line_key is not None and line_key not in record)):
+                raise ValueError("expected a JSON array or one object per line")
+        pos = end
+        yield record
+
+def import_photos_from_json(json_file, batch_size=UPSERT_CHUNK_SIZE, progress=None):
+    """
+    Import photos from a JSON export (array or NDJSON) into the database.
 
-def import_photos_from_json(json_file):
-    """Import photos from a JSON file into the database"""
+    The file is parsed incrementally and written in batch_size bulk upserts,
+    so peak memory depends on the batch size, not on the file size.
+    Connections are staged and resolved once every photo is stored.
+
+    Args:
+        json_file: Path of the export
+        batch_size: Photos per bulk upsert
+        progress: Optional callable receiving a summary dict (parsed, stored,
+            bytes_read, total_bytes) after every batch
+
+    Returns:
+        True if the whole file was imported, False on error
+    """
     logger.debug(f"=== FUNCTION DB: import_photos_from_json ===")
+    summary = {'parsed': 0, 'stored': 0, 'bytes_read': 0, 'total_bytes': 0}
     try:
-        with open(json_file, 'r') as f:
-            photos = json.load(f)
-        
-        if not isinstance(photos, list):
-            logger.error(f"Database - Invalid JSON format in {json_file}. Expected a list of photos.")
-            return False
-        
-        success_count = 0
-        total_count = len(photos)
-        
-        for photo in photos:
-            if insert_or_update_photo(photo):
-                success_count += 1
-        
-        logger.info(f"Database - Imported {success_count}/{total_count} photos from {json_file}")
+        summary['total_bytes'] = os.path.getsize(json_file)
+        clear_pending_connections()
+        with open(json_file, 'r', encoding='utf-8') as f:
+            batch = []
+
+            def flush():
+                summary['parsed'] += len(batch)
+                summary['stored'] += upsert_photos(batch, defer_connections=True)
+                summary['bytes_read'] = f.buffer.tell()
+                batch.clear()
+                if progress:
+                    progress(dict(summary))
+
+            for record in _iter_json_records(f, line_key='photoId'):
+                if not isinstance(record, dict):
+                    raise ValueError("expected photo objects")
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+        resolve_pending_connections()
+        apply_tile_changes()
+
+        logger.info(f"Database - Imported {summary['stored']}/{summary['parsed']} photos from {json_file}")
         return True
-    
+
     except Exception as e:
         logger.error(f"Database - Error importing photos from {json_file}: {str(e)}")
         return False
 
+def _query_db_stats(cursor):
+    """Run the aggregate queries behind get_db_stats()"""
+    cursor.execute('''
+    SELECT COUNT(*), COUNT(CASE WHEN maps_publish_status = 'PUBLISHED' THEN 1 END),
+           SUM(view_count), MAX(updated_at)
+    FROM photos
+    ''')
+    photo_count, published_count, total_views, last_updated = cursor.fetchone()
+    stats = {
+        'photo_count': photo_count,
+        'published_count': published_count,
+        'total_views': total_views if total_views is not None else 0,
+        'last_updated_at': last_updated,
+    }
+
+    cursor.execute("SELECT COUNT(*) FROM places")
+    stats['place_count'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM connections")
+    stats['connection_count'] = cursor.fetchone()[0]
+
+    # Format the timestamp in YYYY-MM-DD HH:MM format
+    if last_updated:
+        try:
+            dt = datetime.fromisoformat(last_updated.replace('Z', '+00:00'))
+            stats['last_updated'] = dt.strftime('%Y-%m-%d %H:%M')
+        except (ValueError, AttributeError):
+            # In case of any error in parsing, use the raw value
+            stats['last_updated'] = last_updated
+    else:
+        stats['last_updated'] = "N/A"
+    return stats
+
 def get_db_stats():
-    """Get statistics about the database"""
+    """
+    Get statistics about the database.
+
+    Results are cached per thread until the database changes (see
+    _thread_cache), so a repeated page view costs one pragma.
+
+    Returns:
+        Dict with photo_count, published_count, place_count,
+        connection_count, total_views, last_updated (display) and
+        last_updated_at (raw), or {'error': ...}
+    """
     logger.debug(f"=== FUNCTION DB: get_db_stats ===")
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Enable foreign key constraints
-    cursor.execute('PRAGMA foreign_keys = ON')
-    
     try:
-        stats = {}
-        
-        # Count photos
-        cursor.execute("SELECT COUNT(*) FROM photos")
-        stats['photo_count'] = cursor.fetchone()[0]
-
-        # Count published photos
-        cursor.execute("SELECT COUNT(*) FROM photos WHERE maps_publish_status = 'PUBLISHED'")
-        stats['published_count'] = cursor.fetchone()[0]
+        conn, cache = _thread_cache('stats')
+        if 'stats' not in cache:
+            cache['stats'] = _query_db_stats(conn.cursor())
+        return dict(cache['stats'])
 
-        # Count places
-        cursor.execute("SELECT COUNT(*) FROM places")
-        stats['place_count'] = cursor.fetchone()[0]
-        
-        # Count connections
-        cursor.execute("SELECT COUNT(*) FROM connections")
-        stats['connection_count'] = cursor.fetchone()[0]
-        
-        # Sum total view count
-        cursor.execute("SELECT SUM(view_count) FROM photos WHERE view_count IS NOT NULL")
-        total_views = cursor.fetchone()[0]
-        stats['total_views'] = total_views if total_views is not None else 0
-        
-        # Get last updated
-        cursor.execute("SELECT MAX(updated_at) FROM photos")
-        last_updated = cursor.fetchone()[0]
-        
-        # Format the timestamp in YYYY-MM-DD HH:MM format
-        if last_updated:
-            try:
-                # Convert ISO format string to datetime object
-                dt = datetime.fromisoformat(last_updated.replace('Z', '+00:00'))
-                # Format in YYYY-MM-DD HH:MM format
-                stats['last_updated'] = dt.strftime('%Y-%m-%d %H:%M')
-            except (ValueError, AttributeError):
-                # In case of any error in parsing, use the raw value
-                stats['last_updated'] = last_updated
-        else:
-            stats['last_updated'] = "N/A"
-        
-        return stats
-    
     except Exception as e:
         logger.error(f"Database - Error getting database stats: {str(e)}")
         return {'error': str(e)}
-    
-    finally:
-        conn.close()
+
+def photo_database_created():
+    """
+    Whether the photo database has been created by a sync.
+
+    The database file alone does not say so: uploads create it for the
+    upload ledger and upload jobs before any sync has run. The photo
+    database counts as created once a sync job has completed, or once the
+    photos table holds rows (databases synced before sync jobs existed).
+
+    Returns:
+        True if the photo database has been created, else False
+    """
+    logger.debug(f"=== FUNCTION DB: photo_database_created ===")
+    if not os.path.exists(DATABASE_PATH):
+        return False
+    cursor = get_connection(readonly=True).cursor()
+    try:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM photos)")
+        if cursor.fetchone()[0]:
+            return True
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM sync_jobs WHERE status = 'completed')")
+        return bool(cursor.fetchone()[0])
+    except Exception as e:
+        logger.error(f"Database - Error checking whether the photo database exists: {str(e)}")
+        return False
 
 def clean_deleted_photos(existing_photo_ids):
     """
     Remove photos from the database that are no longer in the API.
-    
+
+    The API IDs are loaded into a temp table and the stale photos, their
+    places and their connections are removed with set-based DELETEs joined
+    on it, in one transaction.
+
     Args:
-        existing_photo_ids: A list of photo IDs that currently exist in the API
-        
+        existing_photo_ids: An iterable of photo IDs that currently exist in the API
+
     Returns:
         Number of photos removed from the database
     """
     logger.debug(f"=== FUNCTION DB: clean_deleted_photos ===")
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
-    
+
     try:
-        # First, get all photo IDs currently in the database
-        cursor.execute("SELECT photo_id FROM photos")
-        db_photo_ids = set(row[0] for row in cursor.fetchall())
-        
-        # Find photo IDs that are in the database but not in the API response
-        deleted_ids = db_photo_ids - set(existing_photo_ids)
-        
-        if not deleted_ids:
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS clean_keep_ids (photo_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS clean_stale_ids (photo_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        cursor.execute("DELETE FROM temp.clean_keep_ids")
+        cursor.execute("DELETE FROM temp.clean_stale_ids")
+        cursor.executemany("INSERT OR IGNORE INTO temp.clean_keep_ids (photo_id) VALUES (?)",
+                           ((photo_id,) for photo_id in existing_photo_ids))
+
+        # Photos in the database but not in the API response
+        cursor.execute('''
+        INSERT INTO temp.clean_stale_ids (photo_id)
+        SELECT photo_id FROM photos
+        WHERE photo_id NOT IN (SELECT photo_id FROM temp.clean_keep_ids)
+        ''')
+        deleted = cursor.rowcount
+
+        if not deleted:
+            conn.commit()
             logger.info("Database - No deleted photos found to clean up")
             return 0
-            
-        # Log the IDs to be deleted
-        logger.info(f"Database - Found {len(deleted_ids)} photos to remove from database: {deleted_ids}")
-        
-        # Delete all related records for the deleted photos
-        for deleted_id in deleted_ids:
-            # Delete from places table
-            cursor.execute("DELETE FROM places WHERE photo_id = ?", (deleted_id,))
-            
-            # Delete from connections table (both source and target)
-            cursor.execute("DELETE FROM connections WHERE source_photo_id = ? OR target_photo_id = ?", 
-                           (deleted_id, deleted_id))
-            
-            # Delete from photos table
-            cursor.execute("DELETE FROM photos WHERE photo_id = ?", (deleted_id,))
-        
+
+        logger.info(f"Database - Found {deleted} photos to remove from database")
+        stale = "(SELECT photo_id FROM temp.clean_stale_ids)"
+        cursor.execute(f"DELETE FROM places WHERE photo_id IN {stale}")
+        # Both sides are indexed; SQLite answers the OR with one lookup per index
+        cursor.execute(f"DELETE FROM connections WHERE source_photo_id IN {stale} OR target_photo_id IN {stale}")
+        cursor.execute(f"DELETE FROM photos WHERE photo_id IN {stale}")
         conn.commit()
-        logger.info(f"Database - Successfully removed {len(deleted_ids)} deleted photos from database")
-        return len(deleted_ids)
-        
+        logger.info(f"Database - Successfully removed {deleted} deleted photos from database")
+        return deleted
+
     except Exception as e:
         logger.error(f"Database - Error cleaning deleted photos: {str(e)}")
         conn.rollback()
         return 0
-        
+
     finally:
-        conn.close()
+        # Empty the scratch tables; they live as long as the pooled connection
+        try:
+            cursor.execute("DELETE FROM temp.clean_keep_ids")
+            cursor.execute("DELETE FROM temp.clean_stale_ids")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
 
 def update_photo_metadata(photo_id, latitude=None, longitude=None, heading=None, places=None):
     """Update editable photo metadata (coordinates, heading, places) in the database."""
     logger.debug(f"=== FUNCTION DB: update_photo_metadata === photo_id={photo_id}")
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         updates = []
@@ -515,11 +1253,14 @@ def update_photo_metadata(photo_id, latitude=None, longitude=None, heading=None,
         if heading is not None:
             updates.append("heading = ?")
             params.append(heading)
-        if updates:
+        # Local edits diverge from the last API payload, so clear the content
+        # hash to make the next sync rewrite this photo from the API
+        updates.append("content_hash = NULL")
+        if len(updates) > 1:
             updates.append("updated_at = ?")
             params.append(datetime.now().isoformat())
-            params.append(photo_id)
-            cursor.execute(f"UPDATE photos SET {', '.join(updates)} WHERE photo_id = ?", params)
+        params.append(photo_id)
+        cursor.execute(f"UPDATE photos SET {', '.join(updates)} WHERE photo_id = ?", params)
 
         if places is not None:
             cursor.execute("DELETE FROM places WHERE photo_id = ?", (photo_id,))
@@ -534,14 +1275,12 @@ def update_photo_metadata(photo_id, latitude=None, longitude=None, heading=None,
     except Exception as e:
         logger.error(f"Database - Error updating metadata for photo {photo_id}: {str(e)}")
         conn.rollback()
-    finally:
-        conn.close()
 
 
 def delete_photo(photo_id):
     """Remove a single photo and its related records from the database."""
     logger.debug(f"=== FUNCTION DB: delete_photo === photo_id={photo_id}")
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("DELETE FROM places WHERE photo_id = ?", (photo_id,))
@@ -555,8 +1294,6 @@ def delete_photo(photo_id):
         logger.error(f"Database - Error deleting photo {photo_id}: {str(e)}")
         conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def get_connections_by_photo_ids(photo_ids):
@@ -576,13 +1313,9 @@ def get_connections_by_photo_ids(photo_ids):
     conn = None
     try:
         # Connect to the database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection()
         cursor = conn.cursor()
 
-        # Enable foreign key constraints
-        cursor.execute('PRAGMA foreign_keys = ON')
-
         # Bulk query using WHERE IN instead of N individual queries
         placeholders = ','.join('?' for _ in photo_ids)
         cursor.execute(
@@ -605,32 +1338,131 @@ def get_connections_by_photo_ids(photo_ids):
         logger.error(f"Database - Error fetching connections from database: {str(e)}")
         return []
 
-    finally:
-        if conn:
-            conn.close()
 
 def add_connection(source_photo_id, target_photo_id):
     """Add a single connection row if it doesn't already exist. Non-fatal if either photo is missing."""
     logger.debug(f"=== FUNCTION DB: add_connection ===")
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute('PRAGMA foreign_keys = ON')
         cursor.execute(
             'INSERT OR IGNORE INTO connections (source_photo_id, target_photo_id) VALUES (?, ?)',
             (source_photo_id, target_photo_id)
         )
-        conn.commit()
         added = cursor.rowcount > 0
+        if added:
+            cursor.execute("UPDATE photos SET content_hash = NULL WHERE photo_id = ?", (source_photo_id,))
+        conn.commit()
         logger.debug(f"Database - add_connection {source_photo_id} -> {target_photo_id}: {'added' if added else 'already exists'}")
         return added
     except Exception as e:
         logger.error(f"Database - Error adding connection {source_photo_id} -> {target_photo_id}: {str(e)}")
         return False
-    finally:
-        if conn:
-            conn.close()
+
+# Mean Earth radius in metres, matching app.calculate_distance
+EARTH_RADIUS_M = 6371000.0
+
+def haversine_distance(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres (also registered as SQL haversine())"""
+    if lat1 is None or lng1 is None or lat2 is None or lng2 is None:
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def bounding_box(lat, lng, radius):
+    """
+    Box enclosing a circle of radius metres around (lat, lng).
+
+    Returns:
+        (min_lat, max_lat, min_lng, max_lng); longitudes may fall outside
+        [-180, 180] near the antimeridian, see _longitude_ranges()
+    """
+    lat_diff = radius / 111320
+    cos_lat = math.cos(math.radians(lat))
+    lng_diff = radius / (111320 * cos_lat) if cos_lat > 1e-9 else 360.0
+    return lat - lat_diff, lat + lat_diff, lng - lng_diff, lng + lng_diff
+
+def _longitude_ranges(min_lng, max_lng):
+    """Split a longitude range that wraps past +/-180 into ranges within [-180, 180]"""
+    if max_lng - min_lng >= 360:
+        return [(-180.0, 180.0)]
+    if min_lng < -180:
+        return [(min_lng + 360, 180.0), (-180.0, max_lng)]
+    if max_lng > 180:
+        return [(min_lng, 180.0), (-180.0, max_lng - 360)]
+    return [(min_lng, max_lng)]
+
+def _box_query(min_lat, max_lat, min_lng, max_lng):
+    """
+    SQL and params selecting photos rows inside a box via photos_rtree.
+
+    One R*Tree-driven branch per longitude range (two when the box crosses
+    the antimeridian). The R*Tree stores 32-bit floats rounded outwards, so
+    exact coordinates are re-checked against photos.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    branches = []
+    params = []
+    for lo, hi in _longitude_ranges(min_lng, max_lng):
+        branches.append(
+            "SELECT p.* FROM photos_rtree r CROSS JOIN photos p ON p.rowid = r.id "
+            "WHERE r.min_lat <= ? AND r.max_lat >= ? AND r.min_lng <= ? AND r.max_lng >= ? "
+            "AND +p.latitude BETWEEN ? AND ? AND +p.longitude BETWEEN ? AND ?"
+        )
+        params.extend([max_lat, min_lat, hi, lo, min_lat, max_lat, lo, hi])
+    return " UNION ALL ".join(branches), params
+
+def get_photos_within_radius(lat, lng, radius, exclude_photo_id=None, limit=None):
+    """
+    Get photos within radius metres of a point, nearest first.
+
+    Candidates come from an R*Tree box query; exact great-circle distances
+    are computed and filtered in SQL.
+
+    Returns:
+        List of API-style photo dicts, each with a 'distance' in metres
+    """
+    logger.debug(f"=== FUNCTION DB: get_photos_within_radius === ({lat}, {lng}) r={radius}")
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        box_sql, params = _box_query(*bounding_box(lat, lng, radius))
+        sql = (f"SELECT * FROM (SELECT b.*, haversine(?, ?, b.latitude, b.longitude) AS distance FROM ({box_sql}) b) "
+               f"WHERE distance <= ? AND photo_id IS NOT ? ORDER BY distance")
+        params = [lat, lng] + params + [radius, exclude_photo_id]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        photos = _hydrate(cursor, rows, api_format=True)
+        for photo, row in zip(photos, rows):
+            photo['distance'] = row['distance']
+        return photos
+    except Exception as e:
+        logger.error(f"Database - Error getting photos within radius: {str(e)}")
+        return []
+
+def get_nearest_photos(lat, lng, k, exclude_photo_id=None, max_radius=EARTH_RADIUS_M * math.pi):
+    """
+    k-nearest-neighbour lookup: the k photos closest to a point, nearest first.
+
+    Searches a growing radius (starting near the expected spacing of the k
+    photos) until k photos fall inside it; any photo closer than that radius
+    is inside its search box, so the result is exact.
+
+    Returns:
+        List of API-style photo dicts, each with a 'distance' in metres
+    """
+    logger.debug(f"=== FUNCTION DB: get_nearest_photos === ({lat}, {lng}) k={k}")
+    radius = 100.0
+    while True:
+        photos = get_photos_within_radius(lat, lng, radius, exclude_photo_id, limit=k)
+        if len(photos) >= k or radius >= max_radius:
+            return photos
+        radius = min(radius * 4, max_radius)
 
 def get_nearby_photos(lat, lng, min_lat, max_lat, min_lng, max_lng, center_photo_id=None):
     """
@@ -655,85 +1487,14 @@ def get_nearby_photos(lat, lng, min_lat, max_lat, min_lng, max_lng, center_photo
     conn = None
     try:
         # Connect to the database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection()
         cursor = conn.cursor()
         
-        # Enable foreign key constraints
-        cursor.execute('PRAGMA foreign_keys = ON')
+        # Query for photos within the bounding box (R*Tree, antimeridian-aware)
+        box_sql, params = _box_query(min_lat, max_lat, min_lng, max_lng)
+        cursor.execute(f"SELECT * FROM ({box_sql}) WHERE photo_id IS NOT NULL", params)
         
-        # Query for photos within the bounding box
-        cursor.execute("""
-            SELECT * FROM photos 
-            WHERE latitude >= ? AND latitude <= ? 
-            AND longitude >= ? AND longitude <= ?
-            AND photo_id IS NOT NULL
-        """, (min_lat, max_lat, min_lng, max_lng))
-        
-        photos = []
-
-        # Process results
-        for row in cursor.fetchall():
-            photo_data = dict(row)
-            photo_id = photo_data['photo_id']
-            
-            # Skip if no coordinates
-            if photo_data['latitude'] is None or photo_data['longitude'] is None:
-                logger.debug(f"=== NEARBY PHOTOS DEBUG: Skipping {photo_id} - no coordinates ===")
-                continue
-            
-            logger.debug(f"=== NEARBY PHOTOS DEBUG: Processing photo {photo_id} at ({photo_data['latitude']}, {photo_data['longitude']}) ===")
-                
-            # Format data to match API response format
-            formatted_photo = {
-                'photoId': {'id': photo_id},
-                'pose': {
-                    'latLngPair': {
-                        'latitude': photo_data['latitude'],
-                        'longitude': photo_data['longitude']
-                    },
-                    'heading': photo_data['heading']
-                },
-                'captureTime': photo_data['capture_time'],
-                'thumbnailUrl': photo_data['thumbnail_url'],
-                'viewCount': photo_data['view_count'],
-                'shareLink': photo_data['share_link'],
-                'uploadTime': photo_data['upload_time']
-            }
-            
-            # Get connections for this photo
-            cursor.execute("""
-                SELECT target_photo_id FROM connections 
-                WHERE source_photo_id = ?
-            """, (photo_id,))
-            
-            connections = []
-            for conn_row in cursor.fetchall():
-                connections.append({
-                    'target': {'id': conn_row['target_photo_id']}
-                })
-            
-            if connections:
-                formatted_photo['connections'] = connections
-            
-            # Get places for this photo
-            cursor.execute("""
-                SELECT place_id, name, language_code FROM places
-                WHERE photo_id = ?
-            """, (photo_id,))
-            
-            places = []
-            for place_row in cursor.fetchall():
-                places.append({
-                    'placeId': place_row['place_id'],
-                    'name': place_row['name'],
-                    'languageCode': place_row['language_code']
-                })
-            
-            if places:
-                formatted_photo['places'] = places
-            
-            photos.append(formatted_photo)
+        photos = _hydrate(cursor, cursor.fetchall(), api_format=True)
         
         logger.debug(f"=== NEARBY PHOTOS DEBUG: Found {len(photos)} photos before filtering ===")
         
@@ -758,9 +1519,6 @@ def get_nearby_photos(lat, lng, min_lat, max_lat, min_lng, max_lng, center_photo
         logger.error(f"Database - Error getting nearby photos: {str(e)}")
         return []
         
-    finally:
-        if conn:
-            conn.close()
 
 
 def get_all_photos_with_gps():
@@ -774,41 +1532,19 @@ def get_all_photos_with_gps():
     conn = None
     try:
         # Connect to the database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Query for photos that have GPS coordinates
         cursor.execute("""
-            SELECT p.*, GROUP_CONCAT(DISTINCT pl.name) as place_names
+            SELECT p.*
             FROM photos p
-            LEFT JOIN places pl ON p.photo_id = pl.photo_id
             WHERE p.latitude IS NOT NULL 
             AND p.longitude IS NOT NULL
-            GROUP BY p.photo_id
             ORDER BY p.upload_time DESC
         """)
         
-        photos = []
-        
-        # Process results
-        for row in cursor.fetchall():
-            photo_data = dict(row)
-            
-            # Create simplified photo object for map display
-            photo = {
-                'photo_id': photo_data['photo_id'],
-                'latitude': photo_data['latitude'],
-                'longitude': photo_data['longitude'],
-                'place_names': photo_data['place_names'] or 'Unknown Location',
-                'maps_publish_status': photo_data['maps_publish_status'] or 'N/A',
-                'view_count': photo_data['view_count'] or 0,
-                'capture_time': photo_data['capture_time'],
-                'share_link': photo_data['share_link'],
-                'thumbnail_url': photo_data['thumbnail_url']
-            }
-            
-            photos.append(photo)
+        photos = [_map_photo(row) for row in cursor.fetchall()]
         
         logger.info(f"Database - Retrieved {len(photos)} photos with GPS coordinates for map view")
         return photos
@@ -817,131 +1553,1149 @@ def get_all_photos_with_gps():
         logger.error(f"Database - Error getting photos with GPS coordinates: {str(e)}")
         return []
         
-    finally:
-        if conn:
-            conn.close()
 
-def get_next_photo_by_capture_time(current_photo_id):
+# ---------------------------------------------------------------------------
+# Map clustering
+# ---------------------------------------------------------------------------
+
+# Clusters are grid cells of this many screen pixels at the requested zoom
+MAP_CLUSTER_RADIUS = 64
+# Zoom levels above this return individual photos instead of clusters
+MAP_CLUSTER_MAX_ZOOM = 16
+# Latitude limit of the web-mercator projection
+MERCATOR_MAX_LAT = 85.05112878
+
+def _map_photo(row):
+    """Simplified photo object for map display"""
+    return {
+        'photo_id': row['photo_id'],
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'place_names': row['place_names'] or 'Unknown Location',
+        'maps_publish_status': row['maps_publish_status'] or 'N/A',
+        'view_count': row['view_count'] or 0,
+        'capture_time': row['capture_time'],
+        'share_link': row['share_link'],
+        'thumbnail_url': row['thumbnail_url']
+    }
+
+def mercator_xy(lat, lng):
+    """Web-mercator position of a coordinate, scaled to [0, 1) on both axes"""
+    lat = max(-MERCATOR_MAX_LAT, min(MERCATOR_MAX_LAT, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+def _cluster_cells_per_axis(zoom):
+    return (256 << zoom) // MAP_CLUSTER_RADIUS
+
+def _cluster_index(zoom):
     """
-    Get the next photo based on photos.html default sorting (upload_time DESC, photo_id ASC)
-    Next = older in the list (going back chronologically from newest to oldest)
-    
+    Grid cells of GPS photos at one zoom level: (cx, cy) -> [count, lat_sum,
+    lng_sum, min_lat, min_lng, max_lat, max_lng, photo_id of a member].
+
+    The finest level (MAP_CLUSTER_MAX_ZOOM) is built from the photos table;
+    each coarser cell is the union of the finer cells it covers, so a level
+    costs one pass over the finest one. Levels are cached until the
+    database changes.
+    """
+    conn, cache = _thread_cache('map_clusters')
+    level = cache.get(zoom)
+    if level is not None:
+        return level
+    if zoom == MAP_CLUSTER_MAX_ZOOM:
+        n = _cluster_cells_per_axis(zoom)
+        level = {}
+        cursor = conn.execute("SELECT photo_id, latitude, longitude FROM photos "
+                              "WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+        for photo_id, lat, lng in cursor:
+            x, y = mercator_xy(lat, lng)
+            key = (int(x * n), int(y * n))
+            cell = level.get(key)
+            if cell is None:
+                level[key] = [1, lat, lng, lat, lng, lat, lng, photo_id]
+            else:
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lng
+                if lat < cell[3]: cell[3] = lat
+                if lng < cell[4]: cell[4] = lng
+                if lat > cell[5]: cell[5] = lat
+                if lng > cell[6]: cell[6] = lng
+    else:
+        shift = MAP_CLUSTER_MAX_ZOOM - zoom
+        level = {}
+        for (cx, cy), fine in _cluster_index(MAP_CLUSTER_MAX_ZOOM).items():
+            key = (cx >> shift, cy >> shift)
+            cell = level.get(key)
+            if cell is None:
+                level[key] = list(fine)
+            else:
+                cell[0] += fine[0]
+                cell[1] += fine[1]
+                cell[2] += fine[2]
+                cell[3] = min(cell[3], fine[3])
+                cell[4] = min(cell[4], fine[4])
+                cell[5] = max(cell[5], fine[5])
+                cell[6] = max(cell[6], fine[6])
+    cache[zoom] = level
+    return level
+
+def _map_cluster(cell):
+    """Map cluster object of a grid cell"""
+    count = cell[0]
+    cluster = {
+        'count': count,
+        'latitude': cell[1] / count,
+        'longitude': cell[2] / count,
+        'bounds': [cell[4], cell[3], cell[6], cell[5]],
+    }
+    if count == 1:
+        cluster['photo_id'] = cell[7]
+    return cluster
+
+def get_map_clusters(zoom, bbox=None):
+    """
+    Photos with GPS for one map viewport, clustered on a screen-space grid.
+
     Args:
-        current_photo_id: The ID of the current photo
-        
+        zoom: Map zoom level (0 = whole world in one 256px tile)
+        bbox: Optional (min_lat, max_lat, min_lng, max_lng); max_lng may
+            exceed 180 when the viewport crosses the antimeridian
+
     Returns:
-        Photo ID of the next photo, or None if this is the last photo in the list
+        Dict with total_count (all GPS photos) and either clusters (zoom <=
+        MAP_CLUSTER_MAX_ZOOM; count, centroid and bounds per cell, plus the
+        photo_id of single-photo cells) or photos (individual map photos
+        inside bbox), or None on error
     """
-    logger.debug(f"=== FUNCTION DB: get_next_photo_by_capture_time ===")
-    conn = None
+    logger.debug(f"=== FUNCTION DB: get_map_clusters === zoom={zoom} bbox={bbox}")
     try:
-        # Connect to the database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # First get the current photo's upload_time and photo_id for comparison
-        cursor.execute("SELECT upload_time, photo_id FROM photos WHERE photo_id = ?", (current_photo_id,))
-        current_row = cursor.fetchone()
-        
-        if not current_row:
-            logger.debug(f"Current photo {current_photo_id} not found")
-            return None
-            
-        current_upload_time = current_row['upload_time']
-        current_photo_id_str = current_row['photo_id']
-        
-        logger.debug(f"Current photo: {current_photo_id_str}, upload_time: {current_upload_time}")
-        
-        # Get the next photo using the same sorting as photos.html (upload_time DESC, photo_id ASC)
-        # For next (older in chronological order), we need:
-        # 1. Photos with upload_time < current_upload_time, OR
-        # 2. Photos with upload_time = current_upload_time AND photo_id > current_photo_id
-        cursor.execute("""
-            SELECT photo_id FROM photos
-            WHERE (
-                upload_time < ? OR
-                (upload_time = ? AND photo_id > ?)
-            ) AND upload_time IS NOT NULL
-            ORDER BY upload_time DESC, photo_id ASC
-            LIMIT 1
-        """, (current_upload_time, current_upload_time, current_photo_id_str))
-        
-        next_row = cursor.fetchone()
-        if next_row:
-            logger.debug(f"Found next photo: {next_row['photo_id']} for current photo: {current_photo_id_str}")
-            return next_row['photo_id']
+        zoom = max(0, int(zoom))
+        # Zoom 0 is a 4x4 grid, so its cells add up to the total cheaply
+        total_count = sum(cell[0] for cell in _cluster_index(0).values())
+        min_lat, max_lat, min_lng, max_lng = bbox or (-90.0, 90.0, -180.0, 180.0)
+
+        if zoom > MAP_CLUSTER_MAX_ZOOM:
+            sql, params = _box_query(min_lat, max_lat, min_lng, max_lng)
+            cursor = get_connection(readonly=True).execute(sql, params)
+            return {'total_count': total_count, 'photos': [_map_photo(row) for row in cursor]}
+
+        level = _cluster_index(zoom)
+        n = _cluster_cells_per_axis(zoom)
+        _, y_top = mercator_xy(max_lat, 0)
+        _, y_bottom = mercator_xy(min_lat, 0)
+        rows = range(int(y_top * n), int(y_bottom * n) + 1)
+        columns = []
+        for lo, hi in _longitude_ranges(min_lng, max_lng):
+            columns.extend(range(int(mercator_xy(0, lo)[0] * n), int(mercator_xy(0, hi)[0] * n) + 1))
+
+        # Probe the viewport's cells, or scan the level when it has fewer cells
+        if len(rows) * len(columns) <= len(level):
+            cells = ((key, level.get(key)) for key in itertools.product(columns, rows))
+            cells = [(key, cell) for key, cell in cells if cell is not None]
         else:
-            logger.debug(f"No next photo found for {current_photo_id_str} - this is the last photo")
+            columns = set(columns)
+            cells = [(key, cell) for key, cell in level.items() if key[0] in columns and key[1] in rows]
+
+        return {'total_count': total_count, 'clusters': [_map_cluster(cell) for _, cell in cells]}
+
+    except Exception as e:
+        logger.error(f"Database - Error getting map clusters: {str(e)}")
+        return None
+
+# ---------------------------------------------------------------------------
+# Map tiles
+# ---------------------------------------------------------------------------
+
+TILE_MAX_ZOOM = 22
+TILE_FORMATS = ('geojson', 'mvt')
+# Vector tile coordinate resolution (units per tile edge)
+MVT_EXTENT = 4096
+# Above this many logged changes the whole tile cache is dropped instead
+TILE_INVALIDATE_ALL_AT = 5000
+
+# Serialises tile cache reads, writes and invalidation (see get_tile)
+_tile_lock = threading.Lock()
+
+def tile_cache_dir():
+    """Directory of cached tiles, next to the database: <z>/<x>/<y>.<format>"""
+    return os.path.join(os.path.dirname(DATABASE_PATH), 'tiles')
+
+def clear_tile_cache():
+    """Delete every cached tile"""
+    shutil.rmtree(tile_cache_dir(), ignore_errors=True)
+
+def tile_for(lat, lng, zoom):
+    """(x, y) of the web-mercator tile containing a coordinate at zoom"""
+    x, y = mercator_xy(lat, lng)
+    n = 1 << zoom
+    return int(x * n), int(y * n)
+
+def tile_bounds(zoom, x, y):
+    """(min_lat, max_lat, min_lng, max_lng) of a web-mercator tile"""
+    n = 1 << zoom
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return lat(y + 1), lat(y), x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+
+def _tile_features(zoom, x, y):
+    """
+    Map features of one tile: the clusters of get_map_clusters() up to
+    MAP_CLUSTER_MAX_ZOOM (a tile holds a whole number of grid cells), and
+    individual photos above it
+    """
+    if zoom <= MAP_CLUSTER_MAX_ZOOM:
+        level = _cluster_index(zoom)
+        cells = 256 // MAP_CLUSTER_RADIUS
+        return [_map_cluster(level[key])
+                for key in itertools.product(range(x * cells, (x + 1) * cells), range(y * cells, (y + 1) * cells))
+                if key in level]
+
+    sql, params = _box_query(*tile_bounds(zoom, x, y))
+    features = []
+    for row in get_connection(readonly=True).execute(sql, params):
+        # Photos on a tile edge belong to the tile tile_for() puts them in
+        if tile_for(row['latitude'], row['longitude'], zoom) == (x, y):
+            photo = _map_photo(row)
+            del photo['view_count']  # changes every sync; kept out so tiles stay cached
+            features.append(photo)
+    return features
+
+def _tile_geojson(features):
+    collection = {'type': 'FeatureCollection', 'features': []}
+    for feature in features:
+        properties = dict(feature)
+        geojson = {
+            'type': 'Feature',
+            'geometry': {'type': 'Point',
+                         'coordinates': [properties.pop('longitude'), properties.pop('latitude')]},
+            'properties': properties,
+        }
+        if 'bounds' in properties:
+            geojson['bbox'] = properties.pop('bounds')
+        collection['features'].append(geojson)
+    return json.dumps(collection, separators=(',', ':')).encode('utf-8')
+
+def _pb_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _pb_field(number, payload):
+    """Length-delimited protobuf field"""
+    return _pb_varint(number << 3 | 2) + _pb_varint(len(payload)) + payload
+
+def _pb_zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def _mvt_value(value):
+    """Encoded vector tile Value message"""
+    if isinstance(value, bool):
+        return _pb_varint(7 << 3) + _pb_varint(int(value))
+    if isinstance(value, int) and value >= 0:
+        return _pb_varint(5 << 3) + _pb_varint(value)
+    if isinstance(value, (int, float)):
+        return _pb_varint(3 << 3 | 1) + struct.pack('<d', value)
+    return _pb_field(1, str(value).encode('utf-8'))
+
+def _tile_mvt(features, zoom, x, y):
+    """
+    Mapbox Vector Tile (spec 2.1) with one 'photos' layer of point features.
+    Cluster bounds become min_lng/min_lat/max_lng/max_lat properties.
+    """
+    n = 1 << zoom
+    keys, values = {}, {}
+    encoded = []
+    for feature in features:
+        properties = dict(feature)
+        px, py = mercator_xy(properties.pop('latitude'), properties.pop('longitude'))
+        if 'bounds' in properties:
+            properties.update(zip(('min_lng', 'min_lat', 'max_lng', 'max_lat'), properties.pop('bounds')))
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        # One MoveTo command (id 1, count 1) to the point's tile position
+        geometry = [9, _pb_zigzag(int((px * n - x) * MVT_EXTENT)), _pb_zigzag(int((py * n - y) * MVT_EXTENT))]
+        encoded.append(_pb_field(2,
+            _pb_field(2, b''.join(_pb_varint(tag) for tag in tags))
+            + _pb_varint(3 << 3) + _pb_varint(1)  # type = POINT
+            + _pb_field(4, b''.join(_pb_varint(v) for v in geometry))))
+    layer = (_pb_varint(15 << 3) + _pb_varint(2)  # version = 2
+             + _pb_field(1, b'photos')
+             + b''.join(encoded)
+             + b''.join(_pb_field(3, key.encode('utf-8')) for key in keys)
+             + b''.join(_pb_field(4, _mvt_value(value)) for _, value in values)
+             + _pb_varint(5 << 3) + _pb_varint(MVT_EXTENT))
+    return _pb_field(3, layer)
+
+def _apply_tile_changes():
+    """Delete the cached tiles covering positions in tile_changes, then empty it"""
+    conn = get_connection()
+    first, last = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM tile_changes").fetchone()
+    if last is None:
+        return
+    if last - first >= TILE_INVALIDATE_ALL_AT:
+        clear_tile_cache()
+    else:
+        positions = conn.execute("SELECT DISTINCT latitude, longitude FROM tile_changes WHERE rowid <= ?",
+                                 (last,)).fetchall()
+        root = tile_cache_dir()
+        zooms = [int(name) for name in os.listdir(root) if name.isdigit()] if os.path.isdir(root) else []
+        removed = 0
+        for zoom in zooms:
+            for x, y in {tile_for(lat, lng, zoom) for lat, lng in positions}:
+                for fmt in TILE_FORMATS:
+                    try:
+                        os.remove(os.path.join(root, str(zoom), str(x), f"{y}.{fmt}"))
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        logger.debug(f"Database - Invalidated {removed} cached tiles for {len(positions)} changed positions")
+    conn.execute("DELETE FROM tile_changes WHERE rowid <= ?", (last,))
+    conn.commit()
+
+def apply_tile_changes():
+    """
+    Invalidate the cached tiles touched by logged photo writes and empty
+    tile_changes. get_tile does this on every request; bulk writers (sync,
+    import) call it when they finish, so the log does not keep growing for a
+    user who never opens the tile map.
+    """
+    logger.debug(f"=== FUNCTION DB: apply_tile_changes ===")
+    try:
+        with _tile_lock:
+            _apply_tile_changes()
+    except Exception as e:
+        logger.error(f"Database - Error applying tile changes: {str(e)}")
+
+def get_tile(zoom, x, y, fmt='geojson'):
+    """
+    One map tile of photo features, from the on-disk cache when possible.
+
+    Tiles are generated through the spatial index (or the cluster index up
+    to MAP_CLUSTER_MAX_ZOOM) and kept until a photo write logged in
+    tile_changes touches them. The lock makes draining the log, reading and
+    writing tiles one step, so a tile rendered from data older than a logged
+    change is always written before that change is applied.
+
+    Args:
+        zoom, x, y: Web-mercator tile coordinates
+        fmt: 'geojson' or 'mvt'
+
+    Returns:
+        Encoded tile bytes, or None on error
+    """
+    logger.debug(f"=== FUNCTION DB: get_tile === {zoom}/{x}/{y}.{fmt}")
+    path = os.path.join(tile_cache_dir(), str(zoom), str(x), f"{y}.{fmt}")
+    try:
+        with _tile_lock:
+            _apply_tile_changes()
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+
+            features = _tile_features(zoom, x, y)
+            data = _tile_mvt(features, zoom, x, y) if fmt == 'mvt' else _tile_geojson(features)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+            return data
+    except Exception as e:
+        logger.error(f"Database - Error getting tile {zoom}/{x}/{y}: {str(e)}")
+        return None
+
+# ---------------------------------------------------------------------------
+# Photos table paging
+# ---------------------------------------------------------------------------
+
+# Sortable columns of the photos table page that have a (column, photo_id) index
+TABLE_SORT_INDEXED_COLUMNS = ('latitude', 'longitude', 'capture_time', 'upload_time',
+                              'view_count', 'maps_publish_status', 'updated_at',
+                              'place_names', 'connection_count')
+
+# URL sort name -> SQL expression (whitelist; never interpolate user input)
+TABLE_SORT_COLUMNS = {
+    'photo_id': 'p.photo_id',
+    **{column: f'p.{column}' for column in TABLE_SORT_INDEXED_COLUMNS},
+}
+
+def encode_page_cursor(sort_by, sort_value, photo_id):
+    """Opaque, URL-safe cursor for a row position in a sort order"""
+    raw = json.dumps([sort_by, sort_value, photo_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor, sort_by):
+    """
+    Decode a cursor from encode_page_cursor().
+
+    Returns:
+        (sort_value, photo_id), or None if the cursor is malformed or was made
+        for a different sort column
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, sort_value, photo_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if cursor_sort != sort_by or not isinstance(photo_id, str):
+        return None
+    return sort_value, photo_id
+
+def _place_search_clause(term):
+    """
+    WHERE clause and params matching photos with a place label containing
+    term (case-insensitive substring). Uses the trigram index when the term
+    is long enough, else falls back to scanning places with LIKE.
+    """
+    if len(term) >= PLACE_SEARCH_MIN_CHARS:
+        phrase = '"' + term.replace('"', '""') + '"'
+        return ("p.photo_id IN (SELECT pf.photo_id FROM places_fts "
+                "JOIN places pf ON pf.id = places_fts.rowid WHERE places_fts MATCH ?)"), [phrase]
+    return ("EXISTS (SELECT 1 FROM places pf WHERE pf.photo_id = p.photo_id "
+            "AND COALESCE(pf.name, pf.place_id) LIKE ? ESCAPE '\\')"), [
+        '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%']
+
+def _bbox_clause(min_lat, max_lat, min_lng, max_lng):
+    """WHERE clause and params keeping photos inside a box, looked up through photos_rtree"""
+    ranges = _longitude_ranges(min_lng, max_lng)
+    branches = " UNION ALL ".join(
+        "SELECT id FROM photos_rtree WHERE min_lat <= ? AND max_lat >= ? AND min_lng <= ? AND max_lng >= ?"
+        for _ in ranges)
+    # The R*Tree rounds outwards, so exact coordinates are re-checked
+    recheck = " OR ".join("+p.longitude BETWEEN ? AND ?" for _ in ranges)
+    params = [value for lo, hi in ranges for value in (max_lat, min_lat, hi, lo)]
+    params += [min_lat, max_lat] + [value for lo, hi in ranges for value in (lo, hi)]
+    return f"p.rowid IN ({branches}) AND +p.latitude BETWEEN ? AND ? AND ({recheck})", params
+
+def _table_filter_sql(filters):
+    """WHERE clauses and params for the photos table filters"""
+    clauses = []
+    params = []
+    if filters.get('bbox'):
+        clause, clause_params = _bbox_clause(*filters['bbox'])
+        clauses.append(clause)
+        params.extend(clause_params)
+    statuses = filters.get('statuses')
+    if statuses:
+        clauses.append(f"p.maps_publish_status IN ({','.join('?' for _ in statuses)})")
+        params.extend(statuses)
+    if filters.get('places'):
+        clause, clause_params = _place_search_clause(filters['places'])
+        clauses.append(clause)
+        params.extend(clause_params)
+    for key, column, op in (('capture_from', 'capture_time', '>='), ('capture_to', 'capture_time', '<='),
+                            ('upload_from', 'upload_time', '>='), ('upload_to', 'upload_time', '<=')):
+        if filters.get(key):
+            clauses.append(f"p.{column} {op} ?")
+            params.append(filters[key])
+    return clauses, params
+
+def _table_order_sql(key_sql, direction):
+    """ORDER BY terms for a sort column with photo_id as the tie-breaker"""
+    if key_sql == 'p.photo_id':
+        # A repeated term would make SQLite sort the "right part" in a temp B-tree
+        return f"p.photo_id {direction}"
+    return f"{key_sql} {direction}, p.photo_id {direction}"
+
+def _keyset_segments(key_sql, position, ascending):
+    """
+    Split a keyset seek into NULL-aware segments, each a plain index range.
+
+    SQLite sorts NULL before every value, so in ascending order the sequence
+    is [NULL keys by photo_id] then [non-NULL keys by (key, photo_id)], and
+    the reverse when descending. Seeking past position (sort_value, photo_id)
+    becomes at most two range scans.
+
+    Returns:
+        List of (where_sql, params, order_sql) in output order
+    """
+    direction = 'ASC' if ascending else 'DESC'
+    null_segment = (f"{key_sql} IS NULL", [], f"p.photo_id {direction}")
+    value_segment = (f"{key_sql} IS NOT NULL", [], _table_order_sql(key_sql, direction))
+    op = '>' if ascending else '<'
+
+    if position is None:
+        segments = [null_segment, value_segment]
+    elif position[0] is None:
+        # Still inside the NULL run; in descending order nothing follows it
+        segments = [(f"{key_sql} IS NULL AND p.photo_id {op} ?", [position[1]], null_segment[2]), value_segment]
+    else:
+        # Row-value comparison is false for NULL keys, so only values match;
+        # in ascending order nothing remains of the NULL run
+        segments = [(f"({key_sql}, p.photo_id) {op} (?, ?)", list(position), value_segment[2]), null_segment]
+
+    if position is not None:
+        return segments if (position[0] is None) == ascending else segments[:1]
+    return segments if ascending else segments[::-1]
+
+def get_photos_table_page(sort_by='upload_time', sort_order='desc', filters=None, limit=25,
+                          after=None, before=None, last=False, offset=0):
+    """
+    Fetch one page of the photos table using keyset pagination.
+
+    Rows are ordered by (sort column, photo_id). A page is located by an
+    opaque cursor rather than an OFFSET, so every page costs about the same.
+
+    Args:
+        sort_by: Key of TABLE_SORT_COLUMNS (unknown values fall back to upload_time)
+        sort_order: 'asc' or 'desc'
+        filters: Dict with optional statuses, places, capture_from/to and
+            upload_from/to (ISO timestamps)
+        limit: Rows per page, or None for every matching row
+        after: Cursor of the last row of the previous page (next page)
+        before: Cursor of the first row of the following page (previous page)
+        last: Fetch the final page (aligned to limit-sized pages from the start)
+        offset: Row offset for direct page links without a cursor
+
+    Returns:
+        Dict with photos (row dicts incl. place_names and connection_count),
+        total_records, first_cursor, last_cursor and status_values
+    """
+    logger.debug(f"=== FUNCTION DB: get_photos_table_page === sort={sort_by} {sort_order}")
+    if sort_by not in TABLE_SORT_COLUMNS:
+        sort_by = 'upload_time'
+    ascending = sort_order == 'asc'
+    key_sql = TABLE_SORT_COLUMNS[sort_by]
+
+    cursor = get_connection(readonly=True).cursor()
+    filter_clauses, filter_params = _table_filter_sql(filters or {})
+
+    where = (" WHERE " + " AND ".join(filter_clauses)) if filter_clauses else ""
+    cursor.execute(f"SELECT COUNT(*) FROM photos p{where}", filter_params)
+    total_records = cursor.fetchone()[0]
+
+    cursor.execute("SELECT DISTINCT maps_publish_status FROM photos WHERE maps_publish_status IS NOT NULL")
+    status_values = [row[0] for row in cursor.fetchall()]
+
+    select = f"SELECT p.*, {key_sql} AS sort_key FROM photos p"
+
+    position = None
+    reverse = False
+    if before is not None:
+        position = decode_page_cursor(before, sort_by)
+        reverse = position is not None
+    elif after is not None:
+        position = decode_page_cursor(after, sort_by)
+    elif last and limit:
+        reverse = True
+        limit = total_records % limit or limit
+
+    rows = []
+    if position is None and not reverse and offset:
+        direction = 'ASC' if ascending else 'DESC'
+        sql = f"{select}{where} ORDER BY {_table_order_sql(key_sql, direction)} LIMIT ? OFFSET ?"
+        cursor.execute(sql, filter_params + [limit if limit is not None else -1, offset])
+        rows = cursor.fetchall()
+    else:
+        # Paging backwards walks the index the other way, then flips the rows
+        for seg_where, seg_params, order in _keyset_segments(key_sql, position, ascending != reverse):
+            remaining = -1 if limit is None else limit - len(rows)
+            if remaining == 0:
+                break
+            clauses = filter_clauses + [seg_where]
+            cursor.execute(f"{select} WHERE {' AND '.join(clauses)} ORDER BY {order} LIMIT ?",
+                           filter_params + seg_params + [remaining])
+            rows.extend(cursor.fetchall())
+        if reverse:
+            rows.reverse()
+
+    photos = []
+    for row in rows:
+        photo = dict(row)
+        photo.pop('sort_key', None)
+        photos.append(photo)
+
+    return {
+        'photos': photos,
+        'total_records': total_records,
+        'status_values': status_values,
+        'first_cursor': encode_page_cursor(sort_by, rows[0]['sort_key'], rows[0]['photo_id']) if rows else None,
+        'last_cursor': encode_page_cursor(sort_by, rows[-1]['sort_key'], rows[-1]['photo_id']) if rows else None,
+    }
+
+# (sort, filter) signatures whose navigation order is kept per thread
+NAVIGATION_CACHE_SIZE = 8
+
+def _navigation_order(sort_by, sort_order, filters):
+    """
+    Ordered photo IDs of the photos table for one sort and filter, with an
+    ID -> position map. Built with one index-ordered query and cached until
+    the database changes.
+    """
+    if sort_by not in TABLE_SORT_COLUMNS:
+        sort_by = 'upload_time'
+    direction = 'ASC' if sort_order == 'asc' else 'DESC'
+    filters = filters or {}
+    signature = (sort_by, direction, json.dumps(filters, sort_keys=True))
+
+    conn, cache = _thread_cache('navigation')
+    order = cache.pop(signature, None)
+    if order is None:
+        clauses, params = _table_filter_sql(filters)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        # Same order as get_photos_table_page: NULL keys sort first
+        cursor = conn.execute(f"SELECT p.photo_id FROM photos p{where} "
+                              f"ORDER BY {_table_order_sql(TABLE_SORT_COLUMNS[sort_by], direction)}",
+                              params)
+        ids = [row[0] for row in cursor.fetchall()]
+        order = (ids, {photo_id: index for index, photo_id in enumerate(ids)})
+        if len(cache) >= NAVIGATION_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+    cache[signature] = order  # re-insert as most recently used
+    return order
+
+def get_photo_navigation(photo_id, sort_by='upload_time', sort_order='desc', filters=None):
+    """
+    Previous and next photo around photo_id in the photos table order.
+
+    Args:
+        photo_id: Current photo
+        sort_by, sort_order, filters: As for get_photos_table_page(); if the
+            photo is outside the filtered set, the unfiltered order is used
+
+    Returns:
+        Dict with previous, next (photo IDs or None), position (1-based) and
+        total, or None if the photo is not in the database
+    """
+    logger.debug(f"=== FUNCTION DB: get_photo_navigation === photo_id={photo_id}")
+    try:
+        ids, positions = _navigation_order(sort_by, sort_order, filters)
+        if photo_id not in positions and filters:
+            ids, positions = _navigation_order(sort_by, sort_order, None)
+        index = positions.get(photo_id)
+        if index is None:
             return None
-            
+        return {
+            'previous': ids[index - 1] if index > 0 else None,
+            'next': ids[index + 1] if index + 1 < len(ids) else None,
+            'position': index + 1,
+            'total': len(ids),
+        }
     except Exception as e:
-        logger.error(f"Database - Error getting next photo: {str(e)}")
+        logger.error(f"Database - Error getting photo navigation: {str(e)}")
         return None
-        
+
+# ---------------------------------------------------------------------------
+# Exports
+# ---------------------------------------------------------------------------
+
+# Flat per-photo fields written by the tabular/geographic export formats
+EXPORT_COLUMNS = ('photo_id', 'latitude', 'longitude', 'heading', 'altitude', 'pitch', 'roll',
+                  'capture_time', 'upload_time', 'view_count', 'maps_publish_status',
+                  'place_names', 'connection_count', 'share_link', 'thumbnail_url')
+
+def iter_export_photos(filters=None, api_format=False, require_gps=False, batch_size=UPSERT_CHUNK_SIZE):
+    """
+    Stream photos for an export, batch_size rows at a time, in photo ID order.
+
+    Rows are read with fetchmany() from a dedicated read-only connection, so
+    memory stays constant whatever the size of the database and the export
+    sees one consistent snapshot even while a sync is writing.
+
+    Args:
+        filters: As for get_photos_table_page(), plus 'bbox' as
+            (min_lat, max_lat, min_lng, max_lng)
+        api_format: Yield API-shaped photos with places and connections
+            (re-importable); otherwise flat dicts of EXPORT_COLUMNS
+        require_gps: Skip photos without coordinates
+
+    Yields:
+        Lists of photo dicts
+    """
+    logger.debug(f"=== FUNCTION DB: iter_export_photos === filters={filters}")
+    clauses, params = _table_filter_sql(filters or {})
+    if require_gps:
+        clauses.append("p.latitude IS NOT NULL AND p.longitude IS NOT NULL")
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    columns = "p.*" if api_format else ", ".join(f"p.{column}" for column in EXPORT_COLUMNS)
+
+    conn = _open_connection(DATABASE_PATH, readonly=True)
+    try:
+        conn.execute("BEGIN")  # one snapshot for the whole export
+        cursor = conn.execute(f"SELECT {columns} FROM photos p{where} ORDER BY p.photo_id", params)
+        lookup = conn.cursor()
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if api_format:
+                yield _hydrate(lookup, rows, api_format=True)
+            else:
+                yield [dict(row) for row in rows]
     finally:
-        if conn:
-            conn.close()
+        conn.close()
 
-def get_previous_photo_by_capture_time(current_photo_id):
+# Sync job states that count as "in progress"; only one such job may exist.
+SYNC_JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+SYNC_JOB_FIELDS = ('status', 'pages_fetched', 'photos_fetched', 'rows_upserted', 'rows_inserted',
+                   'rows_changed', 'rows_unchanged', 'rows_deleted',
+                   'expected_total', 'cancel_requested', 'error', 'started_at', 'finished_at')
+
+def create_sync_job(job_id, expected_total=None):
     """
-    Get the previous photo based on photos.html default sorting (upload_time DESC, photo_id ASC)
-    Previous = newer in the list (going forward chronologically from oldest to newest)
-    
+    Record a new queued sync job, unless another job is already active.
+
+    The check and insert run in one IMMEDIATE transaction so two requests can
+    never both start a sync.
+
+    Returns:
+        True if the job was created, False if another job is active
+    """
+    logger.debug(f"=== FUNCTION DB: create_sync_job === job_id={job_id}")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        placeholders = ','.join('?' for _ in SYNC_JOB_ACTIVE_STATUSES)
+        cursor.execute(f"SELECT job_id FROM sync_jobs WHERE status IN ({placeholders}) LIMIT 1",
+                       SYNC_JOB_ACTIVE_STATUSES)
+        if cursor.fetchone():
+            conn.rollback()
+            return False
+        now = datetime.now().isoformat()
+        cursor.execute('''
+        INSERT INTO sync_jobs (job_id, status, expected_total, created_at, updated_at)
+        VALUES (?, 'queued', ?, ?, ?)
+        ''', (job_id, expected_total, now, now))
+        conn.commit()
+        logger.info(f"Database - Created sync job {job_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Database - Error creating sync job {job_id}: {str(e)}")
+        conn.rollback()
+        return False
+
+def update_sync_job(job_id, **fields):
+    """Update progress/status columns of a sync job. Unknown field names are ignored."""
+    logger.debug(f"=== FUNCTION DB: update_sync_job === job_id={job_id}")
+    updates = {k: v for k, v in fields.items() if k in SYNC_JOB_FIELDS}
+    if not updates:
+        return False
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        assignments = ', '.join(f"{column} = ?" for column in updates)
+        params = list(updates.values()) + [datetime.now().isoformat(), job_id]
+        cursor.execute(f"UPDATE sync_jobs SET {assignments}, updated_at = ? WHERE job_id = ?", params)
+        conn.commit()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Database - Error updating sync job {job_id}: {str(e)}")
+        conn.rollback()
+        return False
+
+def get_sync_job(job_id=None):
+    """
+    Fetch a sync job as a dict.
+
     Args:
-        current_photo_id: The ID of the current photo
-        
+        job_id: The job to fetch, or None for the most recently created job
+
     Returns:
-        Photo ID of the previous photo, or None if this is the first photo in the list
+        The job dict, or None if no such job exists
     """
-    logger.debug(f"=== FUNCTION DB: get_previous_photo_by_capture_time ===")
-    conn = None
+    logger.debug(f"=== FUNCTION DB: get_sync_job === job_id={job_id}")
+    conn = get_connection()
+    cursor = conn.cursor()
     try:
-        # Connect to the database
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # First get the current photo's upload_time and photo_id for comparison
-        cursor.execute("SELECT upload_time, photo_id FROM photos WHERE photo_id = ?", (current_photo_id,))
-        current_row = cursor.fetchone()
-        
-        if not current_row:
-            logger.debug(f"Current photo {current_photo_id} not found")
-            return None
-            
-        current_upload_time = current_row['upload_time']
-        current_photo_id_str = current_row['photo_id']
-        
-        logger.debug(f"Current photo: {current_photo_id_str}, upload_time: {current_upload_time}")
-        
-        # Get the previous photo using the same sorting as photos.html (upload_time DESC, photo_id ASC)
-        # For previous (newer in chronological order), we need:
-        # 1. Photos with upload_time > current_upload_time, OR
-        # 2. Photos with upload_time = current_upload_time AND photo_id < current_photo_id
-        # Order DESC, ASC but get the last one before current position
-        cursor.execute("""
-            SELECT photo_id FROM photos
-            WHERE (
-                upload_time > ? OR
-                (upload_time = ? AND photo_id < ?)
-            ) AND upload_time IS NOT NULL
-            ORDER BY upload_time ASC, photo_id DESC
-            LIMIT 1
-        """, (current_upload_time, current_upload_time, current_photo_id_str))
-        
-        previous_row = cursor.fetchone()
-        if previous_row:
-            logger.debug(f"Found previous photo: {previous_row['photo_id']} for current photo: {current_photo_id_str}")
-            return previous_row['photo_id']
+        if job_id is None:
+            cursor.execute("SELECT * FROM sync_jobs ORDER BY created_at DESC LIMIT 1")
         else:
-            logger.debug(f"No previous photo found for {current_photo_id_str} - this is the first photo")
+            cursor.execute("SELECT * FROM sync_jobs WHERE job_id = ?", (job_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Database - Error reading sync job {job_id}: {str(e)}")
+        return None
+
+def get_active_sync_job():
+    """Return the queued/running sync job, or None if the sync worker is idle."""
+    logger.debug(f"=== FUNCTION DB: get_active_sync_job ===")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        placeholders = ','.join('?' for _ in SYNC_JOB_ACTIVE_STATUSES)
+        cursor.execute(f"SELECT * FROM sync_jobs WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT 1",
+                       SYNC_JOB_ACTIVE_STATUSES)
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Database - Error reading active sync job: {str(e)}")
+        return None
+
+def mark_interrupted_sync_jobs():
+    """
+    Flag jobs left queued/running by a previous process as interrupted.
+
+    Called at startup: any job still marked active cannot have a live thread
+    behind it, and leaving it active would block new syncs forever.
+
+    Returns:
+        Number of jobs marked interrupted
+    """
+    logger.debug(f"=== FUNCTION DB: mark_interrupted_sync_jobs ===")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        now = datetime.now().isoformat()
+        placeholders = ','.join('?' for _ in SYNC_JOB_ACTIVE_STATUSES)
+        cursor.execute(f'''
+        UPDATE sync_jobs SET status = 'interrupted', finished_at = ?, updated_at = ?,
+               error = 'Server restarted while the sync was running'
+        WHERE status IN ({placeholders})
+        ''', (now, now) + SYNC_JOB_ACTIVE_STATUSES)
+        conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Database - Marked {cursor.rowcount} sync job(s) as interrupted")
+        return cursor.rowcount
+    except Exception as e:
+        logger.error(f"Database - Error marking interrupted sync jobs: {str(e)}")
+        conn.rollback()
+        return 0
+
+# Upload job file states. A file is 'waiting' until its bytes are handed
+# over, then 'receiving' while they are spooled, and the worker pool takes
+# it through 'queued', 'uploading' and 'creating' to 'done' or 'failed'.
+UPLOAD_FILE_ACTIVE_STATUSES = ('receiving', 'queued', 'uploading', 'creating')
+UPLOAD_FILE_CLAIMABLE_STATUSES = ('waiting', 'failed', 'interrupted')
+
+UPLOAD_JOB_FILE_FIELDS = ('status', 'size', 'attempts', 'photo_id', 'share_link', 'error',
+                          'started_at', 'finished_at')
+
+def create_upload_job(job_id, files):
+    """
+    Record a new upload job and its files, all 'waiting' for their bytes.
+
+    Args:
+        job_id: The job ID
+        files: Dicts with filename, latitude, longitude and optional heading,
+            place_id and capture_time, in upload order
+
+    Returns:
+        True if the job was created, False on error
+    """
+    logger.debug(f"=== FUNCTION DB: create_upload_job === job_id={job_id}")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        now = datetime.now().isoformat()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('INSERT INTO upload_jobs (job_id, file_count, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                       (job_id, len(files), now, now))
+        cursor.executemany('''
+        INSERT INTO upload_job_files (job_id, file_index, filename, latitude, longitude, heading,
+                                      place_id, capture_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'waiting')
+        ''', [(job_id, index, f['filename'], f['latitude'], f['longitude'], f.get('heading'),
+               f.get('place_id'), f.get('capture_time')) for index, f in enumerate(files)])
+        conn.commit()
+        logger.info(f"Database - Created upload job {job_id} with {len(files)} file(s)")
+        return True
+    except Exception as e:
+        logger.error(f"Database - Error creating upload job {job_id}: {str(e)}")
+        conn.rollback()
+        return False
+
+def claim_upload_job_file(job_id, file_index):
+    """
+    Move a waiting (or failed/interrupted, for a retry) file to 'receiving'.
+
+    The status check and update are one statement, so two handovers of the
+    same file can never both be accepted.
+
+    Returns:
+        The file dict if it was claimed, None otherwise
+    """
+    logger.debug(f"=== FUNCTION DB: claim_upload_job_file === job_id={job_id} file_index={file_index}")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        placeholders = ','.join('?' for _ in UPLOAD_FILE_CLAIMABLE_STATUSES)
+        cursor.execute(f'''
+        UPDATE upload_job_files SET status = 'receiving', error = NULL, finished_at = NULL
+        WHERE job_id = ? AND file_index = ? AND status IN ({placeholders})
+        ''', (job_id, file_index) + UPLOAD_FILE_CLAIMABLE_STATUSES)
+        row = None
+        if cursor.rowcount:
+            cursor.execute("SELECT * FROM upload_job_files WHERE job_id = ? AND file_index = ?",
+                           (job_id, file_index))
+            row = cursor.fetchone()
+        conn.commit()
+        return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Database - Error claiming upload file {job_id}/{file_index}: {str(e)}")
+        conn.rollback()
+        return None
+
+def update_upload_job_file(job_id, file_index, **fields):
+    """Update status/result columns of an upload job file. Unknown field names are ignored."""
+    logger.debug(f"=== FUNCTION DB: update_upload_job_file === job_id={job_id} file_index={file_index}")
+    updates = {k: v for k, v in fields.items() if k in UPLOAD_JOB_FILE_FIELDS}
+    if not updates:
+        return False
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        assignments = ', '.join(f"{column} = ?" for column in updates)
+        cursor.execute(f"UPDATE upload_job_files SET {assignments} WHERE job_id = ? AND file_index = ?",
+                       list(updates.values()) + [job_id, file_index])
+        cursor.execute("UPDATE upload_jobs SET updated_at = ? WHERE job_id = ?",
+                       (datetime.now().isoformat(), job_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Database - Error updating upload file {job_id}/{file_index}: {str(e)}")
+        conn.rollback()
+        return False
+
+def get_upload_job(job_id=None):
+    """
+    Fetch an upload job as a dict with its files, in upload order, under 'files'.
+
+    Args:
+        job_id: The job to fetch, or None for the most recently created job
+
+    Returns:
+        The job dict, or None if no such job exists
+    """
+    logger.debug(f"=== FUNCTION DB: get_upload_job === job_id={job_id}")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if job_id is None:
+            cursor.execute("SELECT * FROM upload_jobs ORDER BY created_at DESC LIMIT 1")
+        else:
+            cursor.execute("SELECT * FROM upload_jobs WHERE job_id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
             return None
-            
+        job = dict(row)
+        cursor.execute("SELECT * FROM upload_job_files WHERE job_id = ? ORDER BY file_index", (job['job_id'],))
+        job['files'] = [dict(file_row) for file_row in cursor.fetchall()]
+        return job
     except Exception as e:
-        logger.error(f"Database - Error getting previous photo: {str(e)}")
+        logger.error(f"Database - Error reading upload job {job_id}: {str(e)}")
         return None
-        
-    finally:
-        if conn:
-            conn.close()
+
+def mark_interrupted_upload_jobs():
+    """
+    Flag upload job files left in progress by a previous process as interrupted.
+
+    Called at startup: their spooled bytes and worker threads died with the
+    process. Interrupted files can be handed over again to retry them.
+
+    Returns:
+        Number of files marked interrupted
+    """
+    logger.debug(f"=== FUNCTION DB: mark_interrupted_upload_jobs ===")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        placeholders = ','.join('?' for _ in UPLOAD_FILE_ACTIVE_STATUSES)
+        cursor.execute(f'''
+        UPDATE upload_job_files SET status = 'interrupted', finished_at = ?,
+               error = 'Server restarted while the file was being uploaded'
+        WHERE status IN ({placeholders})
+        ''', (datetime.now().isoformat(),) + UPLOAD_FILE_ACTIVE_STATUSES)
+        conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Database - Marked {cursor.rowcount} upload file(s) as interrupted")
+        return cursor.rowcount
+    except Exception as e:
+        logger.error(f"Database - Error marking interrupted upload files: {str(e)}")
+        conn.rollback()
+        return 0
+
+# ---------------------------------------------------------------------------
+# Upload ledger
+# ---------------------------------------------------------------------------
+
+# A numbered record file (<stem>_<n>.json) written when <stem>.json existed
+_NUMBERED_RECORD = re.compile(r'^(.*)_\d+$')
+
+def _ledger_row(filename_stem, create_photo_response, filename=None, content_hash=None, json_file=None,
+                created_at=None):
+    return (filename_stem, filename, content_hash,
+            (create_photo_response.get('photoId') or {}).get('id') or None,
+            create_photo_response.get('mapsPublishStatus'), create_photo_response.get('shareLink'),
+            create_photo_response.get('uploadTime'), json_file,
+            created_at or datetime.now().isoformat())
+
+_LEDGER_INSERT = '''
+INSERT INTO uploads (filename_stem, filename, content_hash, photo_id, maps_publish_status,
+                     share_link, upload_time, json_file, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (photo_id) DO UPDATE SET
+    filename_stem = excluded.filename_stem, filename = excluded.filename,
+    content_hash = COALESCE(excluded.content_hash, content_hash),
+    maps_publish_status = excluded.maps_publish_status, share_link = excluded.share_link,
+    upload_time = excluded.upload_time, json_file = excluded.json_file
+'''
+
+def record_upload(filename, create_photo_response, content_hash=None, json_file=None):
+    """
+    Add an uploaded photo to the upload ledger (or refresh its row).
+
+    Args:
+        filename: The original photo filename; its stem is the lookup key
+        create_photo_response: The photo resource returned by create_photo
+        content_hash: SHA-256 hex digest of the original file, if known
+        json_file: Name of the record file written to the uploads directory
+
+    Returns:
+        True if the row was written, False on error
+    """
+    logger.debug(f"=== FUNCTION DB: record_upload === filename={filename}")
+    conn = get_connection()
+    try:
+        filename = os.path.basename(filename)
+        conn.execute(_LEDGER_INSERT, _ledger_row(os.path.splitext(filename)[0], create_photo_response,
+                                                 filename, content_hash, json_file))
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Database - Error recording upload of {filename}: {str(e)}")
+        conn.rollback()
+        return False
+
+def migrate_upload_records(directory):
+    """
+    Import the per-photo JSON records older versions kept in the uploads
+    directory into the upload ledger. Runs once per database; the files are
+    left in place.
+
+    A numbered record (<stem>_<n>.json) belongs to <stem> when <stem>.json
+    exists too, as that is the only case in which one was written.
+
+    Returns:
+        Number of records imported (0 if already migrated or on error)
+    """
+    logger.debug(f"=== FUNCTION DB: migrate_upload_records ===")
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute("SELECT 1 FROM migrations WHERE name = 'upload_records'")
+        if cursor.fetchone():
+            conn.rollback()
+            return 0
+        json_files = sorted(name for name in os.listdir(directory) if name.endswith('.json')) \
+            if os.path.isdir(directory) else []
+        stems = {os.path.splitext(name)[0] for name in json_files}
+        rows = []
+        for json_file in json_files:
+            path = os.path.join(directory, json_file)
+            try:
+                with open(path, 'r') as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Database - Skipping unreadable upload record {json_file}: {str(e)}")
+                continue
+            if not isinstance(record, dict):
+                continue
+            stem = os.path.splitext(json_file)[0]
+            numbered = _NUMBERED_RECORD.match(stem)
+            if numbered and numbered.group(1) in stems:
+                stem = numbered.group(1)
+            created_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            rows.append(_ledger_row(stem, record, json_file=json_file, created_at=created_at))
+        cursor.executemany(_LEDGER_INSERT, rows)
+        cursor.execute("INSERT INTO migrations (name, applied_at) VALUES ('upload_records', ?)",
+                       (datetime.now().isoformat(),))
+        conn.commit()
+        logger.info(f"Database - Imported {len(rows)} upload record(s) into the upload ledger")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Database - Error importing upload records: {str(e)}")
+        conn.rollback()
+        return 0
+
+def get_uploads_by_stems(filename_stems):
+    """
+    Look up the ledger for many filename stems in one indexed query.
+
+    Where a stem was uploaded more than once, a PUBLISHED upload wins over
+    others, then the newest.
+
+    Returns:
+        Dict of filename stem -> ledger row dict, for stems that were uploaded
+    """
+    logger.debug(f"=== FUNCTION DB: get_uploads_by_stems === count={len(filename_stems)}")
+    if not filename_stems:
+        return {}
+    conn = get_connection(readonly=True)
+    try:
+        # The stems are bound as one JSON array, so any number costs one query
+        rows = conn.execute('''
+        SELECT * FROM uploads WHERE filename_stem IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(filename_stems)),)).fetchall()
+        best = {}
+        for row in rows:
+            rank = (row['maps_publish_status'] == 'PUBLISHED', row['id'])
+            current = best.get(row['filename_stem'])
+            if current is None or rank > current[0]:
+                best[row['filename_stem']] = (rank, row)
+        return {stem: dict(row) for stem, (_, row) in best.items()}
+    except Exception as e:
+        logger.error(f"Database - Error reading upload ledger: {str(e)}")
+        return {}
+
+def get_upload_filenames(photo_ids):
+    """
+    Map photo IDs to the filename they were uploaded from (the record file
+    name for uploads imported from JSON records).
+
+    Returns:
+        Dict of photo_id -> filename, for photos in the ledger
+    """
+    logger.debug(f"=== FUNCTION DB: get_upload_filenames === count={len(photo_ids)}")
+    if not photo_ids:
+        return {}
+    conn = get_connection(readonly=True)
+    try:
+        rows = conn.execute('''
+        SELECT photo_id, COALESCE(filename, json_file) FROM uploads
+        WHERE photo_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(photo_ids)),)).fetchall()
+        return {photo_id: filename for photo_id, filename in rows}
+    except Exception as e:
+        logger.error(f"Database - Error reading upload filenames: {str(e)}")
+        return {}
+
+def delete_uploads(photo_ids):
+    """
+    Remove deleted photos from the upload ledger, so their files can be
+    uploaded again without showing as already uploaded.
+
+    Returns:
+        Names of the record files of the removed rows, for the caller to delete
+    """
+    logger.debug(f"=== FUNCTION DB: delete_uploads === count={len(photo_ids)}")
+    if not photo_ids:
+        return []
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        ids = json.dumps(list(photo_ids))
+        cursor.execute("SELECT json_file FROM uploads WHERE photo_id IN (SELECT value FROM json_each(?))"
+                       " AND json_file IS NOT NULL", (ids,))
+        json_files = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM uploads WHERE photo_id IN (SELECT value FROM json_each(?))", (ids,))
+        conn.commit()
+        return json_files
+    except Exception as e:
+        logger.error(f"Database - Error removing uploads from the ledger: {str(e)}")
+        conn.rollback()
+        return []
@@ -1,10 +1,14 @@
 """
 Shared pytest fixtures for all test modules.
 """
+import logging
 import os
+import shutil
 import sqlite3
 import tempfile
+import threading
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import MagicMock, patch
 
 
@@ -19,6 +23,28 @@ os.environ.setdefault('REDIRECT_URI', 'http://127.0.0.1:5001/oauth2callback')
 os.environ.setdefault('OAUTHLIB_INSECURE_TRANSPORT', '1')
 
 
+# ---------------------------------------------------------------------------
+# Keep the test run out of the real userdata/
+# ---------------------------------------------------------------------------
+# Importing app runs init_app(), which creates userdata/ (config, logs,
+# uploads) relative to the working directory and prepares the database at
+# database.DATABASE_PATH. Both are pointed at a scratch directory before the
+# test modules (and so app) are imported.
+_SCRATCH_DIR = tempfile.mkdtemp(prefix='streetview-tests-')
+_ORIGINAL_CWD = os.getcwd()
+
+
+def pytest_sessionstart(session):
+    import database as db_module
+    os.chdir(_SCRATCH_DIR)
+    db_module.DATABASE_PATH = os.path.join(_SCRATCH_DIR, 'userdata', 'data', 'streetview_photos.db')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(_ORIGINAL_CWD)
+    shutil.rmtree(_SCRATCH_DIR, ignore_errors=True)
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -101,8 +127,27 @@ def app_instance(tmp_path, monkeypatch):
     # Patch config so uploads point to tmp dir
     app_module.config['uploads']['directory'] = uploads_dir
 
+    # Log to this test's tmp_path
+    log_config = dict(app_module.config, logging=dict(app_module.config['logging'],
+                                                      file=str(tmp_path / 'logs' / 'streetview.log')))
+    app_module.setup_logging(app_module.app, log_config)
+
     yield app_module.app
 
+    for handler in logging.getLogger().handlers:
+        handler.close()
+
+
+@pytest.fixture()
+def synced_db(app_instance):
+    """
+    Record a completed sync on the app's database, so routes gated on a
+    created photo database serve the (still empty) database.
+    """
+    import database as db_module
+    db_module.create_sync_job('fixture-sync')
+    db_module.update_sync_job('fixture-sync', status='completed')
+
 
 @pytest.fixture()
 def client(app_instance):
@@ -126,3 +171,83 @@ def auth_client(app_instance, tmp_path):
     with patch('app.get_credentials', return_value=mock_creds):
         with app_instance.test_client() as c:
             yield c
+
+
+# ---------------------------------------------------------------------------
+# Local stub HTTP server
+# ---------------------------------------------------------------------------
+
+class StubServer:
+    """
+    Minimal keep-alive HTTP/1.1 server for exercising outbound API calls.
+
+    Tests register a responder per (method, path); each responder receives the
+    recorded request dict and returns (status, headers, body), or None to drop
+    the connection without a response. Every request is appended to
+    .requests, including the client port so connection reuse can be asserted.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responders = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                path = self.path.split('?', 1)[0]
+                record = {
+                    'method': self.command,
+                    'path': path,
+                    'raw_path': self.path,
+                    'headers': dict(self.headers),
+                    'body': body,
+                    'client_port': self.client_address[1],
+                }
+                stub.requests.append(record)
+                responder = stub.responders.get((self.command, path))
+                if responder is None:
+                    status, headers, payload = 404, {}, b'{}'
+                else:
+                    response = responder(record)
+                    if response is None:
+                        self.close_connection = True
+                        return
+                    status, headers, payload = response
+                if isinstance(payload, str):
+                    payload = payload.encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def route(self, method, path, responder):
+        self.responders[(method, path)] = responder
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture()
+def stub_server():
+    """A running StubServer, shut down after the test."""
+    server = StubServer()
+    yield server
+    server.close()
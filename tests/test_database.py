@@ -4,11 +4,20 @@ Tests for database.py operations:
   - insert_or_update_photo()
   - get_photo_from_db()
   - get_all_photos_from_db()
+  - import_photos_from_json() (streaming array / NDJSON)
   - get_connections_by_photo_ids()
   - clean_deleted_photos()
-  - get_db_stats()
+  - get_db_stats() and its cache
   - get_nearby_photos()
+  - Spatial index (radius, nearest and antimeridian queries)
+  - Photos table paging, place search and denormalized aggregates
+  - Edit page navigation
+  - Map clustering and tiles
+  - Sync jobs, upload jobs and the upload ledger
+  - Connection pool
 """
+import json
+import os
 import pytest
 from unittest.mock import patch
 
@@ -53,8 +62,8 @@ class TestInitDb:
         index_names = {row[0] for row in cursor.fetchall()}
         conn.close()
         assert 'idx_photos_lat_lng' in index_names
-        assert 'idx_photos_upload_time' in index_names
-        assert 'idx_photos_maps_publish_status' in index_names
+        assert 'idx_photos_upload_time_id' in index_names
+        assert 'idx_photos_maps_publish_status_id' in index_names
         assert 'idx_places_photo_id' in index_names
         assert 'idx_connections_source' in index_names
         assert 'idx_connections_target' in index_names
@@ -171,6 +180,217 @@ class TestInsertOrUpdatePhoto:
         assert retrieved['view_count'] == 1234
 
 
+# ---------------------------------------------------------------------------
+# upsert_photos
+# ---------------------------------------------------------------------------
+
+class TestUpsertPhotos:
+    def test_stores_all_photos(self, tmp_db):
+        photos = [make_photo_data(f'bulk-{i}') for i in range(25)]
+        assert db_module.upsert_photos(photos, chunk_size=10) == 25
+        assert db_module.get_db_stats()['photo_count'] == 25
+
+    def test_accepts_generator(self, tmp_db):
+        assert db_module.upsert_photos(make_photo_data(f'gen-{i}') for i in range(3)) == 3
+
+    def test_skips_invalid_photos(self, tmp_db):
+        photos = [make_photo_data('good'), {'pose': {}}, {}]
+        assert db_module.upsert_photos(photos) == 1
+
+    def test_update_keeps_rowid(self, tmp_db):
+        import sqlite3
+        db_module.upsert_photos([make_photo_data('same')])
+        conn = sqlite3.connect(tmp_db)
+        before = conn.execute("SELECT rowid FROM photos WHERE photo_id = 'same'").fetchone()[0]
+        db_module.upsert_photos([make_photo_data('same', viewCount=99)])
+        after = conn.execute("SELECT rowid, view_count FROM photos WHERE photo_id = 'same'").fetchone()
+        conn.close()
+        assert after == (before, 99)
+
+    def test_connections_within_same_chunk(self, tmp_db):
+        photos = [
+            make_photo_data('src', connections=[{'target': {'id': 'dst'}}, {'target': {'id': 'missing'}}]),
+            make_photo_data('dst'),
+        ]
+        db_module.upsert_photos(photos)
+        retrieved = db_module.get_photo_from_db('src')
+        assert retrieved['connections'] == [{'target': {'id': 'dst'}}]
+
+    def test_bad_record_does_not_drop_chunk(self, tmp_db):
+        photos = [make_photo_data('ok-1'), make_photo_data('bad', places=[None]), make_photo_data('ok-2')]
+        assert db_module.upsert_photos(photos) == 2
+        assert db_module.get_photo_from_db('ok-1') is not None
+        assert db_module.get_photo_from_db('ok-2') is not None
+
+    def test_single_transaction_per_chunk(self, tmp_db, monkeypatch):
+        import sqlite3
+        commits = []
+        real_connect = sqlite3.connect
+
+        class CountingConnection(sqlite3.Connection):
+            def commit(self):
+                commits.append(1)
+                return super().commit()
+
+        monkeypatch.setattr(db_module.sqlite3, 'connect',
+                            lambda *a, **kw: real_connect(*a, factory=CountingConnection, **kw))
+        db_module.close_connections()
+        db_module.upsert_photos([make_photo_data(f'tx-{i}') for i in range(100)], chunk_size=50)
+        assert len(commits) == 2
+
+
+class TestContentHash:
+    def _row(self, db_file, photo_id):
+        import sqlite3
+        conn = sqlite3.connect(db_file)
+        row = conn.execute("SELECT updated_at, content_hash, view_count FROM photos WHERE photo_id = ?",
+                           (photo_id,)).fetchone()
+        conn.close()
+        return row
+
+    def test_counts_inserted_changed_unchanged(self, tmp_db):
+        counts = {}
+        db_module.upsert_photos([make_photo_data('a'), make_photo_data('b')], counts=counts)
+        db_module.upsert_photos([make_photo_data('a'), make_photo_data('b', shareLink='new'),
+                                 make_photo_data('c')], counts=counts)
+        assert counts == {'inserted': 3, 'changed': 1, 'unchanged': 1}
+
+    def test_unchanged_photo_not_rewritten(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('same')])
+        before = self._row(tmp_db, 'same')
+        db_module.upsert_photos([make_photo_data('same')])
+        assert self._row(tmp_db, 'same') == before
+
+    def test_view_count_only_change_updates_views(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('views')])
+        updated_at, content_hash, _ = self._row(tmp_db, 'views')
+        counts = {}
+        db_module.upsert_photos([make_photo_data('views', viewCount=500)], counts=counts)
+        assert counts['unchanged'] == 1
+        assert self._row(tmp_db, 'views') == (updated_at, content_hash, 500)
+
+    def test_metadata_edit_clears_hash(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('edited')])
+        db_module.update_photo_metadata('edited', heading=90.0)
+        assert self._row(tmp_db, 'edited')[1] is None
+        counts = {}
+        db_module.upsert_photos([make_photo_data('edited')], counts=counts)
+        assert counts['changed'] == 1
+        assert db_module.get_photo_from_db('edited')['heading'] == 180.0
+
+    def test_init_db_adds_column_to_old_schema(self, tmp_path, monkeypatch):
+        import sqlite3
+        db_file = str(tmp_path / 'old.db')
+        conn = sqlite3.connect(db_file)
+        conn.execute("CREATE TABLE photos (photo_id TEXT PRIMARY KEY, latitude REAL, longitude REAL, "
+                     "heading REAL, altitude REAL, pitch REAL, roll REAL, capture_time TEXT, "
+                     "upload_time TEXT, view_count INTEGER, maps_publish_status TEXT, "
+                     "share_link TEXT, thumbnail_url TEXT, updated_at TEXT)")
+        conn.close()
+        monkeypatch.setattr(db_module, 'DATABASE_PATH', db_file)
+        db_module.init_db()
+        assert db_module.upsert_photos([make_photo_data('migrated')]) == 1
+
+
+class TestPendingConnections:
+    def test_deferred_connections_resolved_against_all_photos(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('src', connections=[
+            {'target': {'id': 'later'}}, {'target': {'id': 'never'}}
+        ])], defer_connections=True)
+        assert 'connections' not in db_module.get_photo_from_db('src')
+        db_module.upsert_photos([make_photo_data('later')], defer_connections=True)
+        assert db_module.resolve_pending_connections() == 1
+        assert db_module.get_photo_from_db('src')['connections'] == [{'target': {'id': 'later'}}]
+
+    def test_resolve_replaces_existing_connections(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('old'), make_photo_data('new')])
+        db_module.upsert_photos([make_photo_data('src', connections=[{'target': {'id': 'old'}}])])
+        db_module.upsert_photos([make_photo_data('src', connections=[{'target': {'id': 'new'}}])],
+                                defer_connections=True)
+        db_module.resolve_pending_connections()
+        assert db_module.get_photo_from_db('src')['connections'] == [{'target': {'id': 'new'}}]
+
+    def test_staging_emptied(self, tmp_db):
+        import sqlite3
+        db_module.upsert_photos([make_photo_data('src', connections=[{'target': {'id': 'x'}}])],
+                                defer_connections=True)
+        db_module.resolve_pending_connections()
+        conn = sqlite3.connect(tmp_db)
+        assert conn.execute("SELECT COUNT(*) FROM sync_pending_connections").fetchone()[0] == 0
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# import_photos_from_json
+# ---------------------------------------------------------------------------
+
+class TestImportPhotosFromJson:
+    def _photos(self, n):
+        photos = [make_photo_data(f'imp-{i}', connections=[{'target': {'id': f'imp-{i + 1}'}}]) for i in range(n)]
+        photos[0]['places'][0]['name'] = 'Quote " and brace } and ] and ünïcode'
+        return photos
+
+    def test_array_split_across_reads(self, tmp_db, tmp_path):
+        import io
+        photos = self._photos(5)
+        text = json.dumps(photos, indent=2)
+        for read_size in (1, 7, 4096):
+            assert list(db_module._iter_json_records(io.StringIO(text), read_size)) == photos
+
+    def test_imports_array_in_batches_with_progress(self, tmp_db, tmp_path):
+        path = tmp_path / 'all_photos_test.json'
+        path.write_text(json.dumps(self._photos(7)), encoding='utf-8')
+        updates = []
+        assert db_module.import_photos_from_json(str(path), batch_size=3, progress=updates.append)
+        assert [u['parsed'] for u in updates] == [3, 6, 7]
+        assert updates[-1]['stored'] == 7
+        assert updates[-1]['bytes_read'] == updates[-1]['total_bytes']
+        # Connections across batches are resolved once everything is stored
+        assert db_module.get_photo_from_db('imp-0')['connections'] == [{'target': {'id': 'imp-1'}}]
+        assert 'connections' not in db_module.get_photo_from_db('imp-6')
+
+    def test_imports_ndjson(self, tmp_db, tmp_path):
+        path = tmp_path / 'all_photos_test.ndjson'
+        path.write_text('\n'.join(json.dumps(p) for p in self._photos(4)) + '\n', encoding='utf-8')
+        assert db_module.import_photos_from_json(str(path))
+        assert db_module.get_db_stats()['photo_count'] == 4
+
+    def test_ndjson_split_across_reads(self, tmp_db):
+        import io
+        photos = self._photos(3)
+        text = '\r\n'.join(json.dumps(p) for p in photos)
+        for read_size in (1, 7, 4096):
+            assert list(db_module._iter_json_records(io.StringIO(text), read_size, 'photoId')) == photos
+
+    @pytest.mark.parametrize('content', ['[{"photoId": {"id": "a"}}, {"photo', '{"not": "a list"} 42', '"text"',
+                                         '{"photos": [{"photoId": {"id": "a"}}]}',
+                                         '{\n  "photoId": {"id": "a"}\n}',
+                                         '{"photoId": {"id": "a"}} {"photoId": {"id": "b"}}'])
+    def test_rejects_malformed_files(self, tmp_db, tmp_path, content):
+        path = tmp_path / 'bad.json'
+        path.write_text(content, encoding='utf-8')
+        assert db_module.import_photos_from_json(str(path)) is False
+
+    def test_peak_memory_independent_of_file_size(self, tmp_db, tmp_path):
+        import tracemalloc
+        path = tmp_path / 'all_photos_big.json'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for i in range(20000):
+                f.write((',' if i else '') + json.dumps(make_photo_data(f'big-{i}')))
+            f.write(']')
+        assert path.stat().st_size > 10_000_000
+
+        with patch.object(db_module, 'upsert_photos', side_effect=lambda batch, **kwargs: len(batch)):
+            tracemalloc.start()
+            try:
+                assert db_module.import_photos_from_json(str(path), batch_size=100)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        assert peak < 2_000_000
+
+
 # ---------------------------------------------------------------------------
 # get_photo_from_db
 # ---------------------------------------------------------------------------
@@ -355,6 +575,27 @@ class TestCleanDeletedPhotos:
         conn.close()
         assert count == 0
 
+    def test_drops_connections_into_deleted_photos(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('gone-target'),
+                                 make_photo_data('kept-source', connections=[{'target': {'id': 'gone-target'}}])])
+        assert db_module.clean_deleted_photos(['kept-source']) == 1
+        assert 'connections' not in db_module.get_photo_from_db('kept-source')
+        assert db_module.get_photos_table_page('photo_id')['photos'][0]['connection_count'] == 0
+
+    def test_statement_count_independent_of_deleted_count(self, tmp_db):
+        db_module.upsert_photos([make_photo_data(f'bulk-{i}') for i in range(200)])
+        statements = []
+        db_module.get_connection().set_trace_callback(statements.append)
+        try:
+            assert db_module.clean_deleted_photos(f'bulk-{i}' for i in range(50)) == 150
+        finally:
+            db_module.get_connection().set_trace_callback(None)
+        # Trace also reports each trigger firing; count the distinct statements issued
+        deletes = {sql for sql in statements if sql.startswith(('DELETE FROM places', 'DELETE FROM connections',
+                                                                'DELETE FROM photos '))}
+        assert len(deletes) == 3
+        assert db_module.get_db_stats()['photo_count'] == 50
+
 
 # ---------------------------------------------------------------------------
 # get_db_stats
@@ -402,6 +643,36 @@ class TestGetDbStats:
     def test_returns_dict(self, tmp_db):
         assert isinstance(db_module.get_db_stats(), dict)
 
+    def _traced_stats(self):
+        statements = []
+        conn = db_module.get_connection(readonly=True)
+        conn.set_trace_callback(statements.append)
+        try:
+            stats = db_module.get_db_stats()
+        finally:
+            conn.set_trace_callback(None)
+        return stats, [sql for sql in statements if 'PRAGMA' not in sql]
+
+    def test_cached_until_database_changes(self, tmp_db):
+        db_module.insert_or_update_photo(make_photo_data('c1'))
+        stats, queries = self._traced_stats()
+        assert stats['photo_count'] == 1 and queries
+        stats['photo_count'] = 99  # callers get a copy
+        stats, queries = self._traced_stats()
+        assert stats['photo_count'] == 1 and queries == []
+
+        db_module.insert_or_update_photo(make_photo_data('c2'))
+        stats, queries = self._traced_stats()
+        assert stats['photo_count'] == 2 and queries
+
+    def test_sees_writes_from_other_threads(self, tmp_db):
+        import threading
+        assert db_module.get_db_stats()['photo_count'] == 0
+        worker = threading.Thread(target=db_module.insert_or_update_photo, args=(make_photo_data('t1'),))
+        worker.start()
+        worker.join()
+        assert db_module.get_db_stats()['photo_count'] == 1
+
 
 # ---------------------------------------------------------------------------
 # get_nearby_photos
@@ -475,3 +746,764 @@ class TestGetNearbyPhotos:
             min_lng=-0.2, max_lng=0.0
         )
         assert result == []
+
+
+# ---------------------------------------------------------------------------
+# Spatial index
+# ---------------------------------------------------------------------------
+
+def _insert_at(photo_id, lat, lng):
+    photo = make_photo_data(photo_id)
+    photo['pose']['latLngPair'] = {'latitude': lat, 'longitude': lng}
+    db_module.insert_or_update_photo(photo)
+
+
+class TestSpatialIndex:
+    def _rtree_count(self, tmp_db):
+        import sqlite3
+        conn = sqlite3.connect(tmp_db)
+        count = conn.execute("SELECT COUNT(*) FROM photos_rtree").fetchone()[0]
+        conn.close()
+        return count
+
+    def test_index_follows_inserts_moves_and_deletes(self, tmp_db):
+        _insert_at('moving', 51.5, -0.1)
+        assert self._rtree_count(tmp_db) == 1
+        db_module.update_photo_metadata('moving', latitude=48.85, longitude=2.35)
+        assert db_module.get_photos_within_radius(48.85, 2.35, 100)[0]['photoId']['id'] == 'moving'
+        assert db_module.get_photos_within_radius(51.5, -0.1, 1000) == []
+        db_module.delete_photo('moving')
+        assert self._rtree_count(tmp_db) == 0
+
+    def test_backfills_existing_database(self, tmp_db):
+        import sqlite3
+        _insert_at('old', 51.5, -0.1)
+        db_module.close_connections()
+        conn = sqlite3.connect(tmp_db)
+        conn.execute("DROP TABLE photos_rtree")
+        for trigger in ('insert', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER photos_rtree_{trigger}")
+        conn.commit()
+        conn.close()
+        db_module.init_db()
+        assert self._rtree_count(tmp_db) == 1
+
+    def test_existing_index_is_not_rescanned(self, tmp_db):
+        _insert_at('old', 51.5, -0.1)
+        conn = db_module.get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            db_module.init_db()
+        finally:
+            conn.set_trace_callback(None)
+        # Triggers are re-declared with IF NOT EXISTS, but photos is not counted or copied
+        assert not [sql for sql in statements if 'COUNT(*)' in sql or
+                    ('INSERT INTO photos_rtree' in sql and 'TRIGGER' not in sql)]
+
+    def test_radius_query_sorted_with_distance(self, tmp_db):
+        _insert_at('center', 51.5, -0.1)
+        _insert_at('near', 51.5005, -0.1)     # ~56 m
+        _insert_at('mid', 51.501, -0.1)       # ~111 m
+        _insert_at('corner', 51.5009, -0.0986)  # inside the box, ~140 m
+        result = db_module.get_photos_within_radius(51.5, -0.1, 120, exclude_photo_id='center')
+        assert [p['photoId']['id'] for p in result] == ['near', 'mid']
+        assert 55 < result[0]['distance'] < 57
+
+    def test_nearest_photos(self, tmp_db):
+        for i in range(10):
+            _insert_at(f'p{i}', 51.5 + i * 0.01, -0.1)
+        result = db_module.get_nearest_photos(51.5, -0.1, 3, exclude_photo_id='p0')
+        assert [p['photoId']['id'] for p in result] == ['p1', 'p2', 'p3']
+
+    def test_nearest_photos_beyond_initial_radius(self, tmp_db):
+        _insert_at('paris', 48.85, 2.35)
+        result = db_module.get_nearest_photos(51.5, -0.1, 1)
+        assert result[0]['photoId']['id'] == 'paris'
+
+    def test_box_crossing_antimeridian(self, tmp_db):
+        _insert_at('east', -17.0, 179.999)
+        _insert_at('west', -17.0, -179.999)
+        _insert_at('far', -17.0, 170.0)
+        min_lat, max_lat, min_lng, max_lng = db_module.bounding_box(-17.0, -179.9995, 500)
+        assert min_lng < -180
+        result = db_module.get_nearby_photos(-17.0, -179.9995, min_lat, max_lat, min_lng, max_lng)
+        assert sorted(p['photoId']['id'] for p in result) == ['east', 'west']
+        within = db_module.get_photos_within_radius(-17.0, 179.9995, 500)
+        assert sorted(p['photoId']['id'] for p in within) == ['east', 'west']
+
+    def test_haversine_matches_app_distance(self):
+        import app as app_module
+        assert db_module.haversine_distance(51.5, -0.1, 48.85, 2.35) == pytest.approx(
+            app_module.calculate_distance(51.5, -0.1, 48.85, 2.35), abs=0.001)
+
+
+class TestHydration:
+    def _count_statements(self, fn):
+        statements = []
+        conn = db_module.get_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            result = fn()
+        finally:
+            conn.set_trace_callback(None)
+        return result, [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+    def _seed(self, n):
+        photos = []
+        for i in range(n):
+            photo = make_photo_data(f'h{i}', connections=[{'target': {'id': f'h{(i + 1) % n}'}}])
+            photo['pose']['latLngPair'] = {'latitude': 51.5 + i * 0.0001, 'longitude': -0.1}
+            photos.append(photo)
+        db_module.upsert_photos(photos, defer_connections=True)
+        db_module.resolve_pending_connections()
+
+    def test_nearby_photos_query_count_is_constant(self, tmp_db):
+        self._seed(50)
+        result, selects = self._count_statements(lambda: db_module.get_nearby_photos(
+            51.5, -0.1, 51.4, 51.6, -0.2, 0.0))
+        assert len(result) == 50
+        assert all('connections' in p and 'places' in p for p in result)
+        assert len(selects) == 3
+
+    def test_get_photos_by_ids_keeps_order(self, tmp_db):
+        self._seed(5)
+        result = db_module.get_photos_by_ids(['h3', 'missing', 'h1'])
+        assert [p['photo_id'] for p in result] == ['h3', 'h1']
+        assert result[0]['connections'] == [{'target': {'id': 'h4'}}]
+        assert result[0]['places'][0]['place_id'] == 'ChIJdd4hrwug2EcRmSrV3Vo6llI'
+
+    def test_api_format(self, tmp_db):
+        db_module.insert_or_update_photo(make_photo_data('api'))
+        photo = db_module.get_photo_from_db('api', api_format=True)
+        assert photo['photoId'] == {'id': 'api'}
+        assert photo['pose'] == {'latLngPair': {'latitude': 51.5074, 'longitude': -0.1278}, 'heading': 180.0}
+        assert photo['places'] == [{'placeId': 'ChIJdd4hrwug2EcRmSrV3Vo6llI', 'name': 'London', 'languageCode': 'en'}]
+        assert photo['mapsPublishStatus'] == 'PUBLISHED'
+
+    def test_api_format_omits_missing_heading(self, tmp_db):
+        photo = make_photo_data('no-heading')
+        photo['pose']['heading'] = 'NaN'
+        db_module.insert_or_update_photo(photo)
+        assert 'heading' not in db_module.get_photo_from_db('no-heading', api_format=True)['pose']
+
+
+# ---------------------------------------------------------------------------
+# Denormalized place names / connection counts
+# ---------------------------------------------------------------------------
+
+class TestPhotoAggregates:
+    def _aggregates(self, photo_id):
+        row = db_module.get_connection().execute(
+            "SELECT place_names, connection_count FROM photos WHERE photo_id = ?", (photo_id,)).fetchone()
+        return tuple(row)
+
+    def test_triggers_follow_places_and_connections(self, tmp_db):
+        places = [{'placeId': 'a', 'name': 'Harbour'}, {'placeId': 'b'}, {'placeId': 'c', 'name': 'Harbour'}]
+        db_module.upsert_photos([make_photo_data('agg-t1'), make_photo_data('agg-t2'),
+                                 make_photo_data('agg-src', places=places,
+                                                 connections=[{'target': {'id': 'agg-t1'}},
+                                                              {'target': {'id': 'agg-t2'}}])])
+        assert self._aggregates('agg-src') == ('Harbour,b', 2)
+
+        db_module.upsert_photos([make_photo_data('agg-src', places=[{'placeId': 'd', 'name': 'Quay'}],
+                                                 connections=[{'target': {'id': 'agg-t1'}}])])
+        assert self._aggregates('agg-src') == ('Quay', 1)
+
+        db_module.delete_photo('agg-t1')
+        assert self._aggregates('agg-src') == ('Quay', 0)
+
+    def test_backfills_existing_database(self, tmp_db):
+        import sqlite3
+        db_module.upsert_photos([make_photo_data('agg-old-t'),
+                                 make_photo_data('agg-old', connections=[{'target': {'id': 'agg-old-t'}}])])
+        db_module.close_connections()
+        conn = sqlite3.connect(tmp_db)
+        for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                       "AND tbl_name IN ('places', 'connections')").fetchall():
+            conn.execute(f"DROP TRIGGER {trigger}")
+        for column in ('place_names', 'connection_count'):
+            conn.execute(f"DROP INDEX idx_photos_{column}_id")
+            conn.execute(f"ALTER TABLE photos DROP COLUMN {column}")
+        conn.commit()
+        conn.close()
+
+        db_module.init_db()
+        assert self._aggregates('agg-old') == ('London', 1)
+        assert self._aggregates('agg-old-t') == ('London', 0)
+
+    @pytest.mark.parametrize('sort_by', ['place_names', 'connection_count'])
+    def test_sort_is_an_index_scan(self, tmp_db, sort_by):
+        conn = db_module.get_connection()
+        plan = ' '.join(row[3] for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT p.* FROM photos p WHERE p.{sort_by} IS NOT NULL "
+            f"ORDER BY p.{sort_by} DESC, p.photo_id DESC LIMIT 25"))
+        assert f'idx_photos_{sort_by}_id' in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+# ---------------------------------------------------------------------------
+# Photos table paging
+# ---------------------------------------------------------------------------
+
+class TestPhotosTablePage:
+    def _seed(self):
+        photos = []
+        for i in range(23):
+            photo = make_photo_data(f'tp{i:02d}', viewCount=None if i % 4 == 0 else i % 3)
+            if i % 5 == 0:
+                photo['places'] = [{'placeId': 'pid-x', 'name': 'Harbour'}]
+            photos.append(photo)
+        db_module.upsert_photos(photos)
+
+    def _expected(self, sort_by, sort_order):
+        import sqlite3
+        direction = sort_order.upper()
+        key = db_module.TABLE_SORT_COLUMNS[sort_by]
+        conn = sqlite3.connect(db_module.DATABASE_PATH)
+        ids = [r[0] for r in conn.execute(
+            f"SELECT p.photo_id FROM photos p ORDER BY {key} {direction}, p.photo_id {direction}")]
+        conn.close()
+        return ids
+
+    @pytest.mark.parametrize('sort_by', ['view_count', 'place_names', 'photo_id'])
+    @pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+    def test_forward_and_backward_paging_cover_all_rows(self, tmp_db, sort_by, sort_order):
+        self._seed()
+        expected = self._expected(sort_by, sort_order)
+
+        seen, cursor = [], None
+        while True:
+            page = db_module.get_photos_table_page(sort_by, sort_order, limit=5, after=cursor)
+            if not page['photos']:
+                break
+            seen += [p['photo_id'] for p in page['photos']]
+            cursor = page['last_cursor']
+        assert seen == expected
+
+        page = db_module.get_photos_table_page(sort_by, sort_order, limit=5, last=True)
+        seen = [p['photo_id'] for p in page['photos']]
+        assert len(seen) == 3  # 23 rows -> final page holds the remainder
+        while True:
+            page = db_module.get_photos_table_page(sort_by, sort_order, limit=5, before=page['first_cursor'])
+            if not page['photos']:
+                break
+            seen = [p['photo_id'] for p in page['photos']] + seen
+        assert seen == expected
+
+    def test_places_filter_counts_match_rows(self, tmp_db):
+        self._seed()
+        page = db_module.get_photos_table_page(filters={'places': 'harb'}, limit=2)
+        assert page['total_records'] == 5
+        assert len(page['photos']) == 2
+        assert page['photos'][0]['place_names'] == 'Harbour'
+
+    @pytest.mark.parametrize('term, expected', [
+        ('harbour', 5), ('ARBO', 5), ('lon', 18), ('Ha', 5), ('x', 0), ('100%', 0), ('"quoted', 0)])
+    def test_places_filter_total_matches_rows(self, tmp_db, term, expected):
+        self._seed()
+        page = db_module.get_photos_table_page(filters={'places': term}, limit=None)
+        assert page['total_records'] == len(page['photos']) == expected
+
+    def test_places_filter_uses_search_index(self, tmp_db):
+        clause, params = db_module._place_search_clause('harbour')
+        plan = ' '.join(row[3] for row in db_module.get_connection().execute(
+            f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM photos p WHERE {clause}", params))
+        assert 'places_fts' in plan
+
+    def test_search_index_follows_place_changes(self, tmp_db):
+        db_module.upsert_photos([make_photo_data('fts-1', places=[{'placeId': 'a', 'name': 'Old Harbour'}])])
+        db_module.upsert_photos([make_photo_data('fts-1', viewCount=1, places=[{'placeId': 'b', 'name': 'Castle'}])])
+        assert db_module.get_photos_table_page(filters={'places': 'harbour'})['total_records'] == 0
+        assert db_module.get_photos_table_page(filters={'places': 'castle'})['total_records'] == 1
+
+    def test_search_index_built_for_existing_database(self, tmp_db):
+        self._seed()
+        conn = db_module.get_connection()
+        conn.execute("DROP TABLE places_fts")
+        for trigger in ('insert', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER places_fts_{trigger}")
+        conn.commit()
+        db_module.init_db()
+        assert db_module.get_photos_table_page(filters={'places': 'harbour'})['total_records'] == 5
+
+    def test_existing_search_index_is_not_rescanned(self, tmp_db):
+        self._seed()
+        conn = db_module.get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            db_module.init_db()
+        finally:
+            conn.set_trace_callback(None)
+        assert not [sql for sql in statements if 'COUNT(*) FROM places' in sql or
+                    ('INSERT INTO places_fts' in sql and 'TRIGGER' not in sql)]
+
+    def test_cursor_for_other_sort_is_ignored(self, tmp_db):
+        self._seed()
+        cursor = db_module.encode_page_cursor('view_count', 1, 'tp05')
+        assert db_module.decode_page_cursor(cursor, 'photo_id') is None
+        assert db_module.decode_page_cursor('not-a-cursor', 'photo_id') is None
+
+    def test_page_queries_use_indexes(self, tmp_db):
+        conn = db_module.get_connection()
+        statements = []
+        conn_ro = db_module.get_connection(readonly=True)
+        conn_ro.set_trace_callback(statements.append)
+        try:
+            db_module.get_photos_table_page('upload_time', 'desc', limit=5,
+                                            after=db_module.encode_page_cursor('upload_time', '2024', 'x'))
+        finally:
+            conn_ro.set_trace_callback(None)
+        page_sql = [sql for sql in statements if 'LIMIT' in sql]
+        plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + page_sql[0]))
+        assert 'idx_photos_upload_time_id' in plan
+        assert 'TEMP B-TREE FOR ORDER BY' not in plan
+
+
+# ---------------------------------------------------------------------------
+# Edit page navigation
+# ---------------------------------------------------------------------------
+
+class TestPhotoNavigation:
+    def _seed(self):
+        db_module.upsert_photos([
+            make_photo_data(f'nav{i}', viewCount=None if i == 2 else i % 3,
+                            places=[{'placeId': 'h', 'name': 'Harbour' if i % 2 else 'Castle'}])
+            for i in range(8)])
+
+    @pytest.mark.parametrize('sort_by', ['view_count', 'upload_time', 'place_names'])
+    @pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+    def test_follows_table_order(self, tmp_db, sort_by, sort_order):
+        self._seed()
+        filters = {'places': 'harbour'}
+        table = [p['photo_id'] for p in db_module.get_photos_table_page(
+            sort_by, sort_order, filters, limit=None)['photos']]
+        assert len(table) == 4
+        for index, photo_id in enumerate(table):
+            nav = db_module.get_photo_navigation(photo_id, sort_by, sort_order, filters)
+            assert nav['previous'] == (table[index - 1] if index else None)
+            assert nav['next'] == (table[index + 1] if index + 1 < len(table) else None)
+            assert (nav['position'], nav['total']) == (index + 1, 4)
+
+    def test_photo_outside_filter_uses_unfiltered_order(self, tmp_db):
+        self._seed()
+        nav = db_module.get_photo_navigation('nav0', 'photo_id', 'asc', {'places': 'harbour'})
+        assert (nav['previous'], nav['next'], nav['total']) == (None, 'nav1', 8)
+        assert db_module.get_photo_navigation('missing') is None
+
+    def test_order_cached_until_database_changes(self, tmp_db):
+        self._seed()
+        conn = db_module.get_connection(readonly=True)
+        statements = []
+        db_module.get_photo_navigation('nav3', 'photo_id', 'asc')
+        conn.set_trace_callback(statements.append)
+        try:
+            assert db_module.get_photo_navigation('nav4', 'photo_id', 'asc')['next'] == 'nav5'
+            assert not [sql for sql in statements if 'PRAGMA' not in sql]
+            db_module.insert_or_update_photo(make_photo_data('nav4a'))
+            assert db_module.get_photo_navigation('nav4', 'photo_id', 'asc')['next'] == 'nav4a'
+        finally:
+            conn.set_trace_callback(None)
+
+
+# ---------------------------------------------------------------------------
+# Map clustering
+# ---------------------------------------------------------------------------
+
+def _pose(lat, lng):
+    return {'latLngPair': {'latitude': lat, 'longitude': lng}, 'heading': 0.0}
+
+
+class TestMapClusters:
+    def _seed(self):
+        # A street of 10 photos in east London, 3 in Paris, one on each side of the antimeridian
+        photos = [make_photo_data(f'ldn{i}', pose=_pose(51.5 + i * 0.0001, 0.12)) for i in range(10)]
+        photos += [make_photo_data(f'par{i}', pose=_pose(48.85 + i * 0.0001, 2.35)) for i in range(3)]
+        photos += [make_photo_data('fiji-e', pose=_pose(-17.0, 179.9)),
+                   make_photo_data('fiji-w', pose=_pose(-17.0, -179.9)),
+                   make_photo_data('nogps', pose={})]
+        db_module.upsert_photos(photos)
+
+    def test_low_zoom_merges_nearby_photos(self, tmp_db):
+        self._seed()
+        result = db_module.get_map_clusters(1)
+        assert result['total_count'] == 15
+        assert 'photos' not in result
+        counts = sorted(cluster['count'] for cluster in result['clusters'])
+        assert sum(counts) == 15
+        assert 13 in counts  # London and Paris share a cell at zoom 1
+
+    def test_cluster_centroid_and_bounds(self, tmp_db):
+        self._seed()
+        clusters = db_module.get_map_clusters(10, (51, 52, -1, 1))['clusters']
+        assert len(clusters) == 1
+        cluster = clusters[0]
+        assert cluster['count'] == 10
+        assert cluster['latitude'] == pytest.approx(51.50045)
+        assert cluster['bounds'] == [pytest.approx(0.12), pytest.approx(51.5),
+                                     pytest.approx(0.12), pytest.approx(51.5009)]
+        assert 'photo_id' not in cluster
+
+    def test_levels_are_consistent(self, tmp_db):
+        self._seed()
+        for zoom in range(db_module.MAP_CLUSTER_MAX_ZOOM + 1):
+            clusters = db_module.get_map_clusters(zoom)['clusters']
+            assert sum(cluster['count'] for cluster in clusters) == 15
+
+    def test_single_photo_cells_carry_photo_id(self, tmp_db):
+        self._seed()
+        clusters = db_module.get_map_clusters(6, (-20, -10, 179, 181))['clusters']
+        assert sorted(cluster['photo_id'] for cluster in clusters) == ['fiji-e', 'fiji-w']
+
+    def test_individual_photos_above_max_zoom(self, tmp_db):
+        self._seed()
+        result = db_module.get_map_clusters(db_module.MAP_CLUSTER_MAX_ZOOM + 1, (48, 49, 2, 3))
+        assert 'clusters' not in result
+        assert sorted(photo['photo_id'] for photo in result['photos']) == ['par0', 'par1', 'par2']
+        assert result['photos'][0]['place_names'] == 'London'
+
+    def test_world_bbox_at_high_zoom_scans_level(self, tmp_db):
+        self._seed()
+        clusters = db_module.get_map_clusters(db_module.MAP_CLUSTER_MAX_ZOOM, (-90, 90, -180, 180))['clusters']
+        assert sum(cluster['count'] for cluster in clusters) == 15
+
+    def test_index_cached_until_database_changes(self, tmp_db):
+        self._seed()
+        conn = db_module.get_connection(readonly=True)
+        statements = []
+        db_module.get_map_clusters(4)
+        conn.set_trace_callback(statements.append)
+        try:
+            assert db_module.get_map_clusters(4)['total_count'] == 15
+            assert not [sql for sql in statements if 'PRAGMA' not in sql]
+            db_module.insert_or_update_photo(make_photo_data('ldn-new', pose=_pose(51.5, 0.12)))
+            assert db_module.get_map_clusters(4)['total_count'] == 16
+        finally:
+            conn.set_trace_callback(None)
+
+
+class TestMapTiles:
+    def _seed(self):
+        db_module.upsert_photos(
+            [make_photo_data(f'ldn{i}', pose=_pose(51.5 + i * 0.0001, 0.12)) for i in range(10)]
+            + [make_photo_data(f'par{i}', pose=_pose(48.85 + i * 0.0001, 2.35)) for i in range(3)])
+
+    def _cached(self, zoom, x, y, fmt='geojson'):
+        return os.path.exists(os.path.join(db_module.tile_cache_dir(), str(zoom), str(x), f'{y}.{fmt}'))
+
+    def test_tile_bounds_contain_tile_points(self):
+        for lat, lng in [(51.5, 0.12), (-33.9, 151.2), (0.0, -179.99)]:
+            for zoom in (0, 5, 17):
+                x, y = db_module.tile_for(lat, lng, zoom)
+                min_lat, max_lat, min_lng, max_lng = db_module.tile_bounds(zoom, x, y)
+                assert min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+
+    def test_cluster_tiles_match_clusters(self, tmp_db):
+        self._seed()
+        x, y = db_module.tile_for(51.5, 0.12, 8)
+        features = json.loads(db_module.get_tile(8, x, y))['features']
+        assert [f['properties']['count'] for f in features] == [10]
+        assert features[0]['geometry']['coordinates'] == [pytest.approx(0.12), pytest.approx(51.50045)]
+        assert features[0]['bbox'][1] == pytest.approx(51.5)
+
+    def test_photo_tiles_above_cluster_zoom(self, tmp_db):
+        self._seed()
+        zoom = db_module.MAP_CLUSTER_MAX_ZOOM + 1
+        x, y = db_module.tile_for(48.85, 2.35, zoom)
+        features = json.loads(db_module.get_tile(zoom, x, y))['features']
+        assert sorted(f['properties']['photo_id'] for f in features) == ['par0', 'par1', 'par2']
+        assert features[0]['properties']['place_names'] == 'London'
+        assert 'view_count' not in features[0]['properties']
+
+    def test_mvt_tile(self, tmp_db):
+        self._seed()
+        zoom = db_module.MAP_CLUSTER_MAX_ZOOM + 1
+        x, y = db_module.tile_for(48.85, 2.35, zoom)
+        data = db_module.get_tile(zoom, x, y, 'mvt')
+        assert data[0] == 0x1a  # Tile.layers, length-delimited
+        assert b'photos' in data and b'par0' in data and b'place_names' in data
+        assert db_module.get_tile(0, 0, 0, 'mvt').count(b'count') == 1
+
+    def test_tiles_cached_on_disk(self, tmp_db):
+        self._seed()
+        db_module.get_tile(3, 4, 2)
+        assert self._cached(3, 4, 2)
+        conn = db_module.get_connection(readonly=True)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            db_module.get_tile(3, 4, 2)
+        finally:
+            conn.set_trace_callback(None)
+        assert statements == []
+
+    def test_edit_invalidates_only_touched_tiles(self, tmp_db):
+        self._seed()
+        zoom = db_module.MAP_CLUSTER_MAX_ZOOM + 2
+        ldn, par = db_module.tile_for(51.5, 0.12, zoom), db_module.tile_for(48.85, 2.35, zoom)
+        new = db_module.tile_for(52.0, 1.0, zoom)
+        for x, y in (ldn, par, new):
+            db_module.get_tile(zoom, x, y)
+        db_module.get_tile(5, *db_module.tile_for(51.5, 0.12, 5))
+
+        db_module.update_photo_metadata('ldn0', latitude=52.0, longitude=1.0)
+        db_module.get_tile(0, 0, 0)  # any tile request applies pending changes
+        assert not self._cached(zoom, *ldn) and not self._cached(zoom, *new)
+        assert not self._cached(5, *db_module.tile_for(51.5, 0.12, 5))
+        assert self._cached(zoom, *par)
+        assert [f['properties']['photo_id'] for f in json.loads(db_module.get_tile(zoom, *new))['features']] == ['ldn0']
+
+        db_module.delete_photo('par0')
+        db_module.get_tile(0, 0, 0)
+        assert not self._cached(zoom, *par)
+
+    def test_view_count_updates_keep_tiles(self, tmp_db):
+        self._seed()
+        db_module.get_tile(0, 0, 0)
+        db_module.upsert_photos([make_photo_data('ldn1', pose=_pose(51.5001, 0.12), viewCount=999)])
+        db_module.get_tile(1, 0, 0)
+        assert self._cached(0, 0, 0)
+
+    def test_mass_changes_clear_cache(self, tmp_db):
+        db_module.get_tile(0, 0, 0)
+        with patch.object(db_module, 'TILE_INVALIDATE_ALL_AT', 5):
+            self._seed()
+            db_module.get_tile(1, 1, 1)
+        assert not self._cached(0, 0, 0) and self._cached(1, 1, 1)
+
+    def test_import_drains_change_log(self, tmp_db, tmp_path):
+        db_module.get_tile(0, 0, 0)
+        export = tmp_path / 'all_photos_tiles.json'
+        export.write_text(json.dumps([make_photo_data('imp', pose=_pose(51.5, 0.12))]))
+        assert db_module.import_photos_from_json(str(export)) is True
+        assert db_module.get_connection().execute('SELECT COUNT(*) FROM tile_changes').fetchone()[0] == 0
+        assert not self._cached(0, 0, 0)
+
+    def test_new_database_clears_cache(self, tmp_db):
+        db_module.get_tile(0, 0, 0)
+        db_module.close_connections()
+        os.remove(tmp_db)
+        db_module.init_db()
+        assert not os.path.exists(db_module.tile_cache_dir())
+
+
+# ---------------------------------------------------------------------------
+# Sync jobs
+# ---------------------------------------------------------------------------
+
+class TestSyncJobs:
+    def test_create_and_get(self, tmp_db):
+        assert db_module.create_sync_job('job1', expected_total=10) is True
+        job = db_module.get_sync_job('job1')
+        assert job['status'] == 'queued'
+        assert job['expected_total'] == 10
+
+    def test_only_one_active_job(self, tmp_db):
+        assert db_module.create_sync_job('job1') is True
+        assert db_module.create_sync_job('job2') is False
+        db_module.update_sync_job('job1', status='completed')
+        assert db_module.create_sync_job('job2') is True
+
+    def test_update_ignores_unknown_fields(self, tmp_db):
+        db_module.create_sync_job('job1')
+        db_module.update_sync_job('job1', pages_fetched=3, created_at='hijack')
+        job = db_module.get_sync_job('job1')
+        assert job['pages_fetched'] == 3
+
+    def test_get_latest(self, tmp_db):
+        db_module.create_sync_job('job1')
+        db_module.update_sync_job('job1', status='completed')
+        db_module.create_sync_job('job2')
+        assert db_module.get_sync_job()['job_id'] == 'job2'
+        assert db_module.get_active_sync_job()['job_id'] == 'job2'
+
+    def test_mark_interrupted(self, tmp_db):
+        db_module.create_sync_job('job1')
+        db_module.update_sync_job('job1', status='running')
+        db_module.mark_interrupted_sync_jobs()
+        assert db_module.get_sync_job('job1')['status'] == 'interrupted'
+        assert db_module.get_active_sync_job() is None
+
+
+# ---------------------------------------------------------------------------
+# Upload jobs
+# ---------------------------------------------------------------------------
+
+UPLOAD_FILES = [{'filename': 'a.jpg', 'latitude': 51.5, 'longitude': -0.12, 'heading': 90.0},
+                {'filename': 'b.jpg', 'latitude': 51.6, 'longitude': -0.13, 'place_id': 'ChIJ'}]
+
+
+class TestUploadJobs:
+    def test_create_and_get(self, tmp_db):
+        assert db_module.create_upload_job('up1', UPLOAD_FILES) is True
+        job = db_module.get_upload_job('up1')
+        assert job['file_count'] == 2
+        assert [(f['file_index'], f['filename'], f['status']) for f in job['files']] == [
+            (0, 'a.jpg', 'waiting'), (1, 'b.jpg', 'waiting')]
+        assert job['files'][0]['heading'] == 90.0
+        assert job['files'][1]['place_id'] == 'ChIJ'
+        assert db_module.get_upload_job('missing') is None
+
+    def test_claim_is_exclusive(self, tmp_db):
+        db_module.create_upload_job('up1', UPLOAD_FILES)
+        assert db_module.claim_upload_job_file('up1', 0)['status'] == 'receiving'
+        assert db_module.claim_upload_job_file('up1', 0) is None
+        assert db_module.claim_upload_job_file('up1', 5) is None
+
+    def test_failed_file_can_be_claimed_again(self, tmp_db):
+        db_module.create_upload_job('up1', UPLOAD_FILES)
+        db_module.claim_upload_job_file('up1', 1)
+        db_module.update_upload_job_file('up1', 1, status='failed', error='boom', attempts=1)
+        job_file = db_module.claim_upload_job_file('up1', 1)
+        assert (job_file['status'], job_file['error'], job_file['attempts']) == ('receiving', None, 1)
+
+    def test_update_ignores_unknown_fields(self, tmp_db):
+        db_module.create_upload_job('up1', UPLOAD_FILES)
+        db_module.update_upload_job_file('up1', 0, photo_id='p1', filename='hijack.jpg')
+        job_file = db_module.get_upload_job('up1')['files'][0]
+        assert (job_file['photo_id'], job_file['filename']) == ('p1', 'a.jpg')
+
+    def test_get_latest(self, tmp_db):
+        db_module.create_upload_job('up1', UPLOAD_FILES)
+        db_module.create_upload_job('up2', UPLOAD_FILES[:1])
+        assert db_module.get_upload_job()['job_id'] == 'up2'
+
+    def test_mark_interrupted(self, tmp_db):
+        db_module.create_upload_job('up1', UPLOAD_FILES)
+        db_module.update_upload_job_file('up1', 0, status='uploading')
+        assert db_module.mark_interrupted_upload_jobs() == 1
+        statuses = [f['status'] for f in db_module.get_upload_job('up1')['files']]
+        assert statuses == ['interrupted', 'waiting']
+
+
+# ---------------------------------------------------------------------------
+# Upload ledger
+# ---------------------------------------------------------------------------
+
+def _created(photo_id, status='PUBLISHED'):
+    return {'photoId': {'id': photo_id}, 'mapsPublishStatus': status,
+            'shareLink': f'https://maps/{photo_id}', 'uploadTime': '2024-05-01T10:00:00Z'}
+
+
+class TestUploadLedger:
+    def test_lookup_by_stem_prefers_published_then_newest(self, tmp_db):
+        db_module.record_upload('/tmp/pano.jpg', _created('p1'), 'h1', 'pano.json')
+        db_module.record_upload('pano.JPG', _created('p2', 'PENDING'), 'h2', 'pano_1.json')
+        db_module.record_upload('street.jpg', _created('s1', 'PENDING'))
+        db_module.record_upload('street.jpg', _created('s2', 'PENDING'))
+        uploads = db_module.get_uploads_by_stems(['pano', 'street', 'missing'])
+        assert set(uploads) == {'pano', 'street'}
+        assert (uploads['pano']['photo_id'], uploads['pano']['content_hash']) == ('p1', 'h1')
+        assert uploads['pano']['filename'] == 'pano.jpg'
+        assert uploads['street']['photo_id'] == 's2'
+        assert db_module.get_uploads_by_stems([]) == {}
+
+    def test_ledger_alone_is_not_a_created_photo_database(self, tmp_db, tmp_path, monkeypatch):
+        db_module.record_upload('pano.jpg', _created('p1'))
+        assert not db_module.photo_database_created()
+        db_module.create_sync_job('s1')
+        db_module.update_sync_job('s1', status='failed')
+        assert not db_module.photo_database_created()
+        db_module.update_sync_job('s1', status='completed')
+        assert db_module.photo_database_created()
+
+        db_module.get_connection().execute('DELETE FROM sync_jobs')
+        db_module.get_connection().commit()
+        db_module.insert_or_update_photo(make_photo_data('p1'))
+        assert db_module.photo_database_created()
+
+        monkeypatch.setattr(db_module, 'DATABASE_PATH', str(tmp_path / 'missing.db'))
+        assert not db_module.photo_database_created()
+
+    def test_same_photo_is_recorded_once(self, tmp_db):
+        db_module.record_upload('pano.jpg', _created('p1', 'PENDING'), 'h1')
+        db_module.record_upload('pano.jpg', _created('p1'))
+        row = db_module.get_uploads_by_stems(['pano'])['pano']
+        assert (row['maps_publish_status'], row['content_hash']) == ('PUBLISHED', 'h1')
+        count = db_module.get_connection().execute('SELECT COUNT(*) FROM uploads').fetchone()[0]
+        assert count == 1
+
+    def test_filenames_and_delete(self, tmp_db):
+        db_module.record_upload('pano.jpg', _created('p1'), json_file='pano.json')
+        db_module.record_upload('other.jpg', _created('p2'))
+        assert db_module.get_upload_filenames(['p1', 'p2', 'p3']) == {'p1': 'pano.jpg', 'p2': 'other.jpg'}
+        assert db_module.delete_uploads(['p1', 'p2']) == ['pano.json']
+        assert db_module.get_uploads_by_stems(['pano', 'other']) == {}
+
+    def test_migrates_json_records_once(self, tmp_db, tmp_path):
+        records = tmp_path / 'uploads'
+        records.mkdir()
+        (records / 'pano.json').write_text(json.dumps(_created('p1', 'PENDING')))
+        (records / 'pano_1.json').write_text(json.dumps(_created('p2')))
+        (records / 'walk_2.json').write_text(json.dumps(_created('w1')))
+        (records / 'broken.json').write_text('{not json')
+        (records / 'notes.txt').write_text('ignored')
+        assert db_module.migrate_upload_records(str(records)) == 3
+        uploads = db_module.get_uploads_by_stems(['pano', 'walk_2', 'broken'])
+        assert (uploads['pano']['photo_id'], uploads['pano']['json_file']) == ('p2', 'pano_1.json')
+        assert uploads['walk_2']['photo_id'] == 'w1'
+        assert db_module.get_upload_filenames(['p1']) == {'p1': 'pano.json'}
+
+        (records / 'late.json').write_text(json.dumps(_created('l1')))
+        assert db_module.migrate_upload_records(str(records)) == 0
+        assert db_module.get_uploads_by_stems(['late']) == {}
+
+
+# ---------------------------------------------------------------------------
+# Connection pool
+# ---------------------------------------------------------------------------
+
+class TestConnectionPool:
+    def test_connection_reused_within_thread(self, tmp_db):
+        assert db_module.get_connection() is db_module.get_connection()
+
+    def test_separate_connection_per_thread(self, tmp_db):
+        import threading
+        other = []
+        thread = threading.Thread(target=lambda: other.append(db_module.get_connection()))
+        thread.start()
+        thread.join()
+        assert other[0] is not db_module.get_connection()
+
+    def test_wal_and_pragmas(self, tmp_db):
+        conn = db_module.get_connection()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -db_module.DB_SETTINGS['cache_size_kb']
+
+    def test_configure_reopens_with_new_settings(self, tmp_db, monkeypatch):
+        monkeypatch.setitem(db_module.DB_SETTINGS, 'cache_size_kb', db_module.DB_SETTINGS['cache_size_kb'])
+        before = db_module.get_connection()
+        db_module.configure({'cache_size_kb': 2048})
+        conn = db_module.get_connection()
+        assert conn is not before
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -2048
+
+    def test_readonly_connection_rejects_writes(self, tmp_db):
+        import sqlite3
+        conn = db_module.get_connection(readonly=True)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM photos")
+
+    def test_reader_not_blocked_by_open_write_transaction(self, tmp_db):
+        import threading
+        db_module.insert_or_update_photo(make_photo_data('visible'))
+        writer = db_module.get_connection()
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("DELETE FROM places")
+        result = []
+        thread = threading.Thread(target=lambda: result.append(
+            db_module.get_connection(readonly=True).execute("SELECT COUNT(*) FROM photos").fetchone()[0]))
+        thread.start()
+        thread.join(timeout=2)
+        writer.rollback()
+        assert result == [1]
+
+    def test_switching_database_path(self, tmp_db, tmp_path, monkeypatch):
+        first = db_module.get_connection()
+        monkeypatch.setattr(db_module, 'DATABASE_PATH', str(tmp_path / 'other.db'))
+        db_module.init_db()
+        assert db_module.get_connection() is not first
+        assert db_module.get_db_stats()['photo_count'] == 0
@@ -0,0 +1,336 @@
+"""
+Query-plan regression tests over a synthetic 50k-photo database.
+
+Each case runs a production code path with SQL tracing switched on, then
+runs EXPLAIN QUERY PLAN on every SELECT it issued and checks that:
+  - the indexes the case names are used
+  - no table is read by a full scan unless the case allows it
+  - no temp B-tree is built for ORDER BY unless the case allows it
+    (e.g. sorting by a computed distance)
+so a schema change that loses an index fails here instead of in
+production.
+
+Each measured time is recorded as a test property. Wall-clock budgets are
+only enforced as an opt-in benchmark (QUERY_PLAN_BUDGETS=1), since timings
+on a shared CI runner are too noisy to gate on.
+"""
+import os
+import random
+import re
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+
+import database as db_module
+
+
+PLAN_PHOTOS = 50_000
+
+PLACE_NAMES = ('Harbour', 'Castle', 'Market', 'Station', 'Bridge', 'Abbey', 'Quay', 'Tower')
+STATUSES = ('PUBLISHED', 'PUBLISHED', 'PUBLISHED', 'PENDING', 'REJECTED_UNKNOWN')
+
+FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+ID_BATCH = [f'qp{i:06d}' for i in range(1000, 1100)]
+
+
+def _seed(n):
+    """Insert n photos (every third without a place, every 50th without GPS) in one transaction."""
+    rng = random.Random(1234)
+    photos, places, connections = [], [], []
+    for i in range(n):
+        photo_id = f'qp{i:06d}'
+        has_gps = i % 50 != 0
+        photos.append((
+            photo_id,
+            51.0 + rng.random() * 2 if has_gps else None,
+            -1.0 + rng.random() * 2 if has_gps else None,
+            rng.random() * 360,
+            f'2023-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00Z',
+            f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00Z',
+            rng.randrange(5000) if i % 7 else None,
+            STATUSES[i % len(STATUSES)],
+            f'2024-06-01T00:{i % 60:02d}:00Z',
+        ))
+        if i % 3:
+            places.append((photo_id, f'place{i % 997}', f'{PLACE_NAMES[i % len(PLACE_NAMES)]} {i % 997}', 'en'))
+        if i:
+            connections.append((photo_id, f'qp{i - 1:06d}'))
+
+    conn = db_module.get_connection()
+    conn.executemany("INSERT INTO photos (photo_id, latitude, longitude, heading, capture_time, upload_time, "
+                     "view_count, maps_publish_status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", photos)
+    conn.executemany("INSERT INTO places (photo_id, place_id, name, language_code) VALUES (?, ?, ?, ?)", places)
+    conn.executemany("INSERT INTO connections (source_photo_id, target_photo_id) VALUES (?, ?)", connections)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+@pytest.fixture(scope='module')
+def plan_db(tmp_path_factory):
+    """A seeded PLAN_PHOTOS-photo database shared by every test in this module."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db_module, 'DATABASE_PATH', str(tmp_path_factory.mktemp('plans') / 'plans.db'))
+        db_module.init_db()
+        _seed(PLAN_PHOTOS)
+        yield db_module.DATABASE_PATH
+        db_module.close_connections()
+
+
+def _traced(fn):
+    """Run fn on cold pooled connections; return (elapsed ms, SELECT statements issued)."""
+    db_module.close_connections()  # also empties the stats/navigation caches
+    connections = [db_module.get_connection(), db_module.get_connection(readonly=True)]
+    statements = []
+    for conn in connections:
+        conn.set_trace_callback(statements.append)
+    try:
+        started = time.perf_counter()
+        fn()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    finally:
+        for conn in connections:
+            conn.set_trace_callback(None)
+    # FTS5 reads its own shadow tables ('main'.'places_fts_*'); those are not ours
+    selects = [sql for sql in statements
+               if sql.lstrip().upper().startswith('SELECT') and "'main'." not in sql]
+    return elapsed_ms, selects
+
+
+def _plan(sql):
+    return [row[3] for row in db_module.get_connection().execute('EXPLAIN QUERY PLAN ' + sql)]
+
+
+def _check_plans(statements, uses=(), full_scan_ok=(), temp_order_ok=False):
+    """Assert the plan rules above over every statement; return the combined plan text."""
+    assert statements, "code path issued no SELECT"
+    combined = []
+    for sql in statements:
+        plan = _plan(sql)
+        combined.extend(plan)
+        for step in plan:
+            scan = FULL_SCAN.match(step)
+            assert not scan or scan.group(1) in full_scan_ok, f"full scan in:\n{sql}\n{plan}"
+            if not temp_order_ok:
+                assert 'TEMP B-TREE FOR' not in step or 'ORDER BY' not in step, f"sort in:\n{sql}\n{plan}"
+    text = '\n'.join(combined)
+    for index in uses:
+        assert index in text, f"{index} not used:\n{text}"
+    return text
+
+
+ENFORCE_BUDGETS = os.environ.get('QUERY_PLAN_BUDGETS') == '1'
+
+
+def _check_budget(record_property, elapsed_ms, budget_ms):
+    record_property('elapsed_ms', round(elapsed_ms, 2))
+    record_property('budget_ms', budget_ms)
+    if ENFORCE_BUDGETS:
+        assert elapsed_ms < budget_ms, f"took {elapsed_ms:.1f} ms, budget {budget_ms} ms"
+
+
+# ---------------------------------------------------------------------------
+# Photos table pages
+# ---------------------------------------------------------------------------
+
+class TestTablePagePlans:
+    @pytest.mark.parametrize('sort_by', sorted(db_module.TABLE_SORT_COLUMNS))
+    @pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+    def test_every_sort_walks_its_index(self, plan_db, record_property, sort_by, sort_order):
+        first = db_module.get_photos_table_page(sort_by, sort_order, limit=25)
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_table_page(
+            sort_by, sort_order, limit=25, after=first['last_cursor']))
+        index = 'sqlite_autoindex_photos_1' if sort_by == 'photo_id' else f'idx_photos_{sort_by}_id'
+        _check_plans(statements, uses=[index])
+        _check_budget(record_property, elapsed_ms, 50)
+
+    def test_backward_and_last_pages(self, plan_db, record_property):
+        last = db_module.get_photos_table_page('view_count', 'asc', limit=25, last=True)
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_table_page(
+            'view_count', 'asc', limit=25, before=last['first_cursor']))
+        _check_plans(statements, uses=['idx_photos_view_count_id'])
+        _check_budget(record_property, elapsed_ms, 50)
+
+    def test_offset_fallback_stays_in_index_order(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_table_page(
+            'upload_time', 'desc', limit=25, offset=25_000))
+        _check_plans(statements, uses=['idx_photos_upload_time_id'])
+        _check_budget(record_property, elapsed_ms, 100)
+
+    @pytest.mark.parametrize('filters, index, temp_order_ok', [
+        ({'statuses': ['PENDING']}, 'idx_photos_maps_publish_status_id', False),
+        # A one-month capture range is selective enough that SQLite reads it
+        # from its own index and sorts the matches by upload time
+        ({'capture_from': '2023-03-01T00:00:00Z', 'capture_to': '2023-03-31T23:59:59Z'},
+         'idx_photos_capture_time_id', True),
+        ({'upload_from': '2024-05-01T00:00:00Z', 'upload_to': '2024-05-31T23:59:59Z'},
+         'idx_photos_upload_time_id', False),
+    ])
+    def test_column_filters_use_index(self, plan_db, record_property, filters, index, temp_order_ok):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_table_page(
+            'upload_time', 'desc', filters, limit=25))
+        _check_plans(statements, uses=[index], temp_order_ok=temp_order_ok)
+        _check_budget(record_property, elapsed_ms, 100)
+
+    def test_places_filter_uses_trigram_index(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_table_page(
+            'upload_time', 'desc', {'places': 'harbour'}, limit=25))
+        # The matching set is driven from the search index and sorted
+        _check_plans(statements, uses=['places_fts VIRTUAL TABLE'], temp_order_ok=True)
+        _check_budget(record_property, elapsed_ms, 150)
+
+
+# ---------------------------------------------------------------------------
+# Statistics and navigation
+# ---------------------------------------------------------------------------
+
+class TestStatsAndNavigationPlans:
+    def test_stats(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(db_module.get_db_stats)
+        # One pass over photos for all photo aggregates; counts read indexes only
+        text = _check_plans(statements, full_scan_ok=['photos'])
+        assert 'SCAN places USING COVERING INDEX' in text
+        assert 'SCAN connections USING COVERING INDEX' in text
+        _check_budget(record_property, elapsed_ms, 150)
+
+    def test_cached_stats_cost_one_pragma(self, plan_db, record_property):
+        db_module.get_db_stats()
+        started = time.perf_counter()
+        db_module.get_db_stats()
+        _check_budget(record_property, (time.perf_counter() - started) * 1000, 5)
+
+    @pytest.mark.parametrize('sort_by', ['upload_time', 'view_count', 'place_names', 'photo_id'])
+    def test_navigation_order_read_in_index_order(self, plan_db, record_property, sort_by):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photo_navigation('qp001000', sort_by, 'desc'))
+        _check_plans(statements)
+        _check_budget(record_property, elapsed_ms, 400)
+
+    def test_navigation_step_is_constant_time(self, plan_db, record_property):
+        db_module.get_photo_navigation('qp001000', 'view_count', 'desc')
+        started = time.perf_counter()
+        for i in range(1000, 1100):
+            db_module.get_photo_navigation(f'qp{i:06d}', 'view_count', 'desc')
+        _check_budget(record_property, (time.perf_counter() - started) * 1000, 50)
+
+
+# ---------------------------------------------------------------------------
+# Spatial queries
+# ---------------------------------------------------------------------------
+
+class TestSpatialPlans:
+    def test_nearby_box(self, plan_db, record_property):
+        min_lat, max_lat, min_lng, max_lng = db_module.bounding_box(52.0, 0.0, 200)
+        elapsed_ms, statements = _traced(lambda: db_module.get_nearby_photos(
+            52.0, 0.0, min_lat, max_lat, min_lng, max_lng))
+        _check_plans(statements, uses=['SCAN r VIRTUAL TABLE'], temp_order_ok=True)
+        _check_budget(record_property, elapsed_ms, 50)
+
+    def test_within_radius(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_within_radius(52.0, 0.0, 300))
+        # Sorting by the computed distance needs a sort; the candidates come from the R*Tree
+        _check_plans(statements, uses=['SCAN r VIRTUAL TABLE'], temp_order_ok=True)
+        _check_budget(record_property, elapsed_ms, 50)
+
+    def test_nearest(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_nearest_photos(52.0, 0.0, 5))
+        _check_plans(statements, uses=['SCAN r VIRTUAL TABLE'], temp_order_ok=True)
+        _check_budget(record_property, elapsed_ms, 100)
+
+
+# ---------------------------------------------------------------------------
+# Lookups by photo ID
+# ---------------------------------------------------------------------------
+
+class TestLookupPlans:
+    def test_single_photo(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photo_from_db('qp001000', api_format=True))
+        _check_plans(statements, uses=['sqlite_autoindex_photos_1', 'idx_places_photo_id'])
+        _check_budget(record_property, elapsed_ms, 20)
+
+    def test_hydrate_batch(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_photos_by_ids(ID_BATCH))
+        # Places/connections of the batch are re-sorted by id (a sort of ~100 rows)
+        _check_plans(statements, uses=['idx_places_photo_id', 'sqlite_autoindex_connections_1'],
+                     temp_order_ok=True)
+        _check_budget(record_property, elapsed_ms, 50)
+
+    def test_connections_batch(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_connections_by_photo_ids(ID_BATCH))
+        _check_plans(statements, uses=['sqlite_autoindex_connections_1'])
+        _check_budget(record_property, elapsed_ms, 20)
+
+    def test_existing_ids(self, plan_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_existing_photo_ids(ID_BATCH))
+        _check_plans(statements, uses=['sqlite_autoindex_photos_1'])
+        _check_budget(record_property, elapsed_ms, 20)
+
+
+# ---------------------------------------------------------------------------
+# Upload ledger
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope='module')
+def ledger_db(plan_db):
+    """An upload ledger row for every seeded photo, some stems uploaded twice."""
+    conn = db_module.get_connection()
+    conn.executemany("INSERT INTO uploads (filename_stem, filename, content_hash, photo_id, maps_publish_status) "
+                     "VALUES (?, ?, ?, ?, ?)",
+                     [(f'DJI_{i // 2 if i % 10 == 0 else i:05d}', f'DJI_{i:05d}.JPG', f'{i:064x}',
+                       f'qp{i:06d}', STATUSES[i % len(STATUSES)]) for i in range(PLAN_PHOTOS)])
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    yield plan_db
+
+
+class TestUploadLedgerPlans:
+    def test_status_of_a_batch_is_one_indexed_query(self, ledger_db, record_property):
+        stems = [f'DJI_{i:05d}' for i in range(20_000, 21_000)]
+        elapsed_ms, statements = _traced(lambda: db_module.get_uploads_by_stems(stems))
+        assert len(statements) == 1
+        _check_plans(statements, uses=['idx_uploads_filename_stem'])
+        _check_budget(record_property, elapsed_ms, 50)
+
+    def test_filenames_by_photo_id(self, ledger_db, record_property):
+        elapsed_ms, statements = _traced(lambda: db_module.get_upload_filenames(ID_BATCH))
+        _check_plans(statements, uses=['sqlite_autoindex_uploads_1'])
+        _check_budget(record_property, elapsed_ms, 20)
+
+
+# ---------------------------------------------------------------------------
+# /photos route end to end
+# ---------------------------------------------------------------------------
+
+@pytest.fixture()
+def plan_client(plan_db, tmp_path):
+    import app as app_module
+    app_module.app.config.update({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-secret',
+        'RATELIMIT_ENABLED': False,
+    })
+    app_module.config['uploads']['directory'] = str(tmp_path)
+    mock_creds = MagicMock(valid=True, expired=False, token='mock-bearer-token', expiry=None)
+    with patch('app.get_credentials', return_value=mock_creds):
+        with app_module.app.test_client() as c:
+            yield c
+
+
+class TestPhotosRoutePlans:
+    @pytest.mark.parametrize('query', [
+        'sort_by=upload_time&sort_order=desc',
+        'sort_by=place_names&sort_order=asc&page=400',
+        'sort_by=connection_count&sort_order=desc&status_filter=PENDING',
+    ])
+    def test_photos_page(self, plan_client, record_property, query):
+        response = None
+
+        def render():
+            nonlocal response
+            response = plan_client.get(f'/photos?{query}')
+
+        elapsed_ms, statements = _traced(render)
+        assert response.status_code == 200
+        _check_plans(statements, full_scan_ok=['photos'])  # the uncached stats pass
+        _check_budget(record_property, elapsed_ms, 500)
@@ -11,6 +11,10 @@ Covers:
   - /check_auth_status JSON API
   - /get_connections JSON API
   - /update_db JSON API
+  - Edit pages served from the database
+  - /api/db_stats JSON API
+  - Streaming exports (/export/photos.<format>)
+  - /photos keyset pagination
 """
 import json
 import os
@@ -89,6 +93,14 @@ class TestPublicRoutes:
         response = client.get('/')
         assert b'<!DOCTYPE html>' in response.data or b'<html' in response.data
 
+    def test_db_stats_api(self, client):
+        db_module.insert_or_update_photo(make_photo_data('stats-api', viewCount=7))
+        response = client.get('/api/db_stats')
+        assert response.status_code == 200
+        stats = response.get_json()['stats']
+        assert stats['photo_count'] == 1
+        assert stats['total_views'] == 7
+
     def test_check_auth_status_unauthenticated(self, client):
         """When no creds file exists the endpoint reports not authenticated."""
         with patch('app.get_credentials', return_value=None):
@@ -191,10 +203,24 @@ class TestAuthenticatedRoutes:
         # Template receives api_key parameter
         assert response.status_code == 200
 
+    def test_upload_multiple_wires_upload_endpoints(self, auth_client):
+        page = auth_client.get('/upload_multiple').get_data(as_text=True)
+        # Single photos stream through; batches queue and resume after a reload
+        for endpoint in ('/upload/stream', '/upload/progress/', '/upload_jobs', '/upload_jobs/latest'):
+            assert endpoint in page, endpoint
+
     def test_photo_database_returns_200(self, auth_client):
         response = auth_client.get('/photo_database')
         assert response.status_code == 200
 
+    def test_uploads_alone_do_not_create_the_photo_database(self, auth_client):
+        import app as app_module
+        app_module.save_upload_record('pano.jpg', {'photoId': {'id': 'up-1'}}, 'h1')
+        page = auth_client.get('/list_photos_table', follow_redirects=True).get_data(as_text=True)
+        assert 'Database not yet created' in page
+        assert auth_client.get('/api/db_stats').get_json() == {'stats': None}
+        assert auth_client.get('/export/photos.csv').status_code == 404
+
     def test_photos_page_returns_200(self, auth_client):
         """photos page renders empty table when DB is present but empty."""
         response = auth_client.get('/photos')
@@ -204,18 +230,57 @@ class TestAuthenticatedRoutes:
         response = auth_client.get('/photos')
         assert b'<html' in response.data or b'<!DOCTYPE' in response.data
 
-    def test_api_photos_map_returns_200(self, auth_client):
+    def test_api_photos_map_returns_200(self, auth_client, synced_db):
         response = auth_client.get('/api/photos/map')
         assert response.status_code == 200
         data = response.get_json()
         assert 'photos' in data
         assert 'total_count' in data
 
-    def test_api_photos_map_returns_empty_on_empty_db(self, auth_client):
+    def test_api_photos_map_returns_empty_on_empty_db(self, auth_client, synced_db):
         response = auth_client.get('/api/photos/map')
         data = response.get_json()
         assert data['total_count'] == 0
 
+    def test_api_photos_map_clusters_viewport(self, auth_client):
+        db_module.upsert_photos([make_photo_data(f'map{i}') for i in range(3)])
+        response = auth_client.get('/api/photos/map?zoom=5&bbox=-10,45,10,55')
+        data = response.get_json()
+        assert response.status_code == 200
+        assert data['total_count'] == 3
+        assert [cluster['count'] for cluster in data['clusters']] == [3]
+        assert data['max_cluster_zoom'] == db_module.MAP_CLUSTER_MAX_ZOOM
+
+        response = auth_client.get('/api/photos/map?zoom=18&bbox=-1,51,0,52')
+        assert len(response.get_json()['photos']) == 3
+        response = auth_client.get('/api/photos/map?zoom=5&bbox=10,45,20,55')
+        assert response.get_json()['clusters'] == []
+
+    def test_api_photo_tiles(self, auth_client):
+        db_module.upsert_photos([make_photo_data(f'tile{i}') for i in range(3)])
+        x, y = db_module.tile_for(51.5074, -0.1278, 18)
+        response = auth_client.get(f'/api/photos/tiles/18/{x}/{y}')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/geo+json'
+        assert len(response.get_json()['features']) == 3
+
+        etag = response.headers['ETag']
+        response = auth_client.get(f'/api/photos/tiles/18/{x}/{y}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        response = auth_client.get('/api/photos/tiles/0/0/0.mvt')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/vnd.mapbox-vector-tile'
+
+    @pytest.mark.parametrize('path', ['0/0/0.png', '1/2/0', '23/0/0'])
+    def test_api_photo_tiles_not_found(self, auth_client, path):
+        assert auth_client.get(f'/api/photos/tiles/{path}').status_code == 404
+
+    @pytest.mark.parametrize('query', ['zoom=x', 'zoom=5&bbox=1,2,3', 'zoom=5&bbox=0,60,10,50'])
+    def test_api_photos_map_rejects_bad_query(self, auth_client, synced_db, query):
+        response = auth_client.get(f'/api/photos/map?{query}')
+        assert response.status_code == 400
+
 
 # ---------------------------------------------------------------------------
 # Redirect routes
@@ -293,13 +358,130 @@ class TestGetConnectionsRoute:
         assert data['connections'][0]['source'] == 'conn-route-src'
         assert data['connections'][0]['target'] == 'conn-route-tgt'
 
+    def test_no_api_fallback_for_stored_photo_without_connections(self, auth_client):
+        db_module.insert_or_update_photo(make_photo_data('conn-route-solo'))
+        with patch('app.get_photo') as mock_get_photo:
+            response = auth_client.post('/get_connections', json={'photoIds': ['conn-route-solo']})
+        assert response.get_json()['connections'] == []
+        mock_get_photo.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# Edit pages served from the database
+# ---------------------------------------------------------------------------
+
+class TestEditPagesFromDb:
+    def test_edit_photo_uses_database(self, auth_client):
+        db_module.insert_or_update_photo(make_photo_data('edit-db'))
+        with patch('app.get_photo') as mock_get_photo:
+            response = auth_client.get('/edit_photo/edit-db')
+        assert response.status_code == 200
+        mock_get_photo.assert_not_called()
+
+    def test_edit_photo_navigation_follows_table_view(self, auth_client):
+        db_module.upsert_photos([make_photo_data(f'nav-{i}') for i in range(3)])
+        auth_client.get('/photos?sort_by=photo_id&sort_order=asc')
+        response = auth_client.get('/edit_photo/nav-1')
+        assert b'/edit_photo/nav-0' in response.data
+        assert b'/edit_photo/nav-2' in response.data
+
+        auth_client.get('/photos?sort_by=photo_id&sort_order=desc')
+        response = auth_client.get('/edit_photo/nav-2')
+        assert b'/edit_photo/nav-1' in response.data
+        assert b'/edit_photo/nav-0' not in response.data
+
+    def test_edit_connections_lists_nearby_from_database(self, auth_client):
+        db_module.insert_or_update_photo(make_photo_data('edit-center'))
+        neighbour = make_photo_data('edit-neighbour')
+        neighbour['pose']['latLngPair'] = {'latitude': 51.5075, 'longitude': -0.1278}
+        db_module.insert_or_update_photo(neighbour)
+        with patch('app.get_photo') as mock_get_photo, patch('app.list_photos') as mock_list:
+            response = auth_client.get('/edit_connections/edit-center')
+        assert response.status_code == 200
+        assert b'edit-neighbour' in response.data
+        mock_get_photo.assert_not_called()
+        mock_list.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# Streaming exports
+# ---------------------------------------------------------------------------
+
+class TestExportPhotos:
+    def _seed(self):
+        photos = []
+        for i, (lat, lng, status) in enumerate([(51.5, -0.1, 'PUBLISHED'), (48.85, 2.35, 'PENDING'),
+                                                (-17.0, 179.9, 'PUBLISHED')]):
+            photo = make_photo_data(f'exp-{i}', mapsPublishStatus=status,
+                                    captureTime=f'2024-0{i + 1}-10T10:00:00Z',
+                                    connections=[{'target': {'id': 'exp-0'}}] if i else [])
+            photo['pose']['latLngPair'] = {'latitude': lat, 'longitude': lng}
+            photos.append(photo)
+        no_gps = make_photo_data('exp-nogps', places=[{'placeId': 'p', 'name': 'A & <B>'}])
+        del no_gps['pose']
+        photos.append(no_gps)
+        db_module.upsert_photos(photos)
+
+    def test_ndjson_round_trips_through_import(self, auth_client, tmp_path):
+        self._seed()
+        response = auth_client.get('/export/photos.ndjson')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['photoId']['id'] for line in lines] == ['exp-0', 'exp-1', 'exp-2', 'exp-nogps']
+        assert json.loads(lines[1])['connections'] == [{'target': {'id': 'exp-0'}}]
+
+        export = tmp_path / 'export.ndjson'
+        export.write_text(response.get_data(as_text=True), encoding='utf-8')
+        db_module.clean_deleted_photos([])
+        assert db_module.import_photos_from_json(str(export))
+        assert db_module.get_photo_from_db('exp-1')['connections'] == [{'target': {'id': 'exp-0'}}]
+
+    def test_csv_has_header_and_filters_by_status(self, auth_client):
+        import csv
+        self._seed()
+        response = auth_client.get('/export/photos.csv?status=PUBLISHED')
+        rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+        assert rows[0] == list(db_module.EXPORT_COLUMNS)
+        assert [row[0] for row in rows[1:]] == ['exp-0', 'exp-2', 'exp-nogps']
+        assert 'attachment' in response.headers['Content-Disposition']
+
+    def test_geojson_skips_photos_without_gps(self, auth_client):
+        self._seed()
+        data = auth_client.get('/export/photos.geojson?capture_from=2024-02-01').get_json(force=True)
+        assert data['type'] == 'FeatureCollection'
+        assert [f['id'] for f in data['features']] == ['exp-1', 'exp-2']
+        assert data['features'][0]['geometry'] == {'type': 'Point', 'coordinates': [2.35, 48.85]}
+
+    def test_kml_bbox_across_antimeridian(self, auth_client):
+        import xml.etree.ElementTree as ET
+        self._seed()
+        response = auth_client.get('/export/photos.kml?bbox=179,-18,-179,-16')
+        root = ET.fromstring(response.get_data())
+        ns = {'kml': 'http://www.opengis.net/kml/2.2'}
+        placemarks = root.findall('.//kml:Placemark', ns)
+        assert [p.get('id') for p in placemarks] == ['exp-2']
+        assert placemarks[0].find('.//kml:coordinates', ns).text == '179.9,-17.0'
+
+    def test_empty_export_is_valid(self, auth_client, synced_db):
+        assert auth_client.get('/export/photos.geojson').get_json(force=True)['features'] == []
+        assert auth_client.get('/export/photos.csv').get_data(as_text=True).startswith('photo_id,')
+
+    @pytest.mark.parametrize('query', ['bbox=1,2,3', 'bbox=0,95,1,96', 'capture_from=yesterday'])
+    def test_bad_filters_rejected(self, auth_client, synced_db, query):
+        assert auth_client.get(f'/export/photos.csv?{query}').status_code == 400
+
+    def test_unknown_format(self, auth_client):
+        assert auth_client.get('/export/photos.xlsx').status_code == 404
+
 
 # ---------------------------------------------------------------------------
 # /update_db API
 # ---------------------------------------------------------------------------
 
 class TestUpdateDbRoute:
-    def test_update_db_with_valid_photo(self, auth_client):
+    def test_update_db_with_valid_photo(self, auth_client, synced_db):
         photo = make_photo_data('route-update-001')
         response = auth_client.post(
             '/update_db',
@@ -310,7 +492,7 @@ class TestUpdateDbRoute:
         data = response.get_json()
         assert data['success'] is True
 
-    def test_update_db_stores_photo(self, auth_client):
+    def test_update_db_stores_photo(self, auth_client, synced_db):
         photo = make_photo_data('route-stored-001')
         auth_client.post(
             '/update_db',
@@ -402,6 +584,21 @@ class TestPhotosPagination:
         response = auth_client.get('/photos?sort_order=INJECTED')
         assert response.status_code == 200
 
+    def test_next_link_carries_keyset_cursor(self, auth_client):
+        db_module.upsert_photos([make_photo_data(f'page-{i:02d}') for i in range(30)])
+        response = auth_client.get('/photos?sort_by=photo_id&sort_order=asc&per_page=25')
+        assert response.status_code == 200
+        cursor = db_module.encode_page_cursor('photo_id', 'page-24', 'page-24')
+        assert f'after={cursor}'.encode() in response.data
+
+        response = auth_client.get(f'/photos?sort_by=photo_id&sort_order=asc&per_page=25&page=2&after={cursor}')
+        assert b'page-25' in response.data
+        assert b'page-24' not in response.data
+
+    def test_malformed_cursor_falls_back_to_page_number(self, auth_client):
+        response = auth_client.get('/photos?page=2&after=%%%garbage')
+        assert response.status_code == 200
+
 
 # ---------------------------------------------------------------------------
 # app_version injection
@@ -0,0 +1,290 @@
+"""
+Tests for the photo sync pipeline in app.py:
+  - fetch_all_photos()
+  - Background sync jobs (/sync_jobs API)
+"""
+import sqlite3
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+import database as db_module
+from tests.conftest import make_photo_data
+
+
+def _pages(*pages):
+    """Build list_photos() side effects from lists of photo IDs."""
+    responses = []
+    for i, ids in enumerate(pages):
+        response = {'photos': [make_photo_data(pid) for pid in ids]}
+        if i < len(pages) - 1:
+            response['nextPageToken'] = f'token-{i + 1}'
+        responses.append(response)
+    return responses
+
+
+@pytest.fixture()
+def creds():
+    mock_creds = MagicMock()
+    mock_creds.token = 'mock-bearer-token'
+    return mock_creds
+
+
+# ---------------------------------------------------------------------------
+# fetch_all_photos
+# ---------------------------------------------------------------------------
+
+class TestFetchAllPhotos:
+    def test_stores_every_page(self, app_instance, creds):
+        import app as app_module
+        with patch('app.list_photos', side_effect=_pages(['a', 'b'], ['c'], ['d', 'e'])):
+            summary = app_module.fetch_all_photos(creds, page_size=2)
+        assert summary['complete'] is True
+        assert summary['pages'] == 3
+        assert summary['fetched'] == 5
+        assert summary['stored'] == 5
+        assert db_module.get_db_stats()['photo_count'] == 5
+
+    def test_returns_summary_not_photo_list(self, app_instance, creds):
+        import app as app_module
+        with patch('app.list_photos', side_effect=_pages(['a'])):
+            summary = app_module.fetch_all_photos(creds)
+        assert isinstance(summary, dict)
+
+    def test_removes_photos_missing_from_api(self, app_instance, creds):
+        import app as app_module
+        db_module.insert_or_update_photo(make_photo_data('stale'))
+        with patch('app.list_photos', side_effect=_pages(['a'], ['b'])):
+            summary = app_module.fetch_all_photos(creds)
+        assert summary['deleted'] == 1
+        assert db_module.get_photo_from_db('stale') is None
+
+    def test_drains_tile_change_log(self, app_instance, creds):
+        import app as app_module
+        with patch('app.list_photos', side_effect=_pages(['a', 'b'], ['c'])):
+            app_module.fetch_all_photos(creds)
+        assert db_module.get_connection().execute('SELECT COUNT(*) FROM tile_changes').fetchone()[0] == 0
+
+    def test_partial_fetch_skips_cleanup(self, app_instance, creds):
+        import app as app_module
+        db_module.insert_or_update_photo(make_photo_data('keep-me'))
+        side_effects = _pages(['a'], ['b'])[:1] + [Exception('boom')] * 3
+        with patch('app.list_photos', side_effect=side_effects), patch('app.time.sleep'):
+            summary = app_module.fetch_all_photos(creds)
+        assert summary['complete'] is False
+        assert summary['deleted'] == 0
+        assert db_module.get_photo_from_db('keep-me') is not None
+        assert db_module.get_photo_from_db('a') is not None
+
+    def test_fetch_overlaps_with_writes(self, app_instance, creds):
+        """Page N+1 is requested while page N is still being written."""
+        import app as app_module
+        responses = iter(_pages(['a'], ['b'], ['c']))
+        write_started = threading.Event()
+        overlapped = []
+        real_upsert = db_module.upsert_photos
+
+        def slow_upsert(photos, **kwargs):
+            write_started.set()
+            time.sleep(0.05)
+            return real_upsert(photos, **kwargs)
+
+        def list_photos(*args, **kwargs):
+            if kwargs.get('page_token'):
+                overlapped.append(write_started.wait(timeout=1))
+            return next(responses)
+
+        with patch('app.list_photos', side_effect=list_photos), \
+                patch.object(db_module, 'upsert_photos', side_effect=slow_upsert):
+            summary = app_module.fetch_all_photos(creds)
+        assert summary['stored'] == 3
+        assert overlapped and all(overlapped)
+
+    def test_write_failure_raises_and_stops_paging(self, app_instance, creds):
+        import app as app_module
+        db_module.insert_or_update_photo(make_photo_data('stale'))
+        responses = iter(_pages(['a'], ['b'], ['c'], ['d']))
+        wrote = threading.Event()
+
+        def failing_upsert(photos, **kwargs):
+            wrote.set()
+            raise sqlite3.OperationalError('disk I/O error')
+
+        def list_photos(*args, **kwargs):
+            if kwargs.get('page_token'):
+                wrote.wait(timeout=1)
+            return next(responses)
+
+        with patch('app.list_photos', side_effect=list_photos) as mock_list, \
+                patch.object(db_module, 'upsert_photos', side_effect=failing_upsert):
+            with pytest.raises(sqlite3.OperationalError):
+                app_module.fetch_all_photos(creds)
+        assert mock_list.call_count < 4
+        assert db_module.get_photo_from_db('stale') is not None
+
+    def test_queue_is_bounded(self, app_instance, creds):
+        import app as app_module
+        assert app_module._SYNC_QUEUE_PAGES >= 1
+        created = []
+        real_queue = app_module.queue.Queue
+
+        def spy_queue(*args, **kwargs):
+            q = real_queue(*args, **kwargs)
+            created.append(q)
+            return q
+
+        with patch('app.list_photos', side_effect=_pages(['a'])), \
+                patch('app.queue.Queue', side_effect=spy_queue):
+            app_module.fetch_all_photos(creds)
+        assert created[0].maxsize == app_module._SYNC_QUEUE_PAGES
+
+    def test_connections_to_later_pages_are_kept(self, app_instance, creds):
+        import app as app_module
+        first = make_photo_data('a', connections=[{'target': {'id': 'c'}}])
+        responses = [
+            {'photos': [first], 'nextPageToken': 't1'},
+            {'photos': [make_photo_data('b', connections=[{'target': {'id': 'a'}}])], 'nextPageToken': 't2'},
+            {'photos': [make_photo_data('c')]},
+        ]
+        with patch('app.list_photos', side_effect=responses):
+            summary = app_module.fetch_all_photos(creds)
+        assert summary['connections'] == 2
+        assert db_module.get_photo_from_db('a')['connections'] == [{'target': {'id': 'c'}}]
+        assert db_module.get_photo_from_db('b')['connections'] == [{'target': {'id': 'a'}}]
+
+    def test_resync_reports_unchanged(self, app_instance, creds):
+        import app as app_module
+        with patch('app.list_photos', side_effect=_pages(['a', 'b'])):
+            app_module.fetch_all_photos(creds)
+        with patch('app.list_photos', side_effect=_pages(['a', 'b', 'c'])):
+            summary = app_module.fetch_all_photos(creds)
+        assert (summary['inserted'], summary['changed'], summary['unchanged']) == (1, 0, 2)
+
+    def test_progress_called_per_page(self, app_instance, creds):
+        import app as app_module
+        seen = []
+        with patch('app.list_photos', side_effect=_pages(['a'], ['b'], ['c'])):
+            app_module.fetch_all_photos(creds, progress=lambda s: seen.append(s['pages']))
+        assert seen[:3] == [1, 2, 3]
+
+    def test_cancel_event_stops_paging(self, app_instance, creds):
+        import app as app_module
+        cancel = threading.Event()
+        db_module.insert_or_update_photo(make_photo_data('stale'))
+
+        def progress(summary):
+            cancel.set()
+
+        with patch('app.list_photos', side_effect=_pages(['a'], ['b'], ['c'])) as mock_list:
+            summary = app_module.fetch_all_photos(creds, progress=progress, cancel_event=cancel)
+        assert summary['cancelled'] is True
+        assert summary['complete'] is False
+        assert mock_list.call_count == 1
+        assert db_module.get_photo_from_db('stale') is not None
+
+
+# ---------------------------------------------------------------------------
+# Background sync jobs
+# ---------------------------------------------------------------------------
+
+def _wait_for_job(job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = db_module.get_sync_job(job_id)
+        if job and job['status'] not in db_module.SYNC_JOB_ACTIVE_STATUSES:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"sync job {job_id} did not finish")
+
+
+class TestSyncJobs:
+    def test_start_returns_202_and_completes(self, auth_client):
+        with patch('app.list_photos', side_effect=_pages(['a', 'b'], ['c'])):
+            response = auth_client.post('/sync_jobs')
+            assert response.status_code == 202
+            job_id = response.get_json()['job_id']
+            job = _wait_for_job(job_id)
+        assert job['status'] == 'completed'
+        assert job['pages_fetched'] == 2
+        assert job['rows_upserted'] == 3
+        assert db_module.get_db_stats()['photo_count'] == 3
+
+    def test_status_endpoint(self, auth_client):
+        with patch('app.list_photos', side_effect=_pages(['a'])):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            _wait_for_job(job_id)
+        data = auth_client.get(f'/sync_jobs/{job_id}').get_json()
+        assert data['job']['job_id'] == job_id
+        assert data['job']['active'] is False
+        assert 'eta_seconds' in data['job']
+
+    def test_latest_endpoint(self, auth_client):
+        with patch('app.list_photos', side_effect=_pages(['a'])):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            _wait_for_job(job_id)
+        assert auth_client.get('/sync_jobs/latest').get_json()['job']['job_id'] == job_id
+
+    def test_unknown_job_returns_404(self, auth_client):
+        assert auth_client.get('/sync_jobs/nope').status_code == 404
+
+    def test_second_job_rejected_while_running(self, auth_client):
+        release = threading.Event()
+
+        def slow_list(*args, **kwargs):
+            release.wait(5)
+            return {'photos': [make_photo_data('a')]}
+
+        with patch('app.list_photos', side_effect=slow_list):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            response = auth_client.post('/sync_jobs')
+            assert response.status_code == 409
+            assert response.get_json()['job']['job_id'] == job_id
+            release.set()
+            _wait_for_job(job_id)
+
+    def test_cancel_running_job(self, auth_client):
+        release = threading.Event()
+        responses = iter(_pages(['a'], ['b'], ['c']))
+
+        def slow_list(*args, **kwargs):
+            release.wait(5)
+            return next(responses)
+
+        with patch('app.list_photos', side_effect=slow_list):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            response = auth_client.post(f'/sync_jobs/{job_id}/cancel')
+            assert response.status_code == 202
+            release.set()
+            job = _wait_for_job(job_id)
+        assert job['status'] == 'cancelled'
+        assert job['cancel_requested'] == 1
+
+    def test_cancel_finished_job_returns_409(self, auth_client):
+        with patch('app.list_photos', side_effect=_pages(['a'])):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            _wait_for_job(job_id)
+        assert auth_client.post(f'/sync_jobs/{job_id}/cancel').status_code == 409
+
+    def test_failed_listing_marks_job_failed(self, auth_client):
+        with patch('app.list_photos', side_effect=Exception('boom')), patch('app.time.sleep'):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            job = _wait_for_job(job_id)
+        assert job['status'] == 'failed'
+        assert job['error']
+
+    def test_failed_write_marks_job_failed(self, auth_client):
+        with patch('app.list_photos', side_effect=_pages(['a'])), \
+                patch.object(db_module, 'upsert_photos', side_effect=sqlite3.OperationalError('disk full')):
+            job_id = auth_client.post('/sync_jobs').get_json()['job_id']
+            job = _wait_for_job(job_id)
+        assert job['status'] == 'failed'
+        assert job['error'] == 'disk full'
+
+    def test_create_database_form_starts_job(self, auth_client):
+        with patch('app.list_photos', side_effect=_pages(['a'])):
+            response = auth_client.post('/create_database')
+            assert response.status_code == 302
+            job = db_module.get_sync_job()
+            assert job is not None
+            _wait_for_job(job['job_id'])
@@ -0,0 +1,601 @@
+"""
+Tests for the photo upload path in app.py:
+  - PatchedJpeg (XMP heading rewrite over a memory map)
+  - StreamingJpeg (the same rewrite over an incoming request stream)
+  - upload_photo() resumable protocol against a local fake upload endpoint
+  - Pass-through uploads (/upload/stream)
+  - Server-side batch upload queue (/upload_jobs)
+  - The upload ledger behind /check_upload_status and photo deletes
+  - Upload progress reporting (/upload/progress)
+"""
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import time
+import tracemalloc
+import pytest
+from unittest.mock import MagicMock, patch
+
+import app as app_module
+import database as db_module
+from app import APIError, FileOperationError, PatchedJpeg, StreamingJpeg, XMP_NAMESPACE
+
+
+XMP_PACKET = (b'<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+              b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description rdf:about="">'
+              b'</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>')
+
+
+def _segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _jpeg(packet=XMP_PACKET, scan=bytes(range(256)) * 4):
+    """SOI, JFIF APP0, optional XMP APP1, DQT, then scan data and EOI"""
+    segments = _segment(0xE0, b'JFIF\x00\x01\x01')
+    if packet is not None:
+        segments += _segment(0xE1, XMP_NAMESPACE + packet)
+    return b'\xff\xd8' + segments + _segment(0xDB, b'\x00' * 65) + b'\xff\xda' + scan + b'\xff\xd9'
+
+
+XMP_JPEG = _jpeg()
+
+
+class FakeResumableUpload:
+    """
+    Google-style resumable upload endpoint on a StubServer.
+
+    start returns a session URL; upload chunks must arrive at the offset the
+    session has acknowledged. fail maps a chunk number to '503' (error
+    response, nothing stored) or 'drop' (half the chunk stored, connection
+    closed without a response).
+    """
+
+    GRANULARITY = 8
+
+    def __init__(self, server, fail=None):
+        self.url = f'{server.url}/upload'
+        self.received = b''
+        self.final = False
+        self.chunks = 0
+        self.fail = dict(fail or {})
+        server.route('POST', '/upload', self._start)
+        server.route('POST', '/session', self._session)
+
+    def _headers(self):
+        return {'X-Goog-Upload-Status': 'final' if self.final else 'active',
+                'X-Goog-Upload-Size-Received': str(len(self.received))}
+
+    def _start(self, record):
+        assert record['headers']['X-Goog-Upload-Command'] == 'start'
+        self.expected = int(record['headers']['X-Goog-Upload-Header-Content-Length'])
+        return 200, {'X-Goog-Upload-URL': self.url.replace('/upload', '/session'),
+                     'X-Goog-Upload-Chunk-Granularity': str(self.GRANULARITY),
+                     'X-Goog-Upload-Status': 'active'}, b''
+
+    def _session(self, record):
+        command = record['headers']['X-Goog-Upload-Command']
+        if command == 'query':
+            return 200, self._headers(), b''
+        assert int(record['headers']['X-Goog-Upload-Offset']) == len(self.received)
+        self.chunks += 1
+        failure = self.fail.pop(self.chunks, None)
+        if failure == '503':
+            return 503, {}, b'{"error": {"message": "backend busy"}}'
+        if failure == 'drop':
+            half = len(record['body']) // 2 // self.GRANULARITY * self.GRANULARITY
+            self.received += record['body'][:half]
+            return None
+        self.received += record['body']
+        if command == 'upload, finalize':
+            self.final = True
+            assert len(self.received) == self.expected
+            return 200, {'Content-Type': 'application/json', **self._headers()}, json.dumps({'ok': True})
+        return 200, self._headers(), b''
+
+
+@pytest.fixture()
+def jpeg_file(tmp_path):
+    path = tmp_path / 'pano.jpg'
+    path.write_bytes(XMP_JPEG)
+    return str(path)
+
+
+@pytest.fixture()
+def small_chunks():
+    with patch.object(app_module.api_client, 'upload_chunk_size', 100), \
+            patch('app.time.sleep') as sleep:
+        yield sleep
+
+
+def _patched_bytes(jpeg_file, heading):
+    """The upload body: the photo with its heading written into the XMP packet"""
+    with PatchedJpeg(jpeg_file, heading) as photo:
+        return photo.read_range(0, len(photo))
+
+
+# ---------------------------------------------------------------------------
+# PatchedJpeg
+# ---------------------------------------------------------------------------
+
+class TestPatchedJpeg:
+    def _patched(self, tmp_path, data, heading=90):
+        path = tmp_path / 'p.jpg'
+        path.write_bytes(data)
+        return _patched_bytes(str(path), heading)
+
+    def _xmp(self, data):
+        segments = app_module._extract_xmp_segments(data)
+        assert len(segments) == 1
+        return segments[0][4 + len(XMP_NAMESPACE):]
+
+    def test_rewrites_xmp_segment_in_place(self, tmp_path):
+        patched = self._patched(tmp_path, XMP_JPEG)
+        packet = XMP_PACKET.replace(b'rdf:about="">', b'rdf:about=""><GPano:PoseHeadingDegrees>90.0'
+                                                      b'</GPano:PoseHeadingDegrees>')
+        assert patched == _jpeg(packet)
+        assert self._xmp(patched) == packet
+
+    def test_replaces_existing_heading(self, tmp_path):
+        original = _jpeg(XMP_PACKET.replace(b'</rdf:Description>', b'<GPano:PoseHeadingDegrees>12.5'
+                                                                    b'</GPano:PoseHeadingDegrees></rdf:Description>'))
+        patched = self._patched(tmp_path, original, heading='270')
+        assert b'>270.0</GPano:PoseHeadingDegrees>' in self._xmp(patched)
+        assert b'12.5' not in patched
+
+    def test_inserts_xmp_after_soi_when_missing(self, tmp_path):
+        original = _jpeg(packet=None)
+        patched = self._patched(tmp_path, original)
+        segment = app_module._extract_xmp_segments(patched)[0]
+        assert patched == b'\xff\xd8' + segment + original[2:]
+        assert b'<GPano:PoseHeadingDegrees>90.0</GPano:PoseHeadingDegrees>' in segment
+
+    def test_rejects_non_jpeg(self, tmp_path):
+        for data in (b'', b'GIF89a not a jpeg'):
+            path = tmp_path / 'bad.jpg'
+            path.write_bytes(data)
+            with pytest.raises(FileOperationError):
+                PatchedJpeg(str(path), 90)
+
+    def test_ranges_and_readers_span_parts(self, jpeg_file):
+        with PatchedJpeg(jpeg_file, 90) as photo:
+            whole = photo.read_range(0, len(photo))
+            for offset in range(0, len(photo), 37):
+                assert photo.read_range(offset, 53) == whole[offset:offset + 53]
+                reader = photo.open(offset, 300)
+                assert len(reader) == len(whole[offset:offset + 300])
+                assert b''.join(iter(lambda: reader.read(17), b'')) == whole[offset:offset + 300]
+
+    def test_streams_without_copying_the_file(self, tmp_path):
+        path = tmp_path / 'big.jpg'
+        path.write_bytes(_jpeg(scan=b'\x5a' * (8 * 1024 * 1024)))
+        tracemalloc.start()
+        try:
+            with PatchedJpeg(str(path), 90) as photo:
+                reader = photo.open()
+                while reader.read(8192):
+                    pass
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < 64 * 1024
+
+
+# ---------------------------------------------------------------------------
+# upload_photo
+# ---------------------------------------------------------------------------
+
+class TestResumableUpload:
+    def test_uploads_in_chunks(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server)
+        result = app_module.upload_photo('tok', {'uploadUrl': fake.url}, jpeg_file, 90, 'up-1')
+        assert result == {'ok': True}
+        assert fake.received == _patched_bytes(jpeg_file, 90)
+        assert b'<GPano:PoseHeadingDegrees>90.0</GPano:PoseHeadingDegrees>' in fake.received
+        # 100-byte chunks rounded down to the 8-byte granularity
+        bodies = [r['body'] for r in stub_server.requests if r['path'] == '/session']
+        assert {len(body) for body in bodies[:-1]} == {96}
+        assert all(r['headers']['Authorization'] == 'Bearer tok' for r in stub_server.requests)
+
+        progress = app_module.get_upload_progress('up-1')
+        assert progress['status'] == 'uploaded'
+        assert progress['bytes_sent'] == progress['total_bytes'] == len(fake.received)
+        assert progress['chunks_sent'] == progress['chunks_total'] == len(bodies)
+
+    def test_resumes_from_acknowledged_offset(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server, fail={2: '503', 5: 'drop'})
+        app_module.upload_photo('tok', {'uploadUrl': fake.url}, jpeg_file, 90, 'up-2')
+        assert fake.received == _patched_bytes(jpeg_file, 90)
+        commands = [r['headers']['X-Goog-Upload-Command'] for r in stub_server.requests]
+        assert commands.count('query') == 2
+        assert app_module.get_upload_progress('up-2')['retries'] == 2
+        assert [call.args[0] for call in small_chunks.call_args_list] == [1, 1]
+
+    def test_every_request_takes_a_rate_limit_slot(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server, fail={2: '503'})
+        limiter = MagicMock()
+        app_module.upload_photo('tok', {'uploadUrl': fake.url}, jpeg_file, 90, rate_limiter=limiter)
+        # start, every chunk attempt and the resume query
+        assert limiter.acquire.call_count == len(stub_server.requests)
+
+    def test_gives_up_after_max_retries(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server, fail={n: '503' for n in range(1, 10)})
+        with patch.object(app_module.api_client, 'upload_max_retries', 2):
+            with pytest.raises(APIError):
+                app_module.upload_photo('tok', {'uploadUrl': fake.url}, jpeg_file, 90, 'up-3')
+        assert fake.chunks == 3
+        assert app_module.get_upload_progress('up-3')['status'] == 'failed'
+        assert [call.args[0] for call in small_chunks.call_args_list] == [1, 2]
+
+    def test_client_error_is_not_retried(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server)
+        stub_server.route('POST', '/session', lambda record: (400, {}, b'{"error": {"message": "bad"}}'))
+        with pytest.raises(APIError):
+            app_module.upload_photo('tok', {'uploadUrl': fake.url}, jpeg_file, 90)
+        assert not small_chunks.called
+
+    def test_finalized_session_found_on_resume(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server)
+        session = fake._session
+
+        def lose_final_response(record):
+            response = session(record)
+            return None if record['headers']['X-Goog-Upload-Command'] == 'upload, finalize' else response
+
+        stub_server.route('POST', '/session', lose_final_response)
+        app_module.upload_photo('tok', {'uploadUrl': fake.url}, jpeg_file, 90, 'up-4')
+        assert fake.final
+        assert app_module.get_upload_progress('up-4')['status'] == 'uploaded'
+
+
+# ---------------------------------------------------------------------------
+# StreamingJpeg / upload_photo_stream
+# ---------------------------------------------------------------------------
+
+class TrickleStream(io.BytesIO):
+    """A request stream that returns at most a few bytes per read, like a slow socket"""
+
+    def read(self, size=-1):
+        return super().read(7 if size is None or size < 0 else min(size, 7))
+
+
+def _drain(reader, size=41):
+    return b''.join(iter(lambda: reader.read(size), b''))
+
+
+class TestStreamingJpeg:
+    def _streamed(self, data, heading=90, stream_class=io.BytesIO):
+        photo = StreamingJpeg(stream_class(data), len(data), heading)
+        return _drain(photo.open(0, len(photo)))
+
+    def test_matches_patched_jpeg(self, tmp_path, jpeg_file):
+        original = _jpeg(packet=None)
+        path = tmp_path / 'bare.jpg'
+        path.write_bytes(original)
+        for data, source in ((XMP_JPEG, jpeg_file), (original, str(path))):
+            for stream_class in (io.BytesIO, TrickleStream):
+                assert self._streamed(data, stream_class=stream_class) == _patched_bytes(source, 90)
+
+    def test_rejects_non_jpeg_and_short_bodies(self):
+        for data in (b'GIF89a not a jpeg', XMP_JPEG[:20]):
+            with pytest.raises(FileOperationError):
+                StreamingJpeg(io.BytesIO(data), len(XMP_JPEG), 90)
+        photo = StreamingJpeg(TrickleStream(XMP_JPEG[:-100]), len(XMP_JPEG), 90)
+        with pytest.raises(FileOperationError):
+            _drain(photo.open())
+
+    def test_retains_only_the_current_chunk(self, tmp_path):
+        data = _jpeg(scan=b'\x5a' * (1024 * 1024))
+        path = tmp_path / 'big.jpg'
+        path.write_bytes(data)
+        expected = _patched_bytes(str(path), 90)
+        photo = StreamingJpeg(io.BytesIO(data), len(data), 90)
+        chunk = 256 * 1024
+        for offset in range(0, len(photo), chunk):
+            first = _drain(photo.open(offset, chunk), 8192)
+            assert first == expected[offset:offset + chunk]
+            # A resend after a partial acknowledgement serves the same bytes
+            assert _drain(photo.open(offset + 100, chunk - 100), 8192) == first[100:]
+            assert len(photo._buffer) <= chunk + app_module._STREAM_READ_SIZE
+        with pytest.raises(FileOperationError):
+            photo.open(0, 10)
+
+    def test_uploads_from_stream_with_resume(self, stub_server, jpeg_file, small_chunks):
+        fake = FakeResumableUpload(stub_server, fail={2: '503', 5: 'drop'})
+        result = app_module.upload_photo_stream('tok', {'uploadUrl': fake.url}, TrickleStream(XMP_JPEG),
+                                                len(XMP_JPEG), 90, 'stream-1')
+        assert result == {'ok': True}
+        assert fake.received == _patched_bytes(jpeg_file, 90)
+        progress = app_module.get_upload_progress('stream-1')
+        assert (progress['status'], progress['retries']) == ('uploaded', 2)
+
+    def test_truncated_stream_fails_without_retrying(self, stub_server, small_chunks):
+        fake = FakeResumableUpload(stub_server)
+        with pytest.raises(FileOperationError):
+            app_module.upload_photo_stream('tok', {'uploadUrl': fake.url}, io.BytesIO(XMP_JPEG[:500]),
+                                           len(XMP_JPEG), 90, 'stream-2')
+        assert app_module.get_upload_progress('stream-2')['status'] == 'failed'
+        assert not small_chunks.called
+
+
+class TestUploadStreamRoute:
+    URL = '/upload/stream?filename=pano.jpg&latitude=51.5&longitude=-0.12&heading=90&uploadId=route-s1'
+
+    @pytest.fixture()
+    def google(self, stub_server, small_chunks, tmp_path):
+        fake = FakeResumableUpload(stub_server)
+        app_module.config['uploads']['directory'] = str(tmp_path / 'uploads')
+        with patch('app.start_upload', return_value={'uploadUrl': fake.url}), \
+                patch('app.create_photo', return_value={'photoId': {'id': 'streamed'}}) as create:
+            yield fake, create
+
+    def test_streams_body_to_google(self, auth_client, google, jpeg_file, tmp_path):
+        fake, create = google
+        response = auth_client.post(self.URL, data=XMP_JPEG, content_type='image/jpeg')
+        assert response.status_code == 200
+        assert response.get_json() == {'photoId': {'id': 'streamed'}}
+        assert fake.received == _patched_bytes(jpeg_file, 90)
+        assert create.call_args.args[2:4] == (51.5, -0.12)
+        assert app_module.get_upload_progress('route-s1')['status'] == 'uploaded'
+        assert not (tmp_path / 'uploads' / 'pano.json').exists()
+        # The ledger hashes the original bytes, not the patched upload
+        upload = db_module.get_uploads_by_stems(['pano'])['pano']
+        assert (upload['photo_id'], upload['content_hash']) == ('streamed', hashlib.sha256(XMP_JPEG).hexdigest())
+
+    def test_multipart_upload_hashes_while_spooling(self, auth_client, google, tmp_path):
+        fake, create = google
+        form = {'file': (io.BytesIO(XMP_JPEG), 'pano.jpg'), 'latitude': '51.5', 'longitude': '-0.12',
+                'heading': '90', 'placeId': '', 'captureTime': ''}
+        response = auth_client.post('/upload', data=form, content_type='multipart/form-data',
+                                    headers={'X-Requested-With': 'XMLHttpRequest'})
+        assert response.status_code == 200, response.get_json()
+        upload = db_module.get_uploads_by_stems(['pano'])['pano']
+        assert (upload['photo_id'], upload['content_hash']) == ('streamed', hashlib.sha256(XMP_JPEG).hexdigest())
+
+    def test_rejects_bad_requests(self, auth_client, google):
+        fake, create = google
+        cases = [
+            (self.URL.replace('pano.jpg', 'pano.png'), XMP_JPEG, 400),
+            (self.URL.replace('latitude=51.5', 'latitude=95'), XMP_JPEG, 400),
+            (self.URL.replace('&heading=90', '&heading=x'), XMP_JPEG, 400),
+            (self.URL, b'', 411),
+            (self.URL, b'GIF89a not a jpeg', 400),
+        ]
+        for url, body, status in cases:
+            assert auth_client.post(url, data=body, content_type='image/jpeg').status_code == status, url
+        assert not create.called
+
+
+# ---------------------------------------------------------------------------
+# Upload queue (/upload_jobs)
+# ---------------------------------------------------------------------------
+
+class TestApiRateLimiter:
+    def test_bursts_then_spaces_calls(self):
+        with patch('app.time.sleep') as sleep:
+            limiter = app_module.ApiRateLimiter(60, burst=2)
+            waits = [limiter.acquire() for _ in range(4)]
+        assert waits[:2] == [0, 0]
+        assert waits[2] == pytest.approx(1, abs=0.05)
+        assert waits[3] == pytest.approx(2, abs=0.05)
+        assert sleep.call_count == 2
+
+    def test_one_limiter_per_account(self):
+        queue = app_module.UploadQueue(queue_workers=2, api_requests_per_minute=30)
+        alice = type('Creds', (), {'refresh_token': 'alice', 'token': 'a1'})()
+        alice_again = type('Creds', (), {'refresh_token': 'alice', 'token': 'a2'})()
+        bob = type('Creds', (), {'refresh_token': 'bob', 'token': 'b1'})()
+        assert queue.rate_limiter(alice) is queue.rate_limiter(alice_again)
+        assert queue.rate_limiter(alice) is not queue.rate_limiter(bob)
+        assert queue.rate_limiter(bob).interval == 2
+
+
+def _job_entry(name='pano.jpg', **overrides):
+    return {'filename': name, 'latitude': 51.5, 'longitude': -0.12, 'heading': 90,
+            'placeId': 'ChIJ', 'captureTime': '2024-05-01T10:00:00Z', **overrides}
+
+
+def _wait_for_upload_job(client, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/upload_jobs/{job_id}').get_json()['job']
+        if not job['active']:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"upload job {job_id} did not finish")
+
+
+class TestUploadJobRoutes:
+    @pytest.fixture()
+    def google(self, stub_server, small_chunks, tmp_path):
+        """Fake upload endpoint, with start_upload/create_photo patched and a fresh worker pool"""
+        fake = FakeResumableUpload(stub_server)
+        app_module.config['uploads']['directory'] = str(tmp_path / 'uploads')
+        queue = app_module.UploadQueue(queue_workers=3, api_requests_per_minute=6000)
+        created = iter(range(100))
+
+        def photo(token, upload_ref, latitude, longitude, place_id, capture_time, heading):
+            number = next(created)
+            return {'photoId': {'id': f'photo-{number}'}, 'shareLink': f'https://maps/{number}'}
+
+        with patch.object(app_module, 'upload_queue', queue), \
+                patch('app.start_upload', return_value={'uploadUrl': fake.url}), \
+                patch('app.create_photo', side_effect=photo) as create:
+            yield fake, create
+        queue.configure({})
+
+    def _create(self, client, entries):
+        response = client.post('/upload_jobs', json={'files': entries})
+        assert response.status_code == 202, response.get_json()
+        return response.get_json()
+
+    def test_uploads_handed_over_files(self, auth_client, google, jpeg_file, tmp_path):
+        fake, create = google
+        job = self._create(auth_client, [_job_entry()])
+        assert auth_client.put(job['upload_urls'][0], data=XMP_JPEG).status_code == 202
+        status = _wait_for_upload_job(auth_client, job['job_id'])
+        job_file = status['files'][0]
+        assert (job_file['status'], job_file['photo_id'], job_file['share_link']) == \
+            ('done', 'photo-0', 'https://maps/0')
+        assert (job_file['attempts'], job_file['size']) == (1, len(XMP_JPEG))
+        assert fake.received == _patched_bytes(jpeg_file, 90)
+        assert create.call_args.args[2:] == (51.5, -0.12, 'ChIJ', '2024-05-01T10:00:00Z', 90.0)
+        assert os.listdir(tmp_path / 'uploads') == []
+        upload = db_module.get_uploads_by_stems(['pano'])['pano']
+        assert (upload['photo_id'], upload['content_hash']) == ('photo-0', hashlib.sha256(XMP_JPEG).hexdigest())
+
+    def test_workers_run_concurrently(self, auth_client, google):
+        barrier = threading.Barrier(3, timeout=5)
+        names = []
+        limiters = []
+
+        def upload(token, upload_ref, file_path, heading, upload_id=None, rate_limiter=None):
+            names.append(file_path)
+            limiters.append(rate_limiter)
+            barrier.wait()
+
+        job = self._create(auth_client, [_job_entry(f'p{i}.jpg') for i in range(3)])
+        with patch('app.upload_photo', side_effect=upload):
+            for url in job['upload_urls']:
+                assert auth_client.put(url, data=XMP_JPEG).status_code == 202
+            status = _wait_for_upload_job(auth_client, job['job_id'])
+        assert status['counts'] == {'done': 3}
+        # Every handover is spooled to its own file, and the spools are removed
+        assert len(set(names)) == 3
+        assert not any(os.path.exists(name) for name in names)
+        # Chunk requests share the account's API rate limit
+        assert all(isinstance(limiter, app_module.ApiRateLimiter) for limiter in limiters)
+        assert len(set(map(id, limiters))) == 1
+
+    def test_failed_file_can_be_handed_over_again(self, auth_client, google):
+        job = self._create(auth_client, [_job_entry(), _job_entry()])
+        with patch('app.upload_photo', side_effect=APIError('backend down')):
+            auth_client.put(job['upload_urls'][0], data=XMP_JPEG)
+            _wait_for_upload_job(auth_client, job['job_id'])
+        status = auth_client.get(job['status_url']).get_json()['job']
+        assert status['files'][0]['error'] == 'backend down'
+        assert status['counts'] == {'failed': 1, 'waiting': 1}
+
+        # One at a time: the fake endpoint serves a single upload session
+        for url in job['upload_urls']:
+            assert auth_client.put(url, data=XMP_JPEG).status_code == 202
+            status = _wait_for_upload_job(auth_client, job['job_id'])
+        assert status['counts'] == {'done': 2}
+        assert status['files'][0]['attempts'] == 2
+
+    def test_rejects_bad_handovers(self, auth_client, google):
+        job = self._create(auth_client, [_job_entry()])
+        job_id = job['job_id']
+        assert auth_client.put(f'/upload_jobs/{job_id}/files/0', data=b'').status_code == 411
+        assert auth_client.put(f'/upload_jobs/{job_id}/files/1', data=XMP_JPEG).status_code == 404
+        assert auth_client.put('/upload_jobs/nope/files/0', data=XMP_JPEG).status_code == 404
+        with patch('app.upload_photo', side_effect=lambda *args: time.sleep(0.2)):
+            assert auth_client.put(job['upload_urls'][0], data=XMP_JPEG).status_code == 202
+            assert auth_client.put(job['upload_urls'][0], data=XMP_JPEG).status_code == 409
+            _wait_for_upload_job(auth_client, job_id)
+
+    def test_rejects_bad_metadata(self, auth_client):
+        for body in ({}, {'files': []}, {'files': ['x']}, {'files': [_job_entry('pano.png')]},
+                     {'files': [_job_entry(latitude=95)]}, {'files': [_job_entry(heading=400)]},
+                     {'files': [_job_entry(longitude=None)]}):
+            assert auth_client.post('/upload_jobs', json=body).status_code == 400, body
+
+    def test_status_and_latest(self, auth_client, google):
+        job = self._create(auth_client, [_job_entry()])
+        data = auth_client.get(job['status_url']).get_json()['job']
+        assert (data['job_id'], data['active'], data['counts']) == (job['job_id'], False, {'waiting': 1})
+        assert auth_client.get('/upload_jobs/latest').get_json()['job']['job_id'] == job['job_id']
+        assert auth_client.get('/upload_jobs/nope').status_code == 404
+
+    def test_status_reports_chunk_progress(self, auth_client, google):
+        job = self._create(auth_client, [_job_entry()])
+        db_module.update_upload_job_file(job['job_id'], 0, status='uploading', size=len(XMP_JPEG))
+        app_module.record_upload_progress(f"{job['job_id']}-0", status='retrying', total_bytes=4000,
+                                          bytes_sent=1000, chunks_sent=1, chunks_total=4)
+        job_file = auth_client.get(job['status_url']).get_json()['job']['files'][0]
+        assert (job_file['bytes_sent'], job_file['total_bytes']) == (1000, 4000)
+        assert (job_file['chunks_sent'], job_file['chunks_total'], job_file['retrying']) == (1, 4, True)
+
+    def test_interrupted_files_are_reported(self, auth_client, google):
+        job = self._create(auth_client, [_job_entry()])
+        db_module.update_upload_job_file(job['job_id'], 0, status='uploading')
+        db_module.mark_interrupted_upload_jobs()
+        status = auth_client.get(job['status_url']).get_json()['job']
+        assert status['counts'] == {'interrupted': 1}
+
+
+# ---------------------------------------------------------------------------
+# Upload ledger
+# ---------------------------------------------------------------------------
+
+def _created(photo_id, status='PUBLISHED'):
+    return {'photoId': {'id': photo_id}, 'mapsPublishStatus': status,
+            'shareLink': f'https://maps/{photo_id}', 'uploadTime': '2024-05-01T10:00:00Z'}
+
+
+class TestUploadLedgerRoutes:
+    def test_check_upload_status(self, auth_client):
+        app_module.save_upload_record('pano.jpg', _created('p1'), 'h1')
+        app_module.save_upload_record('walk.jpg', _created('w1', 'PENDING'))
+        data = auth_client.post('/check_upload_status',
+                                json={'filenames': ['pano.jpg', 'walk.jpg', 'new.jpg']}).get_json()
+        assert data['pano.jpg'] == {'uploaded': True, 'status': 'PUBLISHED', 'photoId': 'p1',
+                                    'shareLink': 'https://maps/p1', 'uploadTime': '2024-05-01T10:00:00Z',
+                                    'jsonFile': ''}
+        assert (data['walk.jpg']['uploaded'], data['walk.jpg']['status']) == (True, 'PENDING')
+        assert data['new.jpg'] == {'uploaded': False}
+        assert auth_client.post('/check_upload_status', json={'filenames': []}).status_code == 400
+
+    def test_delete_photo_cleans_ledger(self, auth_client):
+        # A JSON record written by an older version, imported into the ledger
+        record = os.path.join(app_module.config['uploads']['directory'], 'pano.json')
+        with open(record, 'w') as f:
+            json.dump(_created('p1'), f)
+        db_module.migrate_upload_records(app_module.config['uploads']['directory'])
+        with patch.object(app_module.api_client, 'delete', return_value=MagicMock(status_code=200)):
+            auth_client.post('/delete_photo', data={'photo_id': 'p1'})
+        assert db_module.get_uploads_by_stems(['pano']) == {}
+        assert not os.path.exists(record)
+
+    def test_bulk_delete_cleans_only_deleted_photos(self, auth_client):
+        for name in ('a', 'b'):
+            app_module.save_upload_record(f'{name}.jpg', _created(name))
+        api_response = MagicMock(status_code=200)
+        api_response.json.return_value = {'status': [{'code': 0}, {'code': 5, 'message': 'not found'}]}
+        with patch.object(app_module.api_client, 'post', return_value=api_response):
+            data = auth_client.post('/delete_photos_bulk', json={'photo_ids': ['a', 'b']}).get_json()
+        assert data['deleted'] == ['a']
+        assert set(db_module.get_uploads_by_stems(['a', 'b'])) == {'b'}
+
+    def test_first_record_creates_ledger_and_imports_old_records(self, app_instance, tmp_path, monkeypatch):
+        monkeypatch.setattr(db_module, 'DATABASE_PATH', str(tmp_path / 'fresh' / 'photos.db'))
+        uploads_dir = app_module.config['uploads']['directory']
+        with open(os.path.join(uploads_dir, 'old.json'), 'w') as f:
+            json.dump(_created('o1'), f)
+        app_module.save_upload_record('new.jpg', _created('n1'), 'h1')
+        uploads = db_module.get_uploads_by_stems(['old', 'new'])
+        assert (uploads['old']['photo_id'], uploads['new']['photo_id']) == ('o1', 'n1')
+        assert app_module.get_upload_filenames(['o1', 'n1']) == {'o1': 'old.json', 'n1': 'new.jpg'}
+
+
+# ---------------------------------------------------------------------------
+# /upload/progress
+# ---------------------------------------------------------------------------
+
+class TestUploadProgressRoute:
+    def test_reports_recorded_progress(self, auth_client):
+        app_module.record_upload_progress('route-1', status='uploading', bytes_sent=10, total_bytes=40)
+        data = auth_client.get('/upload/progress/route-1').get_json()
+        assert (data['status'], data['bytes_sent'], data['total_bytes']) == ('uploading', 10, 40)
+
+    def test_unknown_upload_is_404(self, auth_client):
+        assert auth_client.get('/upload/progress/missing').status_code == 404
+
+    def test_old_entries_are_dropped(self):
+        for i in range(app_module._UPLOAD_PROGRESS_KEEP + 5):
+            app_module.record_upload_progress(f'bulk-{i}', status='uploading')
+        assert app_module.get_upload_progress('bulk-0') is None
+        assert app_module.get_upload_progress(f'bulk-{app_module._UPLOAD_PROGRESS_KEEP + 4}') is not None
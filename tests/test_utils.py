@@ -6,7 +6,13 @@ Tests for pure utility/helper functions in app.py:
   - validate_heading()
   - format_capture_time()
   - APP_VERSION constant
+  - APIClient (shared keep-alive HTTP client)
+  - get_credentials() / save_credentials() under concurrent refresh
 """
+import json
+import os
+import threading
+import time
 import pytest
 from unittest.mock import patch
 
@@ -21,6 +27,7 @@ from app import (
     format_capture_time,
     APP_VERSION,
     ValidationError,
+    APIClient,
 )
 
 
@@ -200,3 +207,160 @@ class TestAppVersion:
         parts = APP_VERSION.split('.')
         assert len(parts) == 3
         assert all(p.isdigit() for p in parts)
+
+
+# ---------------------------------------------------------------------------
+# APIClient
+# ---------------------------------------------------------------------------
+
+def _json_ok(record):
+    return 200, {'Content-Type': 'application/json'}, json.dumps({'ok': True})
+
+
+class TestAPIClient:
+    def test_reuses_connection_across_requests(self, stub_server):
+        stub_server.route('GET', '/v1/photos', _json_ok)
+        client = APIClient()
+        try:
+            for _ in range(5):
+                assert client.get(f'{stub_server.url}/v1/photos').status_code == 200
+        finally:
+            client.close()
+        ports = {r['client_port'] for r in stub_server.requests}
+        assert len(stub_server.requests) == 5
+        assert len(ports) == 1, "keep-alive connection should be reused"
+
+    def test_pool_sized_from_config(self):
+        client = APIClient()
+        client.configure({'pool_maxsize': 8, 'read_timeout': 12})
+        adapter = client.session.get_adapter('https://streetviewpublish.googleapis.com/')
+        assert adapter._pool_maxsize == 8
+        assert client.read_timeout == 12
+        client.close()
+
+    def test_default_timeouts_applied(self, stub_server):
+        stub_server.route('GET', '/t', _json_ok)
+        client = APIClient(connect_timeout=3, read_timeout=7)
+        with patch.object(client.session, 'request', wraps=client.session.request) as spy:
+            client.get(f'{stub_server.url}/t')
+            client.get(f'{stub_server.url}/t', timeout=99)
+        assert spy.call_args_list[0].kwargs['timeout'] == (3, 7)
+        assert spy.call_args_list[1].kwargs['timeout'] == (3, 99)
+        client.close()
+
+    def test_shared_across_threads(self, stub_server):
+        import threading
+        stub_server.route('GET', '/t', _json_ok)
+        client = APIClient(pool_maxsize=4)
+        statuses = []
+
+        def worker():
+            for _ in range(3):
+                statuses.append(client.get(f'{stub_server.url}/t').status_code)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        client.close()
+        assert statuses == [200] * 12
+        assert len({r['client_port'] for r in stub_server.requests}) <= 4
+
+    def test_list_photos_uses_shared_client(self):
+        response = MagicResponse({'photos': [], 'nextPageToken': None})
+        with patch.object(app_module.api_client, 'request', return_value=response) as req:
+            result = app_module.list_photos('tok', page_size=5)
+        assert result == {'photos': [], 'nextPageToken': None}
+        method, url = req.call_args.args
+        assert method == 'GET'
+        assert url.endswith('/v1/photos')
+        assert req.call_args.kwargs['headers']['Authorization'] == 'Bearer tok'
+
+
+class MagicResponse:
+    """Tiny stand-in for requests.Response used by handle_api_response()."""
+
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+# ---------------------------------------------------------------------------
+# get_credentials / save_credentials
+# ---------------------------------------------------------------------------
+
+class TestCredentialsRefresh:
+    def _write_expired(self, path):
+        path.write_text(json.dumps({
+            'token': 'stale-token',
+            'refresh_token': 'refresh-token',
+            'client_id': 'client-id',
+            'client_secret': 'client-secret',
+            'expiry': '2000-01-01T00:00:00Z',
+        }))
+
+    def test_concurrent_refresh_is_serialised(self, tmp_path, monkeypatch):
+        from datetime import datetime, timedelta
+        creds_file = tmp_path / 'creds.data'
+        self._write_expired(creds_file)
+        monkeypatch.setattr(app_module, 'CREDS_FILE', str(creds_file))
+        refreshes = []
+
+        def fake_refresh(self, request):
+            refreshes.append(threading.get_ident())
+            time.sleep(0.05)
+            self.token = 'fresh-token'
+            self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+        stop = threading.Event()
+        read_errors = []
+
+        def reader():
+            # Hammer the file while it is rewritten; it must always parse.
+            while not stop.is_set():
+                try:
+                    json.loads(creds_file.read_text())
+                except ValueError as e:
+                    read_errors.append(e)
+
+        results = []
+        with patch('app.Credentials.refresh', fake_refresh):
+            reader_thread = threading.Thread(target=reader)
+            reader_thread.start()
+            threads = [threading.Thread(target=lambda: results.append(app_module.get_credentials()))
+                       for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            stop.set()
+            reader_thread.join()
+
+        assert len(refreshes) == 1
+        assert len(results) == 6
+        assert all(c is not None and c.token == 'fresh-token' for c in results)
+        assert read_errors == []
+        assert json.loads(creds_file.read_text())['token'] == 'fresh-token'
+
+    def test_save_is_atomic_and_private(self, tmp_path, monkeypatch):
+        creds_file = tmp_path / 'creds.data'
+        self._write_expired(creds_file)
+        monkeypatch.setattr(app_module, 'CREDS_FILE', str(creds_file))
+        creds = app_module.Credentials.from_authorized_user_file(str(creds_file))
+        with patch('app.os.replace', side_effect=OSError('disk full')):
+            with pytest.raises(OSError):
+                app_module.save_credentials(creds)
+        assert json.loads(creds_file.read_text())['token'] == 'stale-token'
+        assert os.listdir(tmp_path) == ['creds.data']
+
+        app_module.save_credentials(creds)
+        assert os.stat(creds_file).st_mode & 0o777 == 0o600
+        assert os.listdir(tmp_path) == ['creds.data']